@@ -17,7 +17,9 @@ from exceptions import FSQError, FSQEnvError, FSQEncodeError,\
                        FSQWorkItemError, FSQTTLExpiredError,\
                        FSQMaxTriesError, FSQScanError, FSQDownError,\
                        FSQDoneError, FSQFailError, FSQTriggerPullError,\
-                       FSQHostsError, FSQReenqueueError, FSQPushError
+                       FSQHostsError, FSQReenqueueError, FSQPushError,\
+                       FSQWatchError, FSQCodecError, FSQBlobError,\
+                       FSQClaimError, FSQDelayError
 
 # constants relies on: exceptions, internal
 import constants
@@ -45,18 +47,41 @@ from encode import encode, decode # has tests
 # construct relies on: constants, exceptions, encode, internal
 from construct import construct, deconstruct # has tests
 
-# done relies on: constants, exceptions, path, internal, mkitem
+# durability relies on: constants, exceptions, internal
+from durability import sync
+
+# codec relies on: constants, exceptions, path, internal
+from codec import register_codec, set_codec, get_codec
+
+# blobs relies on: constants, exceptions, path, internal
+from blobs import gc_blobs
+
+# claimed relies on: constants, exceptions, path, internal, durability, blobs
+from claimed import worker_name, worker_is_alive, reap
+
+# delay relies on: constants, exceptions, path, internal, durability, blobs
+from delay import promote, next_due
+
+# done relies on: constants, exceptions, path, internal, mkitem, durability,
+#                 delay
 from done import done, success, fail, fail_tmp, fail_perm
 
-# items relies on: exceptions, constants, path, construct, internal
+# items relies on: exceptions, constants, path, construct, internal, codec,
+#                  claimed
 from items import FSQWorkItem
 
-# enqueue relies on: constants, exceptions, path, internal, mkitem
-from enqueue import enqueue, senqueue, venqueue, vsenqueue, reenqueue,\
-                    sreenqueue, vreenqueue, vsreenqueue
+# enqueue relies on: constants, exceptions, path, internal, mkitem,
+#                    durability, codec, blobs, delay
+from enqueue import enqueue, senqueue, venqueue, vsenqueue, venqueue_many,\
+                    vsenqueue_many, reenqueue, sreenqueue, vreenqueue,\
+                    vsreenqueue, FSQEnqueueItem
+
+# watch relies on: exceptions, constants, path, internal
+from watch import FSQTriggerWatcher, FSQInotifyWatcher
 
-# scan relies on: exceptions, constants, path, items, configure, internal
-from scan import FSQScanGenerator, scan
+# scan relies on: exceptions, constants, path, items, configure, internal,
+#                 watch, claimed
+from scan import FSQScanGenerator, scan, claim, sweep
 
 # remote.v1 relies on: enqueue
 import remote
@@ -64,8 +89,14 @@ import remote
 # push relies on: exceptions, constants and items
 from push import push
 
-# utility relies on: exceptions, scan, enqueue and done
-from utility import fork_exec_items
+# utility relies on: exceptions, scan, enqueue, done and watch
+from utility import fork_exec_items, exec_items, scand
+
+# work relies on: exceptions, constants, scan, items and utility
+from work import work
+
+# aio relies on: constants, path, lists, enqueue, items, scan and watch
+import aio
 
 
 __all__ = [ 'FSQError', 'FSQEnvError', 'FSQEncodeError', 'FSQTimeFmtError',
@@ -84,4 +115,11 @@ __all__ = [ 'FSQError', 'FSQEnvError', 'FSQEncodeError', 'FSQTimeFmtError',
             'host_untrigger', 'host_trigger_pull', 'host_root',
             'uninstall_host', 'FSQReenqueueError', 'reenqueue', 'sreenqueue',
             'vreenqueue', 'vsreenqueue', 'remote', 'FSQPushError', 'push',
-            'queues', 'fork_exec_items', ]
+            'queues', 'fork_exec_items', 'exec_items', 'work',
+            'FSQWatchError', 'FSQTriggerWatcher', 'FSQInotifyWatcher',
+            'scand', 'sync',
+            'venqueue_many', 'vsenqueue_many', 'FSQEnqueueItem', 'aio',
+            'FSQCodecError', 'register_codec', 'set_codec', 'get_codec',
+            'FSQBlobError', 'gc_blobs', 'claim', 'FSQClaimError',
+            'worker_name', 'worker_is_alive', 'reap', 'sweep',
+            'FSQDelayError', 'promote', 'next_due', ]
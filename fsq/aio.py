@@ -0,0 +1,339 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/aio.py -- provides asynchronous enqueue, scan and completion, for
+#               producers and consumers driven by an event loop: executor,
+#               aenqueue, asenqueue, ascan, FSQAioWorkItem, FSQAioScanner
+#
+#   python 2 has no asyncio, so each asynchronous call is run in a bounded
+#   pool of FSQ_AIO_THREADS threads (see: executor), and returns an
+#   AsyncResult (see: multiprocessing.pool), which may be polled (ready),
+#   waited on (get), or passed a callback.
+#
+#   ascan calls back for each item in a queue, as it is enqueued.  All
+#   queues being scanned in a process are waited on by a single thread, with
+#   inotify(7) if available, else with triggers, and are rescanned every
+#   rescan seconds regardless; a pool thread is busy with a queue only while
+#   it is being listed, so that one process may scan many queues.
+#
+#     fsq is all unicode internally, if you pass in strings,
+#     they will be explicitly coerced to unicode.
+#
+# This software is for POSIX compliant systems only.
+import os
+import errno
+import fcntl
+import select
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from . import constants as _c, path as fsq_path, hosts as fsq_hosts,\
+              enqueue, senqueue, scan, FSQWorkItem, FSQScanGenerator,\
+              FSQInotifyWatcher, FSQTriggerWatcher, FSQWatchError,\
+              FSQDownError, FSQScanError
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+# ( pid, ThreadPool, ) for this process, see: executor
+_EXECUTOR = None
+# the _Waiter for this process, see: _waiter
+_WAITER = None
+_START_LOCK = threading.Lock()
+
+def _apply(fn, args, kwargs):
+    '''Run fn in the executor, passing a callback kwarg to apply_async'''
+    callback = kwargs.pop('callback', None)
+    return executor().apply_async(fn, args, kwargs, callback=callback)
+
+class _Waiter(object):
+    '''Waits on every queue being scanned in this process, from one thread,
+       and starts a scan of each queue (in the executor) as it changes, or as
+       its rescan comes due.
+
+       Queues are watched with a single inotify(7) instance, should it be
+       available; else with a trigger watcher per queue.'''
+    def __init__(self):
+        self.lock = threading.Lock()
+        # path -> set of scanners, for inotify
+        self.paths = {}
+        # fd -> scanner, and trigger watchers to (un)register and close, for
+        #  triggers, only ever touched by the waiter thread
+        self.fds = {}
+        self.register = []
+        self.unregister = []
+        # scanner -> time of next rescan, for waiting scanners
+        self.deadlines = {}
+        self.poller = select.poll()
+        self.rfd, self.wfd = os.pipe()
+        for fd in ( self.rfd, self.wfd, ):
+            fcntl.fcntl(fd, fcntl.F_SETFL,
+                        fcntl.fcntl(fd, fcntl.F_GETFL)|os.O_NONBLOCK)
+        self.poller.register(self.rfd, select.POLLIN)
+        try:
+            self.inotify = FSQInotifyWatcher()
+            self.poller.register(self.inotify.fileno(), select.POLLIN)
+        except FSQWatchError:
+            self.inotify = None
+        thread = threading.Thread(target=self.run)
+        thread.daemon = True
+        thread.start()
+
+    def wake(self):
+        '''Interrupt poll, to pick up new deadlines and triggers'''
+        try:
+            os.write(self.wfd, '\0')
+        except (OSError, IOError, ), e:
+            if e.errno not in ( errno.EAGAIN, errno.EWOULDBLOCK, ):
+                raise e
+
+    def watch(self, scanner):
+        '''Watch each directory scanned by scanner, before it is first
+           listed, so that nothing is enqueued between the two unseen'''
+        if self.inotify is not None:
+            try:
+                with self.lock:
+                    for path in scanner.paths():
+                        self.inotify.add(path, path)
+                        self.paths.setdefault(path, set()).add(scanner)
+                return
+            except FSQWatchError:
+                # e.g. out of watches; use the trigger for this scanner
+                self.forget(scanner)
+        watcher = FSQTriggerWatcher(scanner.queue, trigger=scanner.trigger)
+        if watcher.fileno() is None:
+            watcher.close()
+            return
+        with self.lock:
+            scanner.watcher = watcher
+            self.register.append(( watcher, scanner, ))
+        self.wake()
+
+    def forget(self, scanner):
+        '''Stop waiting on scanner'''
+        with self.lock:
+            for scanners in self.paths.itervalues():
+                scanners.discard(scanner)
+            self.deadlines.pop(scanner, None)
+            watcher, scanner.watcher = scanner.watcher, None
+            if watcher is not None:
+                self.unregister.append(watcher)
+        self.wake()
+
+    def wait(self, scanner, rescan):
+        '''Wait for scanner's queue to change, or for rescan seconds; should
+           it have changed while it was being scanned, scan it again now'''
+        with self.lock:
+            if scanner.closed:
+                return
+            elif scanner.dirty:
+                scanner.start()
+                return
+            self.deadlines[scanner] = None if rescan is None else\
+                                          time.time() + rescan
+        self.wake()
+
+    def _changed(self, scanners):
+        '''Scan each of scanners now, or once more should it be scanning,
+           with self.lock held'''
+        for scanner in scanners:
+            if self.deadlines.pop(scanner, False) is not False:
+                scanner.start()
+            else:
+                scanner.dirty = True
+
+    def run(self):
+        while True:
+            with self.lock:
+                for watcher, scanner in self.register:
+                    self.fds[watcher.fileno()] = scanner
+                    self.poller.register(watcher.fileno(), select.POLLIN)
+                for watcher in self.unregister:
+                    if self.fds.pop(watcher.fileno(), None) is not None:
+                        self.poller.unregister(watcher.fileno())
+                    watcher.close()
+                self.register, self.unregister = [], []
+                now = time.time()
+                due = [ s for s, at in self.deadlines.iteritems()\
+                        if at is not None and at <= now ]
+                self._changed(due)
+                pending = [ at for at in self.deadlines.itervalues()\
+                            if at is not None ]
+            timeout = None if not pending else\
+                          max(0, int((min(pending) - now)*1000) + 1)
+            try:
+                events = self.poller.poll(timeout)
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise e
+                continue
+            changed = set()
+            for fd, event in events:
+                if fd == self.rfd:
+                    try:
+                        while os.read(self.rfd, 4096):
+                            pass
+                    except (OSError, IOError, ), e:
+                        if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK,):
+                            raise e
+                elif self.inotify is not None and fd == self.inotify.fileno():
+                    new, lost = self.inotify.read()
+                    with self.lock:
+                        if lost:
+                            paths = self.paths.keys()
+                        else:
+                            paths = set(path for path, name in new)
+                        for path in paths:
+                            changed.update(self.paths.get(path, ()))
+                else:
+                    with self.lock:
+                        scanner = self.fds.get(fd)
+                    if scanner is not None and scanner.watcher is not None:
+                        scanner.watcher.drain()
+                        changed.add(scanner)
+            if changed:
+                with self.lock:
+                    self._changed(changed)
+
+def _waiter():
+    '''The _Waiter for this process, started on first use, or following a
+       fork'''
+    global _WAITER
+    with _START_LOCK:
+        if _WAITER is None or _WAITER[0] != os.getpid():
+            _WAITER = ( os.getpid(), _Waiter(), )
+        return _WAITER[1]
+
+####### EXPOSED METHODS AND CLASSES #######
+def executor():
+    '''The pool of FSQ_AIO_THREADS threads in which file-system calls are
+       made for this process, started on first use, or following a fork'''
+    global _EXECUTOR
+    with _START_LOCK:
+        if _EXECUTOR is None or _EXECUTOR[0] != os.getpid():
+            _EXECUTOR = ( os.getpid(), ThreadPool(_c.FSQ_AIO_THREADS), )
+        return _EXECUTOR[1]
+
+def aenqueue(trg_queue, item_f, *args, **kwargs):
+    '''enqueue, in the executor; returns an AsyncResult for the item id.
+       A callback kwarg is called with the item id, on success.'''
+    return _apply(enqueue, ( trg_queue, item_f, ) + args, kwargs)
+
+def asenqueue(trg_queue, item_s, *args, **kwargs):
+    '''senqueue, in the executor; returns an AsyncResult for the item id.
+       A callback kwarg is called with the item id, on success.'''
+    return _apply(senqueue, ( trg_queue, item_s, ) + args, kwargs)
+
+class FSQAioWorkItem(FSQWorkItem):
+    '''An FSQWorkItem which may be completed (and renewed) in the executor,
+       each of adone, asuccess, afail, afail_tmp, afail_perm and arenew
+       returns an AsyncResult, and takes a callback kwarg, called on
+       success.'''
+    __slots__ = ()
+
+    def adone(self, *args, **kwargs):
+        return _apply(self.done, args, kwargs)
+
+    def asuccess(self, **kwargs):
+        return _apply(self.success, (), kwargs)
+
+    def afail(self, *args, **kwargs):
+        return _apply(self.fail, args, kwargs)
+
+    def afail_tmp(self, **kwargs):
+        return _apply(self.fail_tmp, (), kwargs)
+
+    def afail_perm(self, **kwargs):
+        return _apply(self.fail_perm, (), kwargs)
+
+    def arenew(self, *args, **kwargs):
+        return _apply(self.renew, args, kwargs)
+
+class FSQAioScanGenerator(FSQScanGenerator):
+    '''An FSQScanGenerator of FSQAioWorkItems'''
+    work_item = FSQAioWorkItem
+
+class FSQAioScanner(object):
+    '''An FSQAioScanner scans a queue in the executor, calling back with
+       each FSQAioWorkItem it locks, and waits for the queue to change (or
+       for rescan seconds, None is never) to scan it again.  Changes made
+       while a scan is in progress cause exactly one more scan.
+
+       Items are called back from the executor, one at a time per queue, so
+       the callback should hand the item off, rather than work on it; the
+       item remains locked until it is completed or closed, and is skipped
+       by subsequent scans until then.
+
+       Should the queue be down, it is waited on as if empty.  Should the
+       scan or the callback raise any other exception, the scanner is closed,
+       the exception is kept as the error attribute, and errback (if any) is
+       called with it.'''
+    ####### MAGICAL METHODS AND ATTRS #######
+    def __init__(self, queue, callback, errback=None, rescan=60, host=False,
+                 hosts=None, **kwargs):
+        self.queue = queue
+        self.callback = callback
+        self.errback = errback
+        self.rescan = rescan
+        self.host = host or hosts is not None
+        self.hosts = hosts
+        self.trigger = _c.FSQ_HOSTS_TRIGGER if self.host else _c.FSQ_TRIGGER
+        self.kwargs = kwargs
+        self.watcher = None
+        self.dirty = False
+        self.closed = False
+        self.error = None
+        # fail now, rather than in the executor, for no such queue
+        if not self.host and not os.path.isdir(fsq_path.queue(queue)):
+            raise FSQScanError(errno.ENOENT, u'no such queue:'\
+                               u' {0}'.format(queue))
+        self._waiter = _waiter()
+        self._waiter.watch(self)
+        self.start()
+
+    ####### EXPOSED METHODS AND ATTRS #######
+    def paths(self):
+        '''The directories scanned'''
+        if not self.host:
+            return [ fsq_path.queue(self.queue) ]
+        return [ fsq_path.queue(self.queue, trg_host) for trg_host in\
+                 (fsq_hosts(self.queue) if self.hosts is None else\
+                  self.hosts) ]
+
+    def start(self):
+        '''Scan the queue, in the executor'''
+        if not self.closed:
+            executor().apply_async(self.scan)
+
+    def scan(self):
+        '''Scan the queue once, calling back with each item, then wait'''
+        self.dirty = False
+        try:
+            try:
+                items = scan(self.queue, generator=FSQAioScanGenerator,
+                             host=self.host, hosts=self.hosts, **self.kwargs)
+                for item in items:
+                    if self.closed:
+                        break
+                    self.callback(item)
+                    del item
+            except FSQDownError:
+                pass
+        except Exception, e:
+            self.error = e
+            self.close()
+            if self.errback is not None:
+                self.errback(e)
+            return
+        self._waiter.wait(self, self.rescan)
+
+    def close(self):
+        '''Stop scanning the queue'''
+        self.closed = True
+        self._waiter.forget(self)
+
+def ascan(queue, callback, **kwargs):
+    '''Scan a queue, calling back with each FSQAioWorkItem, in the executor,
+       as it is enqueued, until closed; returns an FSQAioScanner (see:
+       FSQAioScanner for kwargs, any others are passed on to scan).'''
+    return FSQAioScanner(queue, callback, **kwargs)
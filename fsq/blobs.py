@@ -0,0 +1,114 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/blobs.py -- provides a content-addressed payload store, for
+#                 reenqueue fan-out: store_blob, gc_blobs
+#
+#   Payloads are stored once, under FSQ_ROOT/FSQ_BLOBS, named by the
+#   sha256 of their (stored) contents, and hard-linked into each queue they
+#   are reenqueued to.  The link count of a blob is its reference count: a
+#   blob with no links but its own is garbage, once the items which shared
+#   it have been removed from the queue, done and fail directories.
+#
+# WARNINGS:
+#  * items sharing a blob share an inode, and so share their lock (as
+#      items reenqueued with link=True do): while one is locked, the others
+#      are skipped by scans, until it is done.
+#  * blobs must be on the same file-system as the queues.
+#
+#     fsq is all unicode internally, if you pass in strings,
+#     they will be explicitly coerced to unicode.
+#
+# This software is for POSIX compliant systems only.
+import os
+import errno
+import hashlib
+import tempfile
+import time
+
+from . import constants as _c, path as fsq_path, FSQBlobError
+from .internal import wrap_io_os_err, _mkdir
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+# size of reads, while hashing
+_BUFSIZE = 1024*1024
+
+def _digest(fd):
+    '''sha256 hex digest of the contents of an open file'''
+    digest = hashlib.sha256()
+    os.lseek(fd, 0, os.SEEK_SET)
+    for buf in iter(lambda: os.read(fd, _BUFSIZE), ''):
+        digest.update(buf)
+    return digest.hexdigest().decode('ascii')
+
+####### EXPOSED METHODS #######
+def open_blob(mode=None):
+    '''Open a new, empty, file in the blob store's tmp directory, for
+       writing and reading; returns ( fd, path, )'''
+    mode = _c.FSQ_ITEM_MODE if mode is None else mode
+    try:
+        for trg_dir in ( fsq_path.blobs(), fsq_path.blob_tmp(), ):
+            _mkdir(trg_dir, _c.FSQ_QUEUE_MODE, _c.FSQ_QUEUE_USER,
+                   _c.FSQ_QUEUE_GROUP)
+        fd, path = tempfile.mkstemp(dir=fsq_path.blob_tmp())
+        try:
+            os.fchmod(fd, mode)
+        except Exception, e:
+            os.close(fd)
+            os.unlink(path)
+            raise e
+        return fd, path
+    except (OSError, IOError, ), e:
+        raise FSQBlobError(e.errno, wrap_io_os_err(e))
+
+def store_blob(fd, path):
+    '''Link a file written by way of open_blob into the blob store, named by
+       its digest, should it not be there already; returns the path of the
+       blob.  The file written remains, for the caller to unlink.'''
+    try:
+        digest = _digest(fd)
+        _mkdir(os.path.dirname(fsq_path.blob(digest)), _c.FSQ_QUEUE_MODE,
+               _c.FSQ_QUEUE_USER, _c.FSQ_QUEUE_GROUP)
+        blob_path = fsq_path.blob(digest)
+        try:
+            os.link(path, blob_path)
+        except (OSError, IOError, ), e:
+            if e.errno != errno.EEXIST:
+                raise e
+        return blob_path
+    except (OSError, IOError, ), e:
+        raise FSQBlobError(e.errno, wrap_io_os_err(e))
+
+def gc_blobs(grace=None):
+    '''Remove blobs no longer linked into any queue, and files abandoned in
+       the blob store's tmp directory, which have not changed in grace
+       seconds (default: FSQ_BLOBS_GRACE), so that blobs being stored are
+       never removed; returns the number of files removed.'''
+    grace = _c.FSQ_BLOBS_GRACE if grace is None else grace
+    horizon = time.time() - grace
+    removed = 0
+    try:
+        shards = os.listdir(fsq_path.blobs())
+    except (OSError, IOError, ), e:
+        if e.errno == errno.ENOENT:
+            return removed
+        raise FSQBlobError(e.errno, wrap_io_os_err(e))
+    for shard in shards:
+        shard_path = os.path.join(fsq_path.blobs(), shard)
+        try:
+            for name in os.listdir(shard_path):
+                path = os.path.join(shard_path, name)
+                try:
+                    st = os.stat(path)
+                    # a change of link count changes ctime
+                    if st.st_ctime < horizon and ( 1 == st.st_nlink or\
+                            shard == _c.FSQ_TMP ):
+                        os.unlink(path)
+                        removed += 1
+                except (OSError, IOError, ), e:
+                    if e.errno != errno.ENOENT:
+                        raise e
+        except (OSError, IOError, ), e:
+            if e.errno != errno.ENOENT:
+                raise FSQBlobError(e.errno, wrap_io_os_err(e))
+    return removed
@@ -0,0 +1,116 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/claimed.py -- provides claims by rename, an alternative to flock:
+#                   worker_name, claimed_dir, worker_is_alive, reap
+#
+#   With rename=True (or FSQ_RENAME), scan claims each work-item by renaming
+#   it from the queue into a claimed directory of its own (FSQ_CLAIMED/
+#   <worker>), rather than by holding flock on it.  rename is atomic, so
+#   exactly one worker wins each work-item; it is atomic on NFS; and scanners
+#   never open items claimed by others, as these are no longer listed in
+#   the queue.  Which worker holds what is visible with ls.
+#
+#   Work-items claimed by workers which have died are returned to the queue
+#   by reap, as if they had never been claimed (flock'ed work-items are
+#   released by the kernel when their holder dies).
+#
+#   Claims may also be leased (see: FSQ_LEASE), the expiry of the lease is
+#   kept as the mtime of the work-item, and is extended by the worker with
+#   FSQWorkItem.renew.  Work-items whose lease has expired, e.g. as their
+#   worker has wedged, are re-offered by sweep (see: fsq.scan), as if they
+#   had failed temporarily.
+#
+# WARNINGS:
+#  * the claimed directory must be on the same file-system as the queue.
+#  * a work-item remains claimed until it is done, its worker is reaped, or
+#      its lease expires and it is swept, whatever becomes of the process
+#      which claimed it.
+#  * work-items sharing an inode (see: reenqueue, FSQ_DEDUP) share their
+#      mtime, so a leased claim is given an inode of its own, a copy, as it
+#      is claimed.  A claim which comes to share its inode afterward (e.g.
+#      it is reenqueue'd with link=True) is not swept until it is renewed.
+#
+#     fsq is all unicode internally, if you pass in strings,
+#     they will be explicitly coerced to unicode.
+#
+# This software is for POSIX compliant systems only.
+import os
+import errno
+
+from . import constants as _c, path as fsq_path, FSQClaimError
+from .internal import coerce_unicode, wrap_io_os_err, _mkdir, _HOSTNAME
+from .durability import sync_dirs
+
+####### EXPOSED METHODS #######
+def worker_name():
+    '''The default name of this process, as a worker: host:pid'''
+    return u'{0}:{1}'.format(coerce_unicode(_HOSTNAME, _c.FSQ_CHARSET),
+                             os.getpid())
+
+def claimed_dir(queue, worker, host=None):
+    '''Make the claimed directory for worker, should it not exist; returns
+       its path'''
+    try:
+        for trg_dir in ( fsq_path.claimed(queue, host=host),
+                      fsq_path.claimed(queue, worker, host=host), ):
+            _mkdir(trg_dir, _c.FSQ_QUEUE_MODE, _c.FSQ_QUEUE_USER,
+                   _c.FSQ_QUEUE_GROUP)
+    except (OSError, IOError, ), e:
+        raise FSQClaimError(e.errno, wrap_io_os_err(e))
+    return fsq_path.claimed(queue, worker, host=host)
+
+def worker_is_alive(worker):
+    '''Whether a worker, named as worker_name names it, is alive.  Workers
+       on other hosts, and workers named otherwise, are assumed to be.'''
+    host, sep, pid = worker.rpartition(u':')
+    if not sep or not pid.isdigit() or\
+            host != coerce_unicode(_HOSTNAME, _c.FSQ_CHARSET):
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except OSError, e:
+        return e.errno != errno.ESRCH
+    return True
+
+def reap(queue, alive=None, host=None):
+    '''Return the work-items claimed by each dead worker to the queue, and
+       remove its claimed directory; returns the ids of the work-items
+       returned.  alive is called with each worker name, and returns whether
+       the worker is alive (default: worker_is_alive).'''
+    alive = worker_is_alive if alive is None else alive
+    reaped = []
+    try:
+        try:
+            workers = os.listdir(fsq_path.claimed(queue, host=host))
+        except (OSError, IOError, ), e:
+            if e.errno != errno.ENOENT:
+                raise e
+            return reaped
+        for worker in workers:
+            worker = coerce_unicode(worker, _c.FSQ_CHARSET)
+            if alive(worker):
+                continue
+            for item_id in os.listdir(fsq_path.claimed(queue, worker,
+                                                       host=host)):
+                item_id = coerce_unicode(item_id, _c.FSQ_CHARSET)
+                try:
+                    os.rename(fsq_path.item(queue, item_id, host=host,
+                                            worker=worker),
+                              fsq_path.item(queue, item_id, host=host))
+                    reaped.append(item_id)
+                except (OSError, IOError, ), e:
+                    if e.errno != errno.ENOENT:
+                        raise e
+            try:
+                os.rmdir(fsq_path.claimed(queue, worker, host=host))
+            except (OSError, IOError, ), e:
+                # claimed again, by a worker of the same name
+                if e.errno not in ( errno.ENOENT, errno.ENOTEMPTY,
+                                    errno.EEXIST, ):
+                    raise e
+        if reaped:
+            sync_dirs(fsq_path.queue(queue, host=host))
+    except (OSError, IOError, ), e:
+        raise FSQClaimError(e.errno, wrap_io_os_err(e))
+    return reaped
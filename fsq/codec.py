@@ -0,0 +1,348 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/codec.py -- provides payload compression for queues: register_codec,
+#                 set_codec, get_codec, open_item, copy_payload, feed,
+#                 FSQCodecReader, FSQCodecWriter
+#
+#   A queue with a codec file (FSQ_CODEC) naming a codec has the payload of
+#   each item enqueued to it compressed with that codec.  Compressed
+#   payloads begin with a header naming their codec, and are decompressed
+#   on the fly as they are read from a work-item, so that readers of a
+#   queue need no configuration.  Payloads already compressed are copied
+#   as stored (e.g. when reenqueued), whatever the codec of their target.
+#
+#   zlib and bz2 are provided, others may be registered.
+#
+#     fsq is all unicode internally, if you pass in strings,
+#     they will be explicitly coerced to unicode.
+#
+# This software is for POSIX compliant systems only.
+import os
+import sys
+import errno
+import signal
+import stat
+import zlib
+import bz2
+
+from . import constants as _c, path as fsq_path, FSQCodecError,\
+              FSQConfigError
+from .internal import copy_file, coerce_unicode, uid_gid, wrap_io_os_err,\
+                      _write
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+# header of a compressed payload: magic, codec name, newline
+_MAGIC = '\0fsq-codec:'
+_MAX_NAME = 32
+# size of reads, while compressing and decompressing
+_BUFSIZE = 64*1024
+# name -> ( compressor factory, decompressor factory, )
+_CODECS = {
+    u'zlib': ( zlib.compressobj, zlib.decompressobj, ),
+    u'bz2': ( bz2.BZ2Compressor, bz2.BZ2Decompressor, ),
+}
+
+def _codec(name):
+    try:
+        return _CODECS[name]
+    except KeyError:
+        raise FSQCodecError(errno.EINVAL, u'no such codec: {0}'.format(name))
+
+def _header(name):
+    return '{0}{1}\n'.format(_MAGIC, name.encode(_c.FSQ_CHARSET))
+
+def _stored(src_file):
+    '''The codec of a payload as stored, or None, from the start of a
+       regular file, leaving it at the start'''
+    try:
+        src_fd = src_file.fileno()
+        if not stat.S_ISREG(os.fstat(src_fd).st_mode) or\
+                0 != os.lseek(src_fd, 0, os.SEEK_CUR):
+            return None
+        head = os.read(src_fd, len(_MAGIC) + _MAX_NAME + 1)
+        os.lseek(src_fd, 0, os.SEEK_SET)
+    except AttributeError:
+        return None
+    return _parse(head)[0]
+
+def _parse(head):
+    '''( codec name, header length, ) of a compressed payload, from its
+       first bytes, or ( None, 0, )'''
+    if not head.startswith(_MAGIC):
+        return None, 0
+    end = head.find('\n', len(_MAGIC))
+    if -1 == end:
+        return None, 0
+    try:
+        return head[len(_MAGIC):end].decode(_c.FSQ_CHARSET), end + 1
+    except UnicodeDecodeError:
+        return None, 0
+
+####### EXPOSED METHODS AND CLASSES #######
+def register_codec(name, compressor, decompressor):
+    '''Register a codec: compressor and decompressor are factories, as
+       zlib.compressobj and zlib.decompressobj are, returning objects with
+       compress and flush, and decompress methods'''
+    name = coerce_unicode(name, _c.FSQ_CHARSET)
+    if not name or _MAX_NAME < len(name) or u'\n' in name:
+        raise FSQCodecError(errno.EINVAL, u'invalid codec name:'\
+                            u' {0}'.format(name))
+    _CODECS[name] = ( compressor, decompressor, )
+
+def get_codec(queue):
+    '''The codec a queue compresses payloads with, or None'''
+    try:
+        with open(fsq_path.codec(queue), 'rb') as f:
+            name = f.read().strip().decode(_c.FSQ_CHARSET)
+    except (OSError, IOError, ), e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise FSQConfigError(e.errno, wrap_io_os_err(e))
+    except UnicodeDecodeError:
+        raise FSQCodecError(errno.EINVAL, u'cannot decode codec name for'\
+                            u' queue: {0}'.format(queue))
+    return name or None
+
+def set_codec(queue, codec=None, user=None, group=None, mode=None):
+    '''Compress payloads enqueued to a queue with codec, or with None, stop
+       compressing them; items already enqueued are left as they are'''
+    codec_path = fsq_path.codec(queue)
+    try:
+        if codec is None:
+            try:
+                os.unlink(codec_path)
+            except (OSError, IOError, ), e:
+                if e.errno != errno.ENOENT:
+                    raise e
+            return
+        codec = coerce_unicode(codec, _c.FSQ_CHARSET)
+        _codec(codec)
+        user = _c.FSQ_ITEM_USER if user is None else user
+        group = _c.FSQ_ITEM_GROUP if group is None else group
+        mode = _c.FSQ_ITEM_MODE if mode is None else mode
+        # write aside and rename, so enqueuers never read half a name
+        tmp_path = u'{0}.{1}'.format(codec_path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, mode)
+        try:
+            try:
+                if user is not None or group is not None:
+                    os.fchown(fd, *uid_gid(user, group, fd=fd))
+                _write(fd, codec.encode(_c.FSQ_CHARSET))
+            finally:
+                os.close(fd)
+            os.rename(tmp_path, codec_path)
+        except Exception, e:
+            os.unlink(tmp_path)
+            raise e
+    except (OSError, IOError, ), e:
+        if isinstance(e, FSQCodecError):
+            raise e
+        raise FSQConfigError(e.errno, wrap_io_os_err(e))
+
+def copy_payload(src_file, trg_fds, codecs):
+    '''Copy src_file (as returned by rationalize_file) to each fd in
+       trg_fds, compressed with the codec in codecs for that fd (None, not
+       compressed).  Payloads already compressed are copied as stored, and
+       payloads not to be compressed are copied as copy_file would.'''
+    if not any(codecs) or _stored(src_file) is not None:
+        return copy_file(src_file, trg_fds)
+    compressors = []
+    for trg_fd, name in zip(trg_fds, codecs):
+        if name is None:
+            compressors.append(None)
+        else:
+            compressors.append(_codec(name)[0]())
+            _write(trg_fd, _header(name))
+    read = src_file.read if hasattr(src_file, 'read') else\
+               lambda size: src_file.readline()
+    copied = 0
+    while True:
+        buf = read(_BUFSIZE)
+        if not buf:
+            break
+        if isinstance(buf, unicode):
+            buf = str(buf)
+        for trg_fd, compressor in zip(trg_fds, compressors):
+            _write(trg_fd, buf if compressor is None else\
+                               compressor.compress(buf))
+        copied += len(buf)
+    for trg_fd, compressor in zip(trg_fds, compressors):
+        if compressor is not None:
+            _write(trg_fd, compressor.flush())
+    return copied
+
+class FSQCodecReader(object):
+    '''A read-only file-like object, decompressing a payload from the raw
+       file (as opened, and locked, by FSQWorkItem) as it is read.'''
+    ####### MAGICAL METHODS AND ATTRS #######
+    def __init__(self, raw, codec):
+        self.raw = raw
+        self.codec = codec
+        self.name = getattr(raw, 'name', None)
+        self._decompressor = _codec(codec)[1]()
+        self._buf = ''
+        self._eof = False
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    ####### EXPOSED METHODS AND ATTRS #######
+    @property
+    def closed(self):
+        return self.raw.closed
+
+    def _fill(self, size):
+        '''Decompress until at least size bytes are buffered (-1, all), or
+           the payload is exhausted'''
+        while not self._eof and ( 0 > size or len(self._buf) < size ):
+            chunk = self.raw.read(_BUFSIZE)
+            try:
+                if chunk:
+                    self._buf += self._decompressor.decompress(chunk)
+                    continue
+                self._eof = True
+                if hasattr(self._decompressor, 'flush'):
+                    self._buf += self._decompressor.flush()
+            except (zlib.error, IOError, EOFError, ), e:
+                raise FSQCodecError(errno.EIO, u'cannot decompress {0}'\
+                                    u' payload: {1}'.format(self.codec, e))
+
+    def read(self, size=-1):
+        self._fill(size)
+        if 0 > size:
+            buf, self._buf = self._buf, ''
+        else:
+            buf, self._buf = self._buf[:size], self._buf[size:]
+        return buf
+
+    def readline(self, size=-1):
+        while True:
+            end = self._buf.find('\n')
+            if -1 != end or self._eof or\
+                    ( 0 <= size and len(self._buf) >= size ):
+                break
+            self._fill(len(self._buf) + _BUFSIZE)
+        end = len(self._buf) if -1 == end else end + 1
+        if 0 <= size:
+            end = min(end, size)
+        buf, self._buf = self._buf[:end], self._buf[end:]
+        return buf
+
+    def readlines(self, sizehint=None):
+        return list(self)
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration()
+        return line
+
+    def close(self):
+        self.raw.close()
+
+class FSQCodecWriter(object):
+    '''A write-only file-like object, compressing a payload to the raw file
+       as it is written.  The payload is complete once closed.'''
+    ####### MAGICAL METHODS AND ATTRS #######
+    def __init__(self, raw, codec):
+        self.raw = raw
+        self.codec = codec
+        self.name = getattr(raw, 'name', None)
+        self._compressor = _codec(codec)[0]()
+        self.raw.write(_header(codec))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    ####### EXPOSED METHODS AND ATTRS #######
+    @property
+    def closed(self):
+        return self.raw.closed
+
+    def write(self, buf):
+        # as file.write would, coerce unicode with the default codec
+        if isinstance(buf, unicode):
+            buf = str(buf)
+        self.raw.write(self._compressor.compress(buf))
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        self.raw.flush()
+
+    def close(self):
+        if not self.raw.closed:
+            try:
+                self.raw.write(self._compressor.flush())
+            finally:
+                self.raw.close()
+
+def open_item(raw):
+    '''Given a work-item's file, freshly opened, return it, or should its
+       payload be compressed, an FSQCodecReader reading it'''
+    head = raw.read(len(_MAGIC) + _MAX_NAME + 1)
+    name, length = _parse(head)
+    raw.seek(length)
+    if name is None:
+        return raw
+    return FSQCodecReader(raw, name)
+
+def feed(reader):
+    '''Fork, and feed reader's payload to the stdin of the child by way of
+       a pipe, e.g. for a program the child is to exec.  Returns in the
+       child only: the parent feeds the pipe, waits for the child, and exits
+       as the child exits, whether or not the child read all of the payload
+       -- unless the payload could not be read in full, as it is corrupt
+       (FSQ_FAIL_PERM), or otherwise (FSQ_FAIL_TMP), with a message on
+       stderr.'''
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if 0 == pid:
+        os.close(wfd)
+        os.dup2(rfd, sys.stdin.fileno())
+        os.close(rfd)
+        return
+    try:
+        os.close(rfd)
+        rc = 0
+        try:
+            for buf in iter(lambda: reader.read(_BUFSIZE), ''):
+                _write(wfd, buf)
+        except FSQCodecError, e:
+            rc, err = _c.FSQ_FAIL_PERM, e
+        except (OSError, IOError, ), e:
+            # the child stopped reading, as a program may, its exit wins
+            if e.errno != errno.EPIPE:
+                rc, err = _c.FSQ_FAIL_TMP, e
+        finally:
+            os.close(wfd)
+        while True:
+            try:
+                status = os.waitpid(pid, 0)[1]
+                break
+            except OSError, e:
+                if e.errno != errno.EINTR:
+                    raise e
+        if os.WIFSIGNALED(status):
+            # terminated as our child was
+            signal.signal(os.WTERMSIG(status), signal.SIG_DFL)
+            os.kill(os.getpid(), os.WTERMSIG(status))
+        if rc:
+            print >> sys.stderr, u'cannot feed payload: {0}'.format(
+                err.strerror).encode(_c.FSQ_CHARSET)
+            sys.stderr.flush()
+        os._exit(rc or os.WEXITSTATUS(status))
+    finally:
+        os._exit(_c.FSQ_FAIL_TMP)
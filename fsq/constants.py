@@ -33,6 +33,11 @@ FSQ_DONE = coerce_unicode(os.environ.get("FSQ_DONE", u'done'), FSQ_CHARSET)
 FSQ_FAIL = coerce_unicode(os.environ.get("FSQ_FAIL", u'fail'), FSQ_CHARSET)
 FSQ_TMP = coerce_unicode(os.environ.get("FSQ_TMP", u'tmp'), FSQ_CHARSET)
 FSQ_DOWN = coerce_unicode(os.environ.get("FSQ_DOWN", u'down'), FSQ_CHARSET)
+FSQ_CODEC = coerce_unicode(os.environ.get("FSQ_CODEC", u'codec'), FSQ_CHARSET)
+FSQ_BLOBS = coerce_unicode(os.environ.get("FSQ_BLOBS", u'.blobs'), FSQ_CHARSET)
+FSQ_CLAIMED = coerce_unicode(os.environ.get("FSQ_CLAIMED", u'claimed'),
+                             FSQ_CHARSET)
+FSQ_DELAY = coerce_unicode(os.environ.get("FSQ_DELAY", u'delay'), FSQ_CHARSET)
 FSQ_TRIGGER = coerce_unicode(os.environ.get("FSQ_TRIGGER", u'trigger-s'),
                              FSQ_CHARSET)
 FSQ_ROOT = coerce_unicode(os.environ.get("FSQ_ROOT", u'/var/fsq'),
@@ -41,6 +46,9 @@ FSQ_HOSTS = coerce_unicode(os.environ.get("FSQ_HOSTS", u'hosts'),
                           FSQ_CHARSET)
 FSQ_HOSTS_TRIGGER = coerce_unicode(os.environ.get("FSQ_HOSTS_TRIGGER",
                                    u'hosts-trigger-s'), FSQ_CHARSET)
+# fsync policy for queue mutations -- none, data, full or group
+FSQ_DURABILITY = coerce_unicode(os.environ.get("FSQ_DURABILITY", u'data'),
+                                FSQ_CHARSET)
 
 # these 2 default to None, as gid/uid may change in due course
 # when using these 2, default to os.getgid(), os.getuid()
@@ -73,9 +81,44 @@ try:
     FSQ_USE_TRIGGER = int(os.environ.get("FSQ_USE_TRIGGER", 0))
     # get/respect exclusive locks on queue items
     FSQ_LOCK = int(os.environ.get("FSQ_LOCK", 1))
+    # claim queue items by rename into a per-worker claimed directory
+    FSQ_RENAME = int(os.environ.get("FSQ_RENAME", 0))
+    # seconds for which a claim by rename is leased -- 0 is forever
+    FSQ_LEASE = int(os.environ.get("FSQ_LEASE", 0))
+    # seconds by which to delay the first retry of an item, doubling for
+    # each retry thereafter, to at most max seconds -- 0 is retry now
+    FSQ_BACKOFF = int(os.environ.get("FSQ_BACKOFF", 0))
+    FSQ_BACKOFF_MAX = int(os.environ.get("FSQ_BACKOFF_MAX", 3600))
+    # seconds of not-before time per delay bucket
+    FSQ_DELAY_BUCKET = int(os.environ.get("FSQ_DELAY_BUCKET", 60))
     # max tries before tmp fails become permanant -- 0 is infinite
     FSQ_MAX_TRIES = int(os.environ.get("FSQ_MAX_TRIES", 1))
     # time-to-live (in seconds) for any queue item -- 0 is infinite
     FSQ_TTL = int(os.environ.get("FSQ_TTL", 0))
+    # max item ids scan holds in memory at a time -- 0 is unbounded
+    FSQ_SCAN_WINDOW = int(os.environ.get("FSQ_SCAN_WINDOW", 0))
+    # oldest item ids claim spreads consumers across -- 0 is the whole queue
+    FSQ_CLAIM_WINDOW = int(os.environ.get("FSQ_CLAIM_WINDOW", 1024))
+    # re-check down-files after milliseconds or items -- 0 is no bound, both
+    # 0 is to check before every item
+    FSQ_DOWN_CACHE_MS = int(os.environ.get("FSQ_DOWN_CACHE_MS", 0))
+    FSQ_DOWN_CACHE_ITEMS = int(os.environ.get("FSQ_DOWN_CACHE_ITEMS", 0))
+    # watch down-files with inotify, where available
+    FSQ_DOWN_WATCH = int(os.environ.get("FSQ_DOWN_WATCH", 0))
+    # flush group durability directory fsyncs after milliseconds or
+    # mutations, whichever comes first
+    FSQ_DURABILITY_GROUP_MS = int(os.environ.get("FSQ_DURABILITY_GROUP_MS",
+                                                 10))
+    FSQ_DURABILITY_GROUP_OPS = int(os.environ.get("FSQ_DURABILITY_GROUP_OPS",
+                                                  64))
+    # enqueue anonymous (O_TMPFILE) files, where available, rather than
+    # files in tmp -- off by default
+    FSQ_TMPFILE = int(os.environ.get("FSQ_TMPFILE", 0))
+    # threads in which fsq.aio makes file-system calls
+    FSQ_AIO_THREADS = int(os.environ.get("FSQ_AIO_THREADS", 16))
+    # reenqueue copies by way of the blob store, and seconds for which
+    # unreferenced blobs are kept
+    FSQ_DEDUP = int(os.environ.get("FSQ_DEDUP", 0))
+    FSQ_BLOBS_GRACE = int(os.environ.get("FSQ_BLOBS_GRACE", 3600))
 except ValueError, e:
     raise FSQEnvError(errno.EINVAL, e.message)
@@ -12,27 +12,50 @@ import errno
 
 from . import FSQMalformedEntryError, constants as _c, encode, decode
 from .internal import coerce_unicode, delimiter_encodeseq
+from .encode import _decode
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+def _deconstruct_walk(name, delimiter, encodeseq):
+    '''char-wise deconstruct walk, the reference implementation of
+       deconstruct, used for anything the fast deconstruct cannot handle'''
+    new_arg = sep = u''
+    args = []
+    encoding_trg = sep
+    for c in name[1:]:
+        if 3 == len(encoding_trg):
+            encoding_trg = sep
+        if c == encodeseq or len(encoding_trg):
+            encoding_trg = sep.join([encoding_trg, c])
+        elif c == delimiter:
+            # at delimiter, append and reset working arg
+            args.append(decode(new_arg, delimiter=delimiter,
+                               encodeseq=encodeseq))
+            new_arg = sep
+            continue
+
+        new_arg = sep.join([new_arg, c])
+
+    # append our last arg
+    args.append(decode(new_arg, delimiter=delimiter, encodeseq=encodeseq))
+    return delimiter, args
 
 ####### EXPOSED METHODS #######
 def construct(args):
     '''Construct a queue-name from a set of arguments and a delimiter'''
     # make everything unicode
-    name = u''
     delimiter, encodeseq = delimiter_encodeseq(_c.FSQ_DELIMITER,
                                                _c.FSQ_ENCODE, _c.FSQ_CHARSET)
     if len(args) == 0:
         return delimiter
-    for arg in args:
-        name = delimiter.join([ name,
-                                encode(coerce_unicode(arg, _c.FSQ_CHARSET),
-                                delimiter=delimiter, encodeseq=encodeseq)])
-
-    return name
+    return delimiter + delimiter.join([ encode(coerce_unicode(arg,
+                                                              _c.FSQ_CHARSET),
+                                               delimiter=delimiter,
+                                               encodeseq=encodeseq)\
+                                        for arg in args ])
 
 def deconstruct(name):
     '''Deconstruct a queue-name to a set of arguments'''
     name = coerce_unicode(name, _c.FSQ_CHARSET)
-    new_arg = sep = u''
     args = []
     # can't get delimiter, if string is empty
     if 1 > len(name):
@@ -45,22 +68,14 @@ def deconstruct(name):
     if 1 == len(name):
         return delimiter, args
 
-    # normal case
-    encoding_trg = sep
-    for c in name[1:]:
-        if 3 == len(encoding_trg):
-            encoding_trg = sep
-        if c == encodeseq or len(encoding_trg):
-            encoding_trg = sep.join([encoding_trg, c])
-        elif c == delimiter:
-            # at delimiter, append and reset working arg
-            args.append(decode(new_arg, delimiter=delimiter,
-                               encodeseq=encodeseq))
-            new_arg = sep
-            continue
-
-        new_arg = sep.join([new_arg, c])
+    # normal case, nothing encoded
+    args = name[1:].split(delimiter)
+    if encodeseq not in name:
+        return delimiter, args
+    # the 2 characters following an encodeseq are never delimiters, should
+    #  a split fall there, walk it
+    for arg in args[:-1]:
+        if encodeseq in arg[-2:]:
+            return _deconstruct_walk(name, delimiter, encodeseq)
 
-    # append our last arg
-    args.append(decode(new_arg, delimiter=delimiter, encodeseq=encodeseq))
-    return delimiter, args
+    return delimiter, [ _decode(arg, encodeseq) for arg in args ]
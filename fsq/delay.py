@@ -0,0 +1,142 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/delay.py -- provides a time-bucketed index of work-items which may not
+#                 be worked before some time: backoff, delay, promote,
+#                 next_due
+#
+#   Work-items which are not yet eligible (retries backing off, see:
+#   FSQ_BACKOFF, and work-items enqueued with not_before, see: venqueue)
+#   are kept out of the queue, in a bucket directory of the
+#   queue's delay directory (FSQ_DELAY), named for the time at which the
+#   bucket comes due (the epoch, in seconds, rounded up to FSQ_DELAY_BUCKET
+#   seconds).  Scans never see them, and so never open, lock or parse them.
+#
+#   promote moves the work-items of each bucket which has come due into the
+#   queue, touching only those buckets: work-items are promoted no earlier
+#   than their not-before time, and no more than FSQ_DELAY_BUCKET seconds
+#   after it (plus the interval at which promote is called, see: scand).
+#
+#     fsq is all unicode internally, if you pass in strings,
+#     they will be explicitly coerced to unicode.
+#
+# This software is for POSIX compliant systems only.
+import os
+import errno
+import time
+import datetime
+
+from . import constants as _c, path as fsq_path, FSQDelayError
+from .internal import coerce_unicode, wrap_io_os_err, _mkdir
+from .durability import sync_dirs
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+def _bucket(not_before):
+    '''Name of the bucket for a not-before time, in seconds since the
+       epoch: the first bucket to come due at, or after, not_before'''
+    size = max(1, _c.FSQ_DELAY_BUCKET)
+    return u'{0:010d}'.format(-(-int(not_before) // size) * size)
+
+def _epoch(not_before):
+    '''Seconds since the epoch, for a not-before time passed as a datetime
+       (local time, as enqueued_at) or as seconds since the epoch'''
+    if isinstance(not_before, datetime.datetime):
+        return time.mktime(not_before.timetuple()) +\
+               not_before.microsecond / 1000000.0
+    elif isinstance(not_before, datetime.date):
+        return time.mktime(not_before.timetuple())
+    return not_before
+
+####### EXPOSED METHODS #######
+def backoff(tries, backoff=None):
+    '''Seconds for which to delay the retry of a work-item, having failed
+       tries times: backoff (default: FSQ_BACKOFF) doubled for each try
+       after the first, to no more than FSQ_BACKOFF_MAX; backoff may also be
+       a callable, passed tries, returning seconds.  0 is no delay.'''
+    backoff = _c.FSQ_BACKOFF if backoff is None else backoff
+    if callable(backoff):
+        return backoff(tries)
+    elif 0 >= backoff:
+        return 0
+    return min(backoff * 2**max(0, tries - 1), max(backoff,
+                                                   _c.FSQ_BACKOFF_MAX))
+
+def delay(src, queue, item_id, not_before, host=None):
+    '''Rename the work-item at src into the bucket for not_before (seconds
+       since the epoch), as item_id, making the bucket should it not exist;
+       returns the directory of the bucket'''
+    bucket_dir = fsq_path.delay(queue, _bucket(not_before), host=host)
+    trg = os.path.join(bucket_dir, fsq_path.valid_name(item_id))
+    try:
+        try:
+            os.rename(src, trg)
+        except (OSError, IOError, ), e:
+            if e.errno != errno.ENOENT or not os.path.exists(src):
+                raise e
+            # no such bucket, or it has just come due, and been promoted
+            for trg_dir in ( fsq_path.delay(queue, host=host), bucket_dir, ):
+                _mkdir(trg_dir, _c.FSQ_QUEUE_MODE, _c.FSQ_QUEUE_USER,
+                       _c.FSQ_QUEUE_GROUP)
+            os.rename(src, trg)
+    except (OSError, IOError, ), e:
+        raise FSQDelayError(e.errno, wrap_io_os_err(e))
+    return bucket_dir
+
+def promote(queue, host=None, now=None):
+    '''Move the work-items of each bucket which has come due (by now,
+       default: time.time()) into the queue, and remove the bucket; returns
+       the ids of the work-items promoted.'''
+    due = u'{0:010d}'.format(int(time.time() if now is None else now))
+    promoted = []
+    try:
+        try:
+            buckets = os.listdir(fsq_path.delay(queue, host=host))
+        except (OSError, IOError, ), e:
+            if e.errno != errno.ENOENT:
+                raise e
+            return promoted
+        for bucket in sorted(buckets):
+            bucket = coerce_unicode(bucket, _c.FSQ_CHARSET)
+            if bucket > due:
+                break
+            bucket_dir = fsq_path.delay(queue, bucket, host=host)
+            try:
+                item_ids = os.listdir(bucket_dir)
+            except (OSError, IOError, ), e:
+                # promoted by another
+                if e.errno != errno.ENOENT:
+                    raise e
+                continue
+            for item_id in sorted(item_ids):
+                item_id = coerce_unicode(item_id, _c.FSQ_CHARSET)
+                try:
+                    os.rename(os.path.join(bucket_dir, item_id),
+                              fsq_path.item(queue, item_id, host=host))
+                    promoted.append(item_id)
+                except (OSError, IOError, ), e:
+                    if e.errno != errno.ENOENT:
+                        raise e
+            try:
+                os.rmdir(bucket_dir)
+            except (OSError, IOError, ), e:
+                # delayed into, as we promoted, it will be promoted next time
+                if e.errno not in ( errno.ENOENT, errno.ENOTEMPTY,
+                                    errno.EEXIST, ):
+                    raise e
+        if promoted:
+            sync_dirs(fsq_path.queue(queue, host=host))
+    except (OSError, IOError, ), e:
+        raise FSQDelayError(e.errno, wrap_io_os_err(e))
+    return promoted
+
+def next_due(queue, host=None):
+    '''Seconds since the epoch at which the next bucket of a queue comes
+       due, or None, should nothing be delayed'''
+    try:
+        buckets = os.listdir(fsq_path.delay(queue, host=host))
+    except (OSError, IOError, ), e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise FSQDelayError(e.errno, wrap_io_os_err(e))
+    buckets = [ b for b in buckets if b.isdigit() ]
+    return int(min(buckets)) if buckets else None
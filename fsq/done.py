@@ -10,14 +10,34 @@
 #
 # This software is for POSIX compliant systems only.
 import os
+import time
+
 from . import constants as _c, FSQDoneError, FSQFailError, FSQMaxTriesError,\
-              FSQEnqueueError, FSQTTLExpiredError, path as fsq_path, construct
+              FSQEnqueueError, FSQTTLExpiredError, FSQTimeFmtError,\
+              path as fsq_path, construct
 from .internal import wrap_io_os_err, check_ttl_max_tries, fmt_time
+from .durability import sync_dirs
+from .delay import backoff as _backoff, delay as _delay
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+def _src(item, host):
+    '''( path, dir, ) of a work-item, in its queue, or should it have been
+       claimed by rename, in its worker's claimed directory'''
+    worker = getattr(item, 'worker', None)
+    if worker is None:
+        return fsq_path.item(item.queue, item.id, host=host),\
+               fsq_path.queue(item.queue, host=host)
+    return fsq_path.item(item.queue, item.id, host=host, worker=worker),\
+           fsq_path.claimed(item.queue, worker, host=host)
 
 ####### EXPOSED METHODS #######
-def fail_tmp(item, max_tries=None, ttl=None):
+def fail_tmp(item, max_tries=None, ttl=None, backoff=None):
     '''Try to fail a work-item temporarily (up recount and keep in queue),
-       if max tries or ttl is exhausted, escalate to permanant failure.'''
+       if max tries or ttl is exhausted, escalate to permanant failure.
+
+       With backoff (default: FSQ_BACKOFF, see: delay.backoff), the retry is
+       delayed: the work-item is kept out of the queue, in the delay bucket
+       for its not-before time, until it is promoted.'''
     try:
         max_tries = item.max_tries if max_tries is None else max_tries
         ttl = item.ttl if ttl is None else ttl
@@ -30,10 +50,18 @@ def fail_tmp(item, max_tries=None, ttl=None):
                                _c.FSQ_CHARSET), item.entropy,
                                item.pid, item.hostname,
                                item.tries, ) + tuple(item.arguments))
-        os.rename(fsq_path.item(item.queue, item.id, host=item.host),
-				  fsq_path.item(item.queue, new_name, host=item.host))
+        src, src_dir = _src(item, item.host)
+        wait = _backoff(item.tries, backoff)
+        if 0 < wait:
+            sync_dirs(_delay(src, item.queue, new_name, time.time() + wait,
+                             host=item.host), src_dir)
+            return new_name
+        # claimed items are returned to the queue
+        os.rename(src, fsq_path.item(item.queue, new_name, host=item.host))
+        sync_dirs(fsq_path.queue(item.queue, host=item.host), src_dir)
         return new_name
-    except (FSQMaxTriesError, FSQTTLExpiredError, FSQEnqueueError, ), e:
+    except (FSQMaxTriesError, FSQTTLExpiredError, FSQTimeFmtError,
+            FSQEnqueueError, ), e:
         fail_perm(item)
         e.strerror = u': '.join([
             e.strerror,
@@ -49,8 +77,10 @@ def fail_perm(item):
     trg_queue = item.queue
     host = item.host
     try:
-        os.rename(fsq_path.item(trg_queue, item_id, host=host),
-                  os.path.join(fsq_path.fail(trg_queue, host=host), item_id))
+        src, src_dir = _src(item, host)
+        os.rename(src, os.path.join(fsq_path.fail(trg_queue, host=host),
+                                    item_id))
+        sync_dirs(src_dir, fsq_path.fail(trg_queue, host=host))
     except (OSError, IOError, ), e:
         raise FSQFailError(e.errno, u'cannot mv item to fail: {0}:'\
                            u' {1}'.format(item.id, wrap_io_os_err(e)))
@@ -76,9 +106,10 @@ def success(item):
     try:
         # mv to done
         trg_queue = item.queue
-        os.rename(fsq_path.item(trg_queue, item.id, host=item.host),
-                  os.path.join(fsq_path.done(trg_queue, host=item.host),
-                               item.id))
+        src, src_dir = _src(item, item.host)
+        os.rename(src, os.path.join(fsq_path.done(trg_queue, host=item.host),
+                                    item.id))
+        sync_dirs(src_dir, fsq_path.done(trg_queue, host=item.host))
     except AttributeError, e:
         # DuckType TypeError'ing
         raise TypeError(u'item must be an FSQWorkItem, not:'\
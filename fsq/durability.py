@@ -0,0 +1,138 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/durability.py -- provides the fsync policy for queue mutations, per
+#                      FSQ_DURABILITY: sync_files, sync_dirs, sync
+#
+#   none  -- never fsync(2)
+#   data  -- fsync(2) work-item files before linking them into a queue
+#   full  -- data, and fsync(2) each directory after a link(2), unlink(2) or
+#            rename(2) in it
+#   group -- data, and fsync(2) directories from a background thread, once
+#            every FSQ_DURABILITY_GROUP_MS milliseconds or
+#            FSQ_DURABILITY_GROUP_OPS mutations, whichever comes first
+#
+#     fsq is all unicode internally, if you pass in strings,
+#     they will be explicitly coerced to unicode.
+#
+# This software is for POSIX compliant systems only.
+import os
+import errno
+import atexit
+import threading
+
+from . import constants as _c, FSQEnvError
+from .internal import fsync_fds
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+_LEVELS = ( u'none', u'data', u'full', u'group', )
+# directories pending fsync, and mutations since the last group flush
+_GROUP_DIRS = set()
+_GROUP_OPS = 0
+# first error from a background flush, raised from the next sync
+_GROUP_ERR = None
+# pid which owns the flusher thread, so that we restart it following fork
+_GROUP_PID = None
+_GROUP_COND = threading.Condition()
+_START_LOCK = threading.Lock()
+
+def _level(durability):
+    durability = _c.FSQ_DURABILITY if durability is None else durability
+    if durability not in _LEVELS:
+        raise FSQEnvError(errno.EINVAL, u'durability must be one of: {0},'\
+                          u' not: {1}'.format(u', '.join(_LEVELS),
+                                              durability))
+    return durability
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _flush(dirs):
+    '''fsync each directory in dirs, directories which have gone away (e.g.
+       an uninstalled queue) have nothing to sync'''
+    for path in set(dirs):
+        try:
+            _fsync_dir(path)
+        except (OSError, IOError, ), e:
+            if e.errno != errno.ENOENT:
+                raise e
+
+def _swap():
+    '''Take the pending directories, with _GROUP_COND held'''
+    global _GROUP_DIRS, _GROUP_OPS
+    dirs, _GROUP_DIRS, _GROUP_OPS = _GROUP_DIRS, set(), 0
+    return dirs
+
+def _flusher():
+    global _GROUP_ERR
+    while True:
+        with _GROUP_COND:
+            while not _GROUP_DIRS:
+                _GROUP_COND.wait()
+            # give the group a chance to fill up
+            if _GROUP_OPS < max(1, _c.FSQ_DURABILITY_GROUP_OPS):
+                _GROUP_COND.wait(max(0, _c.FSQ_DURABILITY_GROUP_MS)/1000.0)
+            dirs = _swap()
+        try:
+            _flush(dirs)
+        except (OSError, IOError, ), e:
+            with _GROUP_COND:
+                _GROUP_ERR = _GROUP_ERR or e
+
+def _start():
+    '''Start the flusher thread, on first use, or following a fork'''
+    global _GROUP_PID, _GROUP_COND
+    with _START_LOCK:
+        if _GROUP_PID == os.getpid():
+            return
+        if _GROUP_PID is not None:
+            # forked: the parent's flusher is not here to release it
+            _GROUP_COND = threading.Condition()
+        flusher = threading.Thread(target=_flusher)
+        flusher.daemon = True
+        flusher.start()
+        _GROUP_PID = os.getpid()
+
+def _group(dirs):
+    global _GROUP_OPS
+    if _GROUP_PID != os.getpid():
+        _start()
+    with _GROUP_COND:
+        _GROUP_DIRS.update(dirs)
+        _GROUP_OPS += 1
+        if _GROUP_OPS == 1 or _GROUP_OPS >= _c.FSQ_DURABILITY_GROUP_OPS:
+            _GROUP_COND.notify()
+
+####### EXPOSED METHODS #######
+def sync_files(fds, parallel=False, durability=None):
+    '''fsync work-item files before they are linked into a queue, unless
+       durability is none (see: internal.fsync_fds for parallel)'''
+    if u'none' != _level(durability):
+        fsync_fds(fds, parallel=parallel)
+
+def sync_dirs(*dirs, **kwargs):
+    '''fsync the directories in which a link, unlink or rename has just been
+       made: now if durability is full, soon if it is group.'''
+    durability = _level(kwargs.pop('durability', None))
+    if u'full' == durability:
+        _flush(dirs)
+    elif u'group' == durability:
+        _group(dirs)
+
+def sync():
+    '''fsync all directories pending a group fsync now, raising any error
+       from a prior background fsync'''
+    global _GROUP_ERR
+    with _GROUP_COND:
+        dirs = _swap()
+        err, _GROUP_ERR = _GROUP_ERR, None
+    _flush(dirs)
+    if err is not None:
+        raise err
+
+# don't lose a group on a clean exit
+atexit.register(sync)
@@ -9,57 +9,54 @@
 # This software is for POSIX compliant systems only.
 import errno
 import os
+import string
 
-from . import FSQEncodeError, constants as _c
+from . import FSQEncodeError, FSQCoerceError, constants as _c
 from .internal import coerce_unicode, delimiter_encodeseq
 
 ####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
 _ENCODED = (os.path.sep,)
+# translate tables by (delimiter, encodeseq, encoded, ), for encode
+_ENCODE_TABLES = {}
+# decoded character by 2 hex digits, for each charset, for the fast decode
+_DECODE_TABLES = {}
 
-####### EXPOSED METHODS #######
-# we use a very lightweight ``percent'' encoding
-def encode(arg, delimiter=None, encodeseq=None, encoded=tuple()):
-    '''Encode a single argument for the file-system'''
-    arg = coerce_unicode(arg, _c.FSQ_CHARSET)
-    new_arg = sep = u''
-    delimiter, encodeseq = delimiter_encodeseq(
-        _c.FSQ_DELIMITER if delimiter is None else delimiter,
-        _c.FSQ_ENCODE if encodeseq is None else encodeseq,
-        _c.FSQ_CHARSET)
+def _encode_table(delimiter, encodeseq, encoded):
+    key = ( delimiter, encodeseq, encoded, )
+    try:
+        return _ENCODE_TABLES[key]
+    except (KeyError, TypeError, ):
+        pass
+    table = {}
+    # all encode-targets are ascii, so always 2 hex digits
+    for seq in ( delimiter, encodeseq, ) + _ENCODED + tuple(encoded):
+        if isinstance(seq, basestring) and 1 == len(seq):
+            table[ord(seq)] = u'{0}{1:02x}'.format(encodeseq, ord(seq))
+    try:
+        _ENCODE_TABLES[key] = table
+    except TypeError:
+        pass
+    return table
 
-    # validate encoded tuple
-    for enc in encoded:
-        enc = coerce_unicode(enc, _c.FSQ_CHARSET)
-        try:
-            enc = enc.encode('ascii')
-        except UnicodeEncodeError:
-            raise FSQEncodeError(errno.EINVAL, u'invalid encoded value: {0}'\
-                                 u' non-ascii'.format(enc))
-    # char-wise encode walk
-    for seq in arg:
-        if seq == delimiter or seq == encodeseq or seq in _ENCODED + encoded:
-            h_val = hex(ord(seq))
-            # front-pad with zeroes
-            if 3 == len(h_val):
-                h_val = sep.join([h_val[:2], u'0', h_val[2:]])
-            if 4 != len(h_val):
-                raise FSQEncodeError(errno.EINVAL, u'invalid hex ({0}) for'\
-                                     ' encode-target: {1}'.format(h_val, seq))
-            seq = sep.join([encodeseq, h_val[2:]])
-
-        new_arg = sep.join([new_arg, seq])
-
-    return new_arg
+def _decode_table(charset):
+    table = _DECODE_TABLES.get(charset)
+    if table is None:
+        table = {}
+        for hi in string.hexdigits:
+            for lo in string.hexdigits:
+                try:
+                    table[hi+lo] = coerce_unicode(chr(int(hi+lo, 16)),
+                                                  charset)
+                except FSQCoerceError:
+                    # not decodable alone, left to the char-wise walk
+                    pass
+        table = _DECODE_TABLES[charset] = table
+    return table
 
-def decode(arg, delimiter=None, encodeseq=None):
-    '''Decode a single argument from the file-system'''
-    arg = coerce_unicode(arg, _c.FSQ_CHARSET)
+def _decode_walk(arg, encodeseq):
+    '''char-wise decode walk, the reference implementation of decode, used
+       for anything the fast decode cannot handle'''
     new_arg = sep = u''
-    delimiter, encodeseq = delimiter_encodeseq(
-        _c.FSQ_DELIMITER if delimiter is None else delimiter,
-        _c.FSQ_ENCODE if encodeseq is None else encodeseq,
-        _c.FSQ_CHARSET)
-
     # char-wise decode walk -- minimally stateful
     encoding_trg = sep
     for c in arg:
@@ -86,3 +83,52 @@ def decode(arg, delimiter=None, encodeseq=None):
                              u' argument: {0}'.format(encoding_trg))
 
     return new_arg
+
+def _decode(arg, encodeseq):
+    '''decode, for a coerced arg and validated encodeseq'''
+    if encodeseq not in arg:
+        return arg
+    # split on encodeseq, each following chunk leads with 2 hex digits
+    table = _decode_table(_c.FSQ_CHARSET)
+    chunks = arg.split(encodeseq)
+    new_arg = [ chunks[0] ]
+    for chunk in chunks[1:]:
+        try:
+            new_arg.append(table[chunk[:2]])
+        except KeyError:
+            # invalid, truncated or undecodable alone, walk it
+            return _decode_walk(arg, encodeseq)
+        new_arg.append(chunk[2:])
+
+    return u''.join(new_arg)
+
+####### EXPOSED METHODS #######
+# we use a very lightweight ``percent'' encoding
+def encode(arg, delimiter=None, encodeseq=None, encoded=tuple()):
+    '''Encode a single argument for the file-system'''
+    arg = coerce_unicode(arg, _c.FSQ_CHARSET)
+    delimiter, encodeseq = delimiter_encodeseq(
+        _c.FSQ_DELIMITER if delimiter is None else delimiter,
+        _c.FSQ_ENCODE if encodeseq is None else encodeseq,
+        _c.FSQ_CHARSET)
+
+    # validate encoded tuple
+    for enc in encoded:
+        enc = coerce_unicode(enc, _c.FSQ_CHARSET)
+        try:
+            enc = enc.encode('ascii')
+        except UnicodeEncodeError:
+            raise FSQEncodeError(errno.EINVAL, u'invalid encoded value: {0}'\
+                                 u' non-ascii'.format(enc))
+
+    return arg.translate(_encode_table(delimiter, encodeseq, encoded))
+
+def decode(arg, delimiter=None, encodeseq=None):
+    '''Decode a single argument from the file-system'''
+    arg = coerce_unicode(arg, _c.FSQ_CHARSET)
+    delimiter, encodeseq = delimiter_encodeseq(
+        _c.FSQ_DELIMITER if delimiter is None else delimiter,
+        _c.FSQ_ENCODE if encodeseq is None else encodeseq,
+        _c.FSQ_CHARSET)
+
+    return _decode(arg, encodeseq)
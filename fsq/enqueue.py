@@ -3,8 +3,9 @@
 # @author: Jeff Rand <jeff.rand@axial.net>
 #
 # fsq/enqueue.py -- provides enqueueing functions: enqueue, senqueue,
-#                   venqueue, vsenqueue, reenqueue, sreenqueue, vreenqueue,
-#                   vsreenqueue
+#                   venqueue, vsenqueue, venqueue_many, vsenqueue_many,
+#                   reenqueue, sreenqueue, vreenqueue, vsreenqueue, and
+#                   the streamable FSQEnqueueItem
 #
 #     fsq is all unicode internally, if you pass in strings,
 #     they will be explicitly coerced to unicode.
@@ -12,9 +13,7 @@
 # This software is for POSIX compliant systems only.
 import errno
 import os
-import datetime
-import socket
-import select
+import time
 
 from cStringIO import StringIO
 from contextlib import closing
@@ -22,31 +21,108 @@ from contextlib import closing
 from . import FSQEnqueueError, FSQCoerceError, FSQError, FSQReenqueueError,\
               constants as _c, path as fsq_path, construct,\
               hosts as fsq_hosts, FSQWorkItem
-from .internal import rationalize_file, wrap_io_os_err, fmt_time,\
-                      coerce_unicode, uid_gid
-
-# TODO: provide an internal/external streamable queue item object use that
-#       instead of this for the enqueue family of functions
-#       make a queue item from args, return a file
+from .internal import rationalize_file, wrap_io_os_err, coerce_unicode,\
+                      uid_gid, load_at, openat, linkat, unlinkat, mkid,\
+                      open_tmpfile, link_tmpfile
+from .durability import sync_files, sync_dirs
+from .codec import get_codec, copy_payload, FSQCodecReader, FSQCodecWriter
+from .blobs import open_blob, store_blob
+from .delay import delay as _delay, _epoch
 
 ####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
-_HOSTNAME = socket.gethostname()
-_ENTROPY_PID = None
-_ENTROPY_TIME = None
-_ENTROPY_HOST = None
-_ENTROPY = 0
-
-# sacrifice a lot of complexity for a little statefullness
-def _mkentropy(pid, now, host):
-    global _ENTROPY_PID, _ENTROPY_TIME, _ENTROPY_HOST, _ENTROPY
-    if _ENTROPY_PID == pid and _ENTROPY_TIME == now and _ENTROPY_HOST == host:
-        _ENTROPY += 1
-    else:
-        _ENTROPY_PID = pid
-        _ENTROPY_TIME = now
-        _ENTROPY_HOST = host
-        _ENTROPY = 0
-    return _ENTROPY
+def _enqueue_at(src_file, item_name, tmp_dir, queue_dir, dir_fds, user,
+                group, mode, codec):
+    '''Copy src_file to tmp, and link it into queue, as venqueue does; with
+       *at(2) calls relative to dir_fds (tmp and queue) if we have them,
+       else by path, or by way of an anonymous file, per FSQ_TMPFILE.
+       Directories are left for the caller to sync.'''
+    tmp_name = os.path.join(tmp_dir, item_name)
+    at_name = item_name.encode(_c.FSQ_CHARSET)
+    flags = os.O_WRONLY|os.O_CREAT|os.O_EXCL
+    trg_fd = None
+    try:
+        if _c.FSQ_TMPFILE:
+            # an anonymous file in the queue's file-system, never in tmp
+            try:
+                trg_fd = open_tmpfile(queue_dir, os.O_WRONLY, mode)
+                tmp_name = None
+            except OSError, e:
+                if e.errno != errno.ENOSYS:
+                    raise e
+        if trg_fd is None and dir_fds:
+            trg_fd = openat(dir_fds[0], at_name, flags, mode)
+        elif trg_fd is None:
+            trg_fd = os.open(tmp_name, flags, mode)
+    except (OSError, IOError, ), e:
+        raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
+    try:
+        if user is not None or group is not None:
+            os.fchown(trg_fd, *uid_gid(user, group, fd=trg_fd))
+        copy_payload(src_file, ( trg_fd, ), ( codec, ))
+        sync_files(( trg_fd, ))
+        # hard-link into queue, unlink tmp, as venqueue
+        if tmp_name is None:
+            link_tmpfile(trg_fd, os.path.join(queue_dir, item_name).encode(
+                         _c.FSQ_CHARSET))
+        elif dir_fds:
+            linkat(dir_fds[0], at_name, dir_fds[1], at_name)
+            unlinkat(dir_fds[0], at_name)
+        else:
+            os.link(tmp_name, os.path.join(queue_dir, item_name))
+            os.unlink(tmp_name)
+        return item_name
+    except Exception, e:
+        try:
+            if tmp_name is not None:
+                os.unlink(tmp_name)
+        except (OSError, IOError, ), err:
+            if err.errno != errno.ENOENT:
+                raise FSQEnqueueError(err.errno, wrap_io_os_err(err))
+        if isinstance(e, (OSError, IOError, )) and\
+                not isinstance(e, FSQError):
+            raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
+        raise e
+    finally:
+        os.close(trg_fd)
+
+def _reenqueue_blobs(src_file, item_id, paths):
+    '''Copy src_file once per codec into the blob store, and hard-link the
+       stored blob into each queue in paths, as item_id'''
+    codecs = {}
+    for queue, host in paths:
+        if queue not in codecs:
+            codecs[queue] = get_codec(queue)
+    blob_codecs = list(set(codecs.values()))
+    blob_tmps = []
+    try:
+        for codec in blob_codecs:
+            blob_tmps.append(open_blob())
+        copy_payload(src_file, [ fd for fd, tmp_path in blob_tmps ],
+                     blob_codecs)
+        sync_files([ fd for fd, tmp_path in blob_tmps ])
+        stored = {}
+        for codec, ( fd, tmp_path, ) in zip(blob_codecs, blob_tmps):
+            stored[codec] = ( store_blob(fd, tmp_path), tmp_path, )
+        for queue, host in paths:
+            blob_path, tmp_path = stored[codecs[queue]]
+            trg_path = fsq_path.item(queue, item_id, host=host)
+            try:
+                try:
+                    os.link(blob_path, trg_path)
+                except (OSError, IOError, ), e:
+                    # collected since stored, our copy is just as good
+                    if e.errno != errno.ENOENT:
+                        raise e
+                    os.link(tmp_path, trg_path)
+            except (OSError, IOError, ), e:
+                if e.errno != errno.EEXIST:
+                    raise FSQReenqueueError(e.errno, wrap_io_os_err(e))
+        sync_dirs(*[ fsq_path.queue(queue, host=host) for queue, host\
+                     in paths ])
+    finally:
+        for fd, tmp_path in blob_tmps:
+            os.close(fd)
+            os.unlink(tmp_path)
 
 def _formhostpath(args, hosts, all_hosts):
     path = []
@@ -79,7 +155,7 @@ def _unpack_args(item_f, src_queue, link, args):
             raise ValueError('Insufficient arguments')
     return item_f, src_queue, item_id , args, link
 
-####### EXPOSED METHODS #######
+####### EXPOSED METHODS AND CLASSES #######
 def enqueue(trg_queue, item_f, *args, **kwargs):
     '''Enqueue the contents of a file, or file-like object, file-descriptor or
        the contents of a file at an address (e.g. '/my/file') queue with
@@ -94,11 +170,20 @@ def senqueue(trg_queue, item_s, *args, **kwargs):
     '''
     return vsenqueue(trg_queue, item_s, args, **kwargs)
 
-def venqueue(trg_queue, item_f, args, user=None, group=None, mode=None):
+def venqueue(trg_queue, item_f, args, user=None, group=None, mode=None,
+             codec=None, not_before=None):
     '''Enqueue the contents of a file, or file-like object, file-descriptor or
        the contents of a file at an address (e.g. '/my/file') queue with
        an argument list, venqueue is to enqueue what vprintf is to printf
 
+       The contents are compressed with codec (default: the queue's codec,
+       see: set_codec; False, not compressed).
+
+       With not_before (a datetime, or seconds since the epoch), the item
+       may not be worked before that time: it is kept in the queue's delay
+       directory, where scans never see it, until it is promoted (see:
+       promote, scand).
+
        If entropy is passed in, failure on duplicates is raised to the caller,
        if entropy is not passed in, venqueue will increment entropy until it
        can create the queue item.
@@ -108,11 +193,14 @@ def venqueue(trg_queue, item_f, args, user=None, group=None, mode=None):
     user = _c.FSQ_ITEM_USER if user is None else user
     group = _c.FSQ_ITEM_GROUP if group is None else group
     mode = _c.FSQ_ITEM_MODE if mode is None else mode
-    now = fmt_time(datetime.datetime.now(), _c.FSQ_TIMEFMT, _c.FSQ_CHARSET)
-    pid = coerce_unicode(os.getpid(), _c.FSQ_CHARSET)
-    host = coerce_unicode(_HOSTNAME, _c.FSQ_CHARSET)
+    codec = get_codec(trg_queue) if codec is None else codec or None
+    now, entropy, pid, host = mkid(_c.FSQ_TIMEFMT, _c.FSQ_CHARSET)
+    # not before now is now
+    if not_before is not None:
+        not_before = _epoch(not_before)
+        if not_before <= time.time():
+            not_before = None
     tries = u'0'
-    entropy = _mkentropy(pid, now, host)
 
     # open source file
     try:
@@ -120,13 +208,23 @@ def venqueue(trg_queue, item_f, args, user=None, group=None, mode=None):
     except (OSError, IOError, ), e:
         raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
     try:
-        real_file = True if hasattr(src_file, 'fileno') else False
         # get low, so we can use some handy options; man 2 open
         try:
             item_name = construct(( now, entropy, pid, host,
                                     tries, ) + tuple(args))
             tmp_name = os.path.join(fsq_path.tmp(trg_queue), item_name)
-            trg_fd = os.open(tmp_name, os.O_WRONLY|os.O_CREAT|os.O_EXCL, mode)
+            if _c.FSQ_TMPFILE and not_before is None:
+                # an anonymous file in the queue's file-system, never in tmp
+                try:
+                    trg_fd = open_tmpfile(fsq_path.queue(trg_queue),
+                                          os.O_WRONLY, mode)
+                    tmp_name = None
+                except OSError, e:
+                    if e.errno != errno.ENOSYS:
+                        raise e
+            if trg_fd is None:
+                trg_fd = os.open(tmp_name, os.O_WRONLY|os.O_CREAT|os.O_EXCL,
+                                 mode)
         except (OSError, IOError, ), e:
             if isinstance(e, FSQError):
                 raise e
@@ -135,35 +233,31 @@ def venqueue(trg_queue, item_f, args, user=None, group=None, mode=None):
             if user is not None or group is not None:
                 # set user/group ownership for file; man 2 fchown
                 os.fchown(trg_fd, *uid_gid(user, group, fd=trg_fd))
-            with closing(os.fdopen(trg_fd, 'wb', 1)) as trg_file:
-                # i/o time ... assume line-buffered
-                while True:
-                    if real_file:
-                        reads, dis, card = select.select([src_file], [], [])
-                        try:
-                            msg = os.read(reads[0].fileno(), 2048)
-                            if 0 == len(msg):
-                                break
-                        except (OSError, IOError, ), e:
-                            if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN,):
-                                continue
-                            raise e
-                        trg_file.write(msg)
-                    else:
-                        line = src_file.readline()
-                        if not line:
-                            break
-                        trg_file.write(line)
-
-                # flush buffers, and force write to disk pre mv.
-                trg_file.flush()
-                os.fsync(trg_file.fileno())
-
-                # hard-link into queue, unlink tmp, failure case here leaves
-                # cruft in tmp, but no race condition into queue
-                os.link(tmp_name, os.path.join(fsq_path.item(trg_queue,
-                                                            item_name)))
-                os.unlink(tmp_name)
+            with closing(os.fdopen(trg_fd, 'wb')) as trg_file:
+                # i/o time ... in the kernel, where we can
+                copy_payload(src_file, ( trg_fd, ), ( codec, ))
+
+                # force write to disk pre mv, per FSQ_DURABILITY
+                sync_files(( trg_fd, ))
+
+                if not_before is not None:
+                    # mv into the delay bucket, as fail_tmp backs off
+                    sync_dirs(_delay(tmp_name, trg_queue, item_name,
+                                     not_before), fsq_path.tmp(trg_queue))
+                elif tmp_name is None:
+                    # one link into queue, the anonymous file leaves no
+                    # cruft on failure
+                    link_tmpfile(trg_fd, fsq_path.item(trg_queue,
+                                 item_name).encode(_c.FSQ_CHARSET))
+                    sync_dirs(fsq_path.queue(trg_queue))
+                else:
+                    # hard-link into queue, unlink tmp, failure case here
+                    # leaves cruft in tmp, but no race condition into queue
+                    os.link(tmp_name, os.path.join(fsq_path.item(trg_queue,
+                                                                item_name)))
+                    os.unlink(tmp_name)
+                    sync_dirs(fsq_path.queue(trg_queue),
+                              fsq_path.tmp(trg_queue))
 
                 # return the queue item id (filename)
                 return item_name
@@ -212,6 +306,75 @@ def vsenqueue(trg_queue, item_s, args, **kwargs):
 
     return venqueue(trg_queue, StringIO(item_s), args, **kwargs)
 
+def venqueue_many(trg_queue, items, user=None, group=None, mode=None,
+                  codec=None):
+    '''Enqueue many items to a queue, each item is an ( item_f, args, ) pair,
+       as would be passed to venqueue; returns the list of item ids
+       enqueued.  The tmp and queue directories are opened once, and are
+       synced once, per FSQ_DURABILITY, when the batch is done.  Contents
+       are compressed as venqueue compresses them.
+
+       Should an item fail, items before it remain enqueued.
+    '''
+    user = _c.FSQ_ITEM_USER if user is None else user
+    group = _c.FSQ_ITEM_GROUP if group is None else group
+    mode = _c.FSQ_ITEM_MODE if mode is None else mode
+    codec = get_codec(trg_queue) if codec is None else codec or None
+    tries = u'0'
+    tmp_dir = fsq_path.tmp(trg_queue)
+    queue_dir = fsq_path.queue(trg_queue)
+    item_ids = []
+    dir_fds = []
+    try:
+        try:
+            load_at()
+            for d in ( tmp_dir, queue_dir, ):
+                dir_fds.append(os.open(d, os.O_RDONLY))
+        except (OSError, IOError, ), e:
+            if isinstance(e, FSQError):
+                raise e
+            elif e.errno != errno.ENOSYS:
+                raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
+        for item_f, args in items:
+            item_name = construct(mkid(_c.FSQ_TIMEFMT, _c.FSQ_CHARSET) +\
+                                  ( tries, ) + tuple(args))
+            try:
+                src_file = rationalize_file(item_f, _c.FSQ_CHARSET)
+            except (OSError, IOError, ), e:
+                raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
+            try:
+                item_ids.append(_enqueue_at(src_file, item_name, tmp_dir,
+                                            queue_dir, dir_fds, user, group,
+                                            mode, codec))
+            finally:
+                src_file.close()
+        return item_ids
+    finally:
+        try:
+            if item_ids:
+                sync_dirs(queue_dir, tmp_dir)
+        finally:
+            for dir_fd in dir_fds:
+                os.close(dir_fd)
+
+def vsenqueue_many(trg_queue, items, **kwargs):
+    '''Enqueue many strings to a queue, each item is an ( item_s, args, )
+       pair, vsenqueue_many is to venqueue_many what vsenqueue is to
+       venqueue.
+    '''
+    charset = kwargs.pop('charset', _c.FSQ_CHARSET)
+    def _items():
+        for item_s, args in items:
+            if isinstance(item_s, unicode):
+                try:
+                    item_s = item_s.encode(charset)
+                except UnicodeEncodeError:
+                    raise FSQCoerceError(errno.EINVAL, u'cannot encode item'\
+                                         u' with charset {0}'.format(charset))
+            yield StringIO(item_s), args
+
+    return venqueue_many(trg_queue, _items(), **kwargs)
+
 def reenqueue(item_f, *args, **kwargs):
     '''Enqueue the contents of a file, or file-like object, FSQWorkItem,
        file-descriptor or the contents of a files queues at an address
@@ -239,14 +402,29 @@ def vreenqueue(item_f, *args, **kwargs):
             vreenqueue(FSQWorkItem, [trg_queue, ...], link=, kwargs)
             vreenqueue(fileish, file_name, [trg_queue, ...], kwargs)
             vreenqueue(fd, file_name, [trg_queue, ...], kwargs)
+       The source is read once, and each copy is fsync'ed once before it is
+       linked into its queue; with parallel_fsync=True, copies are fsync'ed
+       concurrently, one thread per target queue.  Copies are compressed
+       with the codec of their target queue, compressed sources are copied
+       as they are stored.  With dedup=True (default: FSQ_DEDUP), one copy
+       per codec is stored in the blob store, and hard-linked into each
+       target queue (see: fsq.blobs).
     '''
     item_id = None
+    # an item claimed by rename is linked from its worker's claimed directory
+    src_worker = getattr(item_f, 'worker', None)
     src_queue = kwargs.pop('src_queue', None)
     link = kwargs.pop('link', False)
     hosts = kwargs.pop('hosts', None)
     all_hosts = kwargs.pop('all_hosts', False)
+    parallel_fsync = kwargs.pop('parallel_fsync', False)
+    dedup = kwargs.pop('dedup', None)
+    dedup = _c.FSQ_DEDUP if dedup is None else dedup
     item_f, src_queue, item_id, args, link = _unpack_args(item_f, src_queue,
                                                           link, args)
+    if isinstance(item_f, FSQCodecReader):
+        # copy the payload as stored, compressed, rather than as read
+        item_f = item_f.name
     if 1 < len(args):
         raise ValueError('Too many arguements')
     try:
@@ -270,7 +448,8 @@ def vreenqueue(item_f, *args, **kwargs):
             # hard link directly to tmp
             try:
                 try:
-                    os.link(fsq_path.item(src_queue, item_id), tmp_name)
+                    os.link(fsq_path.item(src_queue, item_id,
+                                          worker=src_worker), tmp_name)
                 except (OSError, IOError, ), e:
                     if not e.errno == errno.EEXIST:
                         raise FSQReenqueueError(e.errno, wrap_io_os_err(e))
@@ -283,8 +462,12 @@ def vreenqueue(item_f, *args, **kwargs):
                             raise FSQReenqueueError(e.errno, wrap_io_os_err(e))
             finally:
                 os.unlink(tmp_name)
+            sync_dirs(fsq_path.tmp(src_queue), *[ fsq_path.queue(queue,
+                      host=host) for queue, host in paths ])
+        elif dedup:
+            _reenqueue_blobs(src_file, item_id, paths)
         else:
-            tmp_fos = []
+            tmp_fds = []
             try:
                 for queue, host in paths:
                     try:
@@ -292,31 +475,20 @@ def vreenqueue(item_f, *args, **kwargs):
                                                              item_id)
                         tmp_names.append(tmp_name)
                         # copy to n trg_queues
-                        tmp_fo = os.open(tmp_name, os.O_RDWR|os.O_CREAT|\
-                                               os.O_TRUNC, _c.FSQ_ITEM_MODE)
-                        tmp_fos.append(os.fdopen(tmp_fo, 'wb', 1))
+                        tmp_fds.append(os.open(tmp_name, os.O_WRONLY|\
+                                       os.O_CREAT|os.O_TRUNC,
+                                       _c.FSQ_ITEM_MODE))
                     except Exception, e:
                         raise FSQReenqueueError(wrap_io_os_err(e))
-                real_file = True if hasattr(src_file, 'fileno') else False
-                # read src_file once
-                while True:
-                    if real_file:
-                        reads, dis, card = select.select([src_file], [], [])
-                        try:
-                            chunk = os.read(reads[0].fileno(), 2048)
-                        except (OSError, IOError, ), e:
-                            if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN,):
-                                continue
-                            raise
-                    else:
-                        chunk = src_file.readline()
-                    if 0 == len(chunk):
-                        break
-                    for tmp_fo in tmp_fos:
-                        tmp_fo.write(chunk)
-                        # flush buffers, and force write to disk pre mv.
-                        tmp_fo.flush()
-                        os.fsync(tmp_fo.fileno())
+                # read src_file once, write to all tmp files, then force each
+                # tmp file to disk once, pre mv, per FSQ_DURABILITY
+                codecs = {}
+                for queue, host in paths:
+                    if queue not in codecs:
+                        codecs[queue] = get_codec(queue)
+                copy_payload(src_file, tmp_fds, [ codecs[queue] for queue,\
+                             host in paths ])
+                sync_files(tmp_fds, parallel=parallel_fsync)
                 for queue, host in paths:
                     tmp_name = os.path.join(fsq_path.tmp(queue, host=host),
                                                          item_id)
@@ -330,9 +502,12 @@ def vreenqueue(item_f, *args, **kwargs):
                             raise FSQReenqueueError(e.errno, wrap_io_os_err(e))
                     finally:
                         os.unlink(tmp_name)
+                for queue, host in paths:
+                    sync_dirs(fsq_path.queue(queue, host=host),
+                              fsq_path.tmp(queue, host=host))
             finally:
-                for tmp_fo in tmp_fos:
-                    tmp_fo.close()
+                for tmp_fd in tmp_fds:
+                    os.close(tmp_fd)
         return item_id
     except Exception, e:
         try:
@@ -393,3 +568,178 @@ def vsreenqueue(item_id, item_s, args, **kwargs):
                                  u' charset {0}'.format(charset))
 
     return vreenqueue(StringIO(item_s), item_id, args, **kwargs)
+
+class FSQEnqueueItem(object):
+    '''A Streamable Enqueue object, the contents of the item are written
+       directly to a tmp file of the first queue (or an anonymous file, per
+       FSQ_TMPFILE) as they are produced, compressed with codec (default:
+       the codec of the first queue, see: set_codec; False, not compressed).
+       On commit, the file is forced to disk per FSQ_DURABILITY, and linked
+       into each queue: copied only into queues on another file-system, or
+       which compress payloads it does not, e.g.
+
+        foo = FSQEnqueueItem('foo', 'bar', 'baz', 'bang')
+        try:
+            for i in ['a', 'b', 'c']:
+                foo.item.write(i)
+            foo.commit()
+        except Exception, e:
+            foo.abort()
+        finally:
+            del foo
+
+       or, committing on success, and aborting on exception:
+
+        with FSQEnqueueItem(['foo', 'bar'], 'baz', 'bang') as foo:
+            for i in ['a', 'b', 'c']:
+                foo.item.write(i)
+
+       trg_queue may be a queue, or a list of queues; with hosts (or
+       all_hosts=True) the item is enqueued to host queues, as reenqueue.
+       Items enqueued to several queues by link share an inode.'''
+    ####### MAGICAL METHODS AND ATTRS #######
+    def __init__(self, trg_queue, *args, **kwargs):
+        self.item = self._fd = self._tmp_name = None
+        user = kwargs.pop('user', None)
+        group = kwargs.pop('group', None)
+        mode = kwargs.pop('mode', None)
+        hosts = kwargs.pop('hosts', None)
+        all_hosts = kwargs.pop('all_hosts', False)
+        codec = kwargs.pop('codec', None)
+        if kwargs:
+            raise TypeError(u'unexpected keyword arguments: {0}'.format(
+                            u', '.join(kwargs.keys())))
+        self.user = _c.FSQ_ITEM_USER if user is None else user
+        self.group = _c.FSQ_ITEM_GROUP if group is None else group
+        self.mode = _c.FSQ_ITEM_MODE if mode is None else mode
+
+        # ( queue, host, ) for each target, as reenqueue
+        trg_queues = [ trg_queue ] if isinstance(trg_queue, basestring)\
+                         else list(trg_queue)
+        if not trg_queues:
+            raise ValueError(u'Insufficient arguments')
+        self.targets = _formhostpath(trg_queues, hosts, all_hosts)
+        self.id = construct(mkid(_c.FSQ_TIMEFMT, _c.FSQ_CHARSET) +\
+                            ( u'0', ) + tuple(args))
+        queue, host = self.targets[0]
+        self.codec = get_codec(queue) if codec is None else codec or None
+        try:
+            if _c.FSQ_TMPFILE:
+                # an anonymous file in the queue's file-system, never in tmp
+                try:
+                    self._fd = open_tmpfile(fsq_path.queue(queue, host=host),
+                                            os.O_RDWR, self.mode)
+                except OSError, e:
+                    if e.errno != errno.ENOSYS:
+                        raise e
+            if self._fd is None:
+                tmp_name = os.path.join(fsq_path.tmp(queue, host=host),
+                                        self.id)
+                self._fd = os.open(tmp_name, os.O_RDWR|os.O_CREAT|os.O_EXCL,
+                                   self.mode)
+                self._tmp_name = tmp_name
+            if self.user is not None or self.group is not None:
+                os.fchown(self._fd, *uid_gid(self.user, self.group,
+                                             fd=self._fd))
+            self.item = os.fdopen(os.dup(self._fd), 'wb')
+            if self.codec is not None:
+                self.item = FSQCodecWriter(self.item, self.codec)
+        except Exception, e:
+            self.abort()
+            if isinstance(e, (OSError, IOError, )) and\
+                    not isinstance(e, FSQError):
+                raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
+            raise e
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        '''Commit on success, abort on exception'''
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def __del__(self):
+        '''An item neither committed nor aborted is aborted when the ref
+           count drops to 0'''
+        self.abort()
+
+    def _link(self, trg_path):
+        '''Link the item at trg_path'''
+        if self._tmp_name is None:
+            link_tmpfile(self._fd, trg_path.encode(_c.FSQ_CHARSET))
+        else:
+            os.link(self._tmp_name, trg_path)
+
+    ####### EXPOSED METHODS AND ATTRS #######
+    def commit(self):
+        '''Enqueue the item into each target queue, and close it; returns
+           the item id'''
+        if self.item is None:
+            raise FSQEnqueueError(errno.EINVAL, u'item is not open for'\
+                                  u' commit: {0}'.format(self.id))
+        try:
+            item, self.item = self.item, None
+            item.close()
+            sync_files(( self._fd, ))
+            dirs = []
+            copies = []
+            for queue, host in self.targets:
+                queue_dir = fsq_path.queue(queue, host=host)
+                codec = get_codec(queue)
+                # payloads compressed are read as such, whatever the codec
+                #  of the queue; uncompressed payloads are compressed
+                if self.codec is None and codec is not None:
+                    copies.append(( queue, host, codec, ))
+                    continue
+                try:
+                    self._link(os.path.join(queue_dir, self.id))
+                except (OSError, IOError, ), e:
+                    if e.errno != errno.EXDEV:
+                        raise e
+                    copies.append(( queue, host, codec, ))
+                    continue
+                dirs.append(queue_dir)
+            if copies:
+                with os.fdopen(os.dup(self._fd), 'rb') as src_file:
+                    for queue, host, codec in copies:
+                        src_file.seek(0)
+                        tmp_dir = fsq_path.tmp(queue, host=host)
+                        queue_dir = fsq_path.queue(queue, host=host)
+                        _enqueue_at(src_file, self.id, tmp_dir, queue_dir, (),
+                                    self.user, self.group, self.mode, codec)
+                        dirs.extend(( queue_dir, tmp_dir, ))
+            if self._tmp_name is not None:
+                os.unlink(self._tmp_name)
+                dirs.append(os.path.dirname(self._tmp_name))
+                self._tmp_name = None
+            sync_dirs(*dirs)
+            return self.id
+        except Exception, e:
+            if isinstance(e, (OSError, IOError, )) and\
+                    not isinstance(e, FSQError):
+                raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
+            raise e
+        finally:
+            self.abort()
+
+    def abort(self):
+        '''Close the item, discarding its contents, should it not have been
+           committed'''
+        item, self.item = getattr(self, 'item', None), None
+        fd, self._fd = getattr(self, '_fd', None), None
+        tmp_name, self._tmp_name = getattr(self, '_tmp_name', None), None
+        try:
+            if item is not None:
+                item.close()
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if tmp_name is not None:
+                try:
+                    os.unlink(tmp_name)
+                except (OSError, IOError, ), e:
+                    if e.errno != errno.ENOENT:
+                        raise FSQEnqueueError(e.errno, wrap_io_os_err(e))
@@ -96,3 +96,17 @@ class FSQReenqueueError(FSQError):
 class FSQPushError(FSQError):
     '''An error occured while push and item to a remote server'''
 
+class FSQWatchError(FSQError):
+    '''An error occured while waiting for new work in a queue'''
+
+class FSQCodecError(FSQError):
+    '''An error occured while compressing or decompressing a payload'''
+
+class FSQBlobError(FSQError):
+    '''An error occured while storing, or collecting, a payload blob'''
+
+class FSQClaimError(FSQError):
+    '''An error occured while claiming, or reaping, a work-item by rename'''
+
+class FSQDelayError(FSQError):
+    '''An error occured while delaying, or promoting, a work-item'''
@@ -5,12 +5,18 @@
 #
 # This software is for POSIX compliant systems only.
 import os
+import sys
 import errno
 import fcntl
+import select
+import stat
 import pwd
 import grp
 import datetime
 import numbers
+import threading
+import socket
+import itertools
 
 from . import FSQCoerceError, FSQEncodeError, FSQEnvError, FSQTimeFmtError,\
               FSQCannotLockError, FSQMaxTriesError, FSQTTLExpiredError
@@ -18,6 +24,31 @@ from . import FSQCoerceError, FSQEncodeError, FSQEnvError, FSQTimeFmtError,\
 ####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
 # additional types to coerce to unicode, beyond decodable types
 _COERCE_THESE_TOO = (numbers.Real,)
+# validated (delimiter, encodeseq, ) by (delimiter, encodeseq, charset, )
+_DELIMITER_ENCODESEQ = {}
+# ( libc, ctypes, ), loaded on first use, False if unavailable
+_LIBC = None
+# ( libc, ctypes, ), once *at(2) functions are prototyped
+_AT = None
+# size of reads, for copies we cannot do in the kernel
+_COPY_BUFSIZE = 1024*1024
+# max bytes per sendfile(2) or splice(2)
+_KERNEL_COPY_MAX = 1024*1024*1024
+# splice(2) flags: SPLICE_F_MOVE
+_SPLICE_F_MOVE = 1
+# open(2) and linkat(2) flags for anonymous files, linked in by way of
+#  /proc/self/fd/<fd>: O_TMPFILE, AT_FDCWD, AT_SYMLINK_FOLLOW
+_O_TMPFILE = getattr(os, 'O_TMPFILE', 020000000|getattr(os, 'O_DIRECTORY', 0))
+_AT_FDCWD = -100
+_AT_SYMLINK_FOLLOW = 0x400
+_TMPFILE = sys.platform.startswith('linux') and os.path.isdir('/proc/self/fd')
+_HOSTNAME = socket.gethostname()
+# ( pid, timefmt, charset, tick, now, pid, host, entropy, ) for the latest
+#  tick in which an id was made, see: mkid
+_ID_TICK = None
+# lock for installing a new tick, by pid, so that a child never waits on a
+#  lock held by a parent thread at fork
+_ID_LOCKS = {}
 
 # locking convenience wrapper
 def _lock(fd, lock=False):
@@ -31,6 +62,67 @@ def _lock(fd, lock=False):
             raise FSQCannotLockError(e.errno, u'cannot lock')
         raise e
 
+def _kernel_copy(src_fd, trg_fd, offset, count):
+    '''Copy up to count bytes from src_fd to trg_fd in the kernel: with
+       sendfile(2) from offset (None, the file offset) for regular files,
+       else with splice(2); returns the number of bytes copied, 0 at EOF.
+       Raises OSError with ENOSYS or EINVAL should neither be supported.'''
+    libc, ctypes = load_libc()
+    try:
+        if offset is not None:
+            off = ctypes.c_int64(offset)
+            sent = libc.sendfile64(trg_fd, src_fd, ctypes.byref(off), count)
+        else:
+            sent = libc.splice(src_fd, None, trg_fd, None, count,
+                               _SPLICE_F_MOVE)
+    except AttributeError:
+        raise OSError(errno.ENOSYS, u'sendfile or splice is not available')
+    if 0 > sent:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return sent
+
+def _at_ret(ctypes, ret, name):
+    '''Raise OSError from errno, should a call to libc have failed'''
+    if 0 > ret:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err), name)
+    return ret
+
+def _write(trg_fd, buf):
+    '''os.write all of buf, retrying short writes'''
+    buf = buffer(buf)
+    while buf:
+        buf = buffer(buf, os.write(trg_fd, buf))
+
+def _mkdir(path, mode, user, group):
+    '''mkdir, as install would, should path not exist'''
+    try:
+        os.mkdir(path, mode)
+    except (OSError, IOError, ), e:
+        if e.errno != errno.EEXIST:
+            raise e
+        return
+    uid, gid = uid_gid(user, group)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fchmod(fd, mode)
+        if -1 != uid or -1 != gid:
+            os.fchown(fd, uid, gid)
+    finally:
+        os.close(fd)
+
+def _read(src_fd, bufsize):
+    '''os.read, waiting for non-blocking fds to become readable'''
+    while True:
+        try:
+            return os.read(src_fd, bufsize)
+        except (OSError, IOError, ), e:
+            if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN, ):
+                select.select([src_fd], [], [])
+            elif e.errno != errno.EINTR:
+                raise e
+
 ####### EXPOSED METHODS #######
 def coerce_unicode(s, charset):
     if isinstance(s, unicode):
@@ -51,6 +143,12 @@ def coerce_unicode(s, charset):
 def delimiter_encodeseq(delimiter, encodeseq, charset):
     '''Coerce delimiter and encodeseq to unicode and verify that they are not
        the same'''
+    # validated once per (delimiter, encodeseq, charset)
+    try:
+        return _DELIMITER_ENCODESEQ[(delimiter, encodeseq, charset, )]
+    except (KeyError, TypeError, ):
+        pass
+    key = ( delimiter, encodeseq, charset, )
     delimiter = coerce_unicode(delimiter, charset)
     encodeseq = coerce_unicode(encodeseq, charset)
     if 1 != len(encodeseq):
@@ -71,6 +169,8 @@ def delimiter_encodeseq(delimiter, encodeseq, charset):
     except UnicodeEncodeError:
         raise FSQEncodeError(errno.EINVAL, u'encodeseq must be ascii')
 
+    if isinstance(key[0], unicode) and isinstance(key[1], unicode):
+        _DELIMITER_ENCODESEQ[key] = ( delimiter, encodeseq, )
     return delimiter, encodeseq
 
 def uid_gid(user, group, fd=None, path=None):
@@ -153,6 +253,209 @@ def rationalize_file(item_f, charset, mode='rb', lock=False):
         f.close()
         raise e
 
+def load_libc():
+    '''Returns ( libc, ctypes, ) for calls to libc not wrapped by os, raises
+       OSError with ENOSYS should ctypes or libc be unavailable'''
+    global _LIBC
+    if _LIBC is None:
+        _LIBC = False
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            _LIBC = ( libc, ctypes, )
+        except (ImportError, OSError, ):
+            pass
+    if not _LIBC:
+        raise OSError(errno.ENOSYS, u'libc is not available')
+    return _LIBC
+
+def load_at():
+    '''Returns ( libc, ctypes, ) once openat(2), linkat(2) and unlinkat(2)
+       are prototyped, raises OSError with ENOSYS should any be
+       unavailable'''
+    global _AT
+    if _AT is None:
+        _AT = False
+        try:
+            libc, ctypes = load_libc()
+            libc.openat.argtypes = [ ctypes.c_int, ctypes.c_char_p,
+                                     ctypes.c_int, ctypes.c_uint ]
+            libc.linkat.argtypes = [ ctypes.c_int, ctypes.c_char_p,
+                                     ctypes.c_int, ctypes.c_char_p,
+                                     ctypes.c_int ]
+            libc.unlinkat.argtypes = [ ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_int ]
+            _AT = ( libc, ctypes, )
+        except (OSError, AttributeError, ):
+            pass
+    if not _AT:
+        raise OSError(errno.ENOSYS, u'openat, linkat or unlinkat is not'\
+                      u' available')
+    return _AT
+
+def openat(dir_fd, name, flags, mode=0777):
+    '''os.open for name (a byte-string) relative to the directory dir_fd'''
+    libc, ctypes = load_at()
+    return _at_ret(ctypes, libc.openat(dir_fd, name, flags, mode), name)
+
+def linkat(src_dir_fd, src, trg_dir_fd, trg, flags=0):
+    '''os.link for src and trg (byte-strings) relative to the directories
+       src_dir_fd and trg_dir_fd'''
+    libc, ctypes = load_at()
+    _at_ret(ctypes, libc.linkat(src_dir_fd, src, trg_dir_fd, trg, flags),
+            trg)
+
+def open_tmpfile(dir_path, flags, mode=0777):
+    '''os.open an anonymous file (O_TMPFILE) on the file-system of dir_path,
+       to be linked into dir_path with link_tmpfile; raises OSError with
+       ENOSYS should the platform, kernel or file-system not support it'''
+    if not _TMPFILE:
+        raise OSError(errno.ENOSYS, u'O_TMPFILE is not available')
+    load_at()
+    try:
+        return os.open(dir_path, _O_TMPFILE|flags, mode)
+    except (OSError, IOError, ), e:
+        # kernels without O_TMPFILE see O_DIRECTORY, and fail with EISDIR
+        if e.errno in (errno.EINVAL, errno.EISDIR, errno.EOPNOTSUPP, ):
+            raise OSError(errno.ENOSYS, u'O_TMPFILE is not supported:'\
+                          u' {0}'.format(os.strerror(e.errno)), dir_path)
+        raise e
+
+def link_tmpfile(fd, path):
+    '''Link an anonymous file opened by open_tmpfile at path (a
+       byte-string), fails with EEXIST should path exist'''
+    linkat(_AT_FDCWD, '/proc/self/fd/{0}'.format(fd), _AT_FDCWD, path,
+           _AT_SYMLINK_FOLLOW)
+
+def unlinkat(dir_fd, name):
+    '''os.unlink for name (a byte-string) relative to the directory
+       dir_fd'''
+    libc, ctypes = load_at()
+    _at_ret(ctypes, libc.unlinkat(dir_fd, name, 0), name)
+
+def copy_file(src_file, trg_fds, bufsize=_COPY_BUFSIZE):
+    '''Copy the remaining contents of src_file (as returned by
+       rationalize_file) to each fd in trg_fds.  Copies are done in the
+       kernel where we can -- sendfile(2) from regular files, splice(2) from
+       pipes to a single target -- else by way of large reads, from which
+       each read is written to every target.  Returns the number of bytes
+       copied to each target.'''
+    copied = 0
+    if not hasattr(src_file, 'fileno'):
+        # StringIO, cStringIO, etc ...
+        read = src_file.read if hasattr(src_file, 'read') else\
+                   lambda size: src_file.readline()
+        while True:
+            buf = read(bufsize)
+            if not buf:
+                return copied
+            # as file.write would, coerce unicode with the default codec
+            if isinstance(buf, unicode):
+                buf = str(buf)
+            for trg_fd in trg_fds:
+                _write(trg_fd, buf)
+            copied += len(buf)
+
+    src_fd = src_file.fileno()
+    mode = os.fstat(src_fd).st_mode
+    if stat.S_ISREG(mode) or ( stat.S_ISFIFO(mode) and 1 == len(trg_fds) ):
+        start = os.lseek(src_fd, 0, os.SEEK_CUR) if stat.S_ISREG(mode)\
+                    else None
+        try:
+            for trg_fd in trg_fds:
+                copied = 0
+                while True:
+                    try:
+                        sent = _kernel_copy(src_fd, trg_fd, None if start\
+                                            is None else start + copied,
+                                            _KERNEL_COPY_MAX)
+                    except (OSError, IOError, ), e:
+                        if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN, ):
+                            select.select([src_fd], [], [])
+                            continue
+                        elif e.errno == errno.EINTR:
+                            continue
+                        raise e
+                    if not sent:
+                        break
+                    copied += sent
+            if start is not None:
+                os.lseek(src_fd, start + copied, os.SEEK_SET)
+            return copied
+        except (OSError, IOError, ), e:
+            # unsupported by kernel, libc or file-system, fall through to
+            #  read, but only if we've yet to copy anything
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, ) or copied or\
+                    trg_fds.index(trg_fd):
+                raise e
+
+    while True:
+        buf = _read(src_fd, bufsize)
+        if not buf:
+            return copied
+        for trg_fd in trg_fds:
+            _write(trg_fd, buf)
+        copied += len(buf)
+
+def fsync_fds(fds, parallel=False):
+    '''fsync(2) each fd in fds once; if parallel, each fsync is made in its
+       own thread, so that the flushes to disk overlap.  Raises the first
+       error encountered, after all fsyncs have completed.'''
+    if not parallel or 2 > len(fds):
+        for fd in fds:
+            os.fsync(fd)
+        return
+    errs = []
+    def fsync(fd):
+        try:
+            os.fsync(fd)
+        except (OSError, IOError, ), e:
+            errs.append(e)
+    threads = [ threading.Thread(target=fsync, args=(fd,)) for fd in fds ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errs:
+        raise errs[0]
+
+def _tick(timefmt):
+    '''The current time, truncated to the resolution of timefmt'''
+    now = datetime.datetime.now()
+    return now if u'%f' in timefmt else now.replace(microsecond=0)
+
+def mkid(timefmt, charset):
+    '''Make the leading fields of a new item id, ( now, entropy, pid, host, ),
+       unique across threads, and following fork.
+
+       The formatted time is cached for each tick of timefmt (per second, or
+       per microsecond should timefmt contain %f), and entropy counts the
+       ids made within a tick -- without a lock, but to install a new tick.
+       Should a thread find a newer tick installed than its own, it takes
+       the newer tick, so that ids are never made in a tick already left.'''
+    global _ID_TICK
+    pid = os.getpid()
+    tick = _tick(timefmt)
+    cached = _ID_TICK
+    if cached is None or cached[:4] != ( pid, timefmt, charset, tick, ):
+        lock = _ID_LOCKS.get(pid)
+        if lock is None:
+            lock = _ID_LOCKS.setdefault(pid, threading.Lock())
+        with lock:
+            cached = _ID_TICK
+            if cached is None or cached[:3] != ( pid, timefmt, charset, )\
+                    or cached[3] < tick:
+                cached = ( pid, timefmt, charset, tick,
+                           fmt_time(tick, timefmt, charset),
+                           coerce_unicode(pid, charset),
+                           coerce_unicode(_HOSTNAME, charset),
+                           itertools.count(), )
+                _ID_TICK = cached
+    now, u_pid, host, entropy = cached[4:]
+    return now, entropy.next(), u_pid, host
+
 def wrap_io_os_err(e):
     '''Formats IO and OS error messages for wrapping in FSQExceptions'''
     msg = ''
@@ -170,10 +473,24 @@ def check_ttl_max_tries(tries, enqueued_at, max_tries, ttl):
     if max_tries > 0 and tries >= max_tries:
         raise FSQMaxTriesError(errno.EINTR, u'Max tries exceded:'\
                                u' {0} ({1})'.format(max_tries, tries))
-    if ttl > 0 and datetime.datetime.now() < enqueued_at + datetime.timedelta(
+    if ttl > 0 and datetime.datetime.now() > enqueued_at + datetime.timedelta(
             seconds=ttl):
         raise FSQTTLExpiredError(errno.EINTR, u'TTL Expired:'\
                                  u' {0}'.format(ttl))
+
+def check_ttl_max_tries_raw(tries, enqueued_at, max_tries, ttl, timefmt,
+                            charset):
+    '''check_ttl_max_tries, with enqueued_at as it is in the item id, rather
+       than parsed: compared as a string to the time ttl seconds ago, as
+       timefmt sorts as time does (as scan assumes)'''
+    if max_tries > 0 and tries >= max_tries:
+        raise FSQMaxTriesError(errno.EINTR, u'Max tries exceded:'\
+                               u' {0} ({1})'.format(max_tries, tries))
+    if ttl > 0 and enqueued_at < fmt_time(datetime.datetime.now() -\
+            datetime.timedelta(seconds=ttl), timefmt, charset):
+        raise FSQTTLExpiredError(errno.EINTR, u'TTL Expired:'\
+                                 u' {0}'.format(ttl))
+
 def fmt_time(d_time, timefmt, charset):
     try:
         return coerce_unicode(d_time.strftime(timefmt), charset)
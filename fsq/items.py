@@ -2,35 +2,71 @@
 # @author: Matthew Story <matt.story@axial.net>
 # @author: Jeff Rand <jeff.rand@axial.net>
 #
-# fsq/items.py -- provides items classes for fsq: FSQItem, FSQEnqueueItem
+# fsq/items.py -- provides items classes for fsq: FSQWorkItem
 #
 #     fsq is all unicode internally, if you pass in strings,
 #     they will be explicitly coerced to unicode.
 #
 # This software is for POSIX compliant systems only.
+import os
 import errno
 import datetime
+import time
+import stat
+import tempfile
 
 from . import constants as _c, path as fsq_path, deconstruct,\
               FSQMalformedEntryError, FSQTimeFmtError, FSQWorkItemError,\
               FSQMaxTriesError, FSQTTLExpiredError, fail, success, done,\
               fail_tmp, fail_perm
-from .internal import rationalize_file, wrap_io_os_err, check_ttl_max_tries
+from .internal import rationalize_file, wrap_io_os_err,\
+                      check_ttl_max_tries_raw, copy_file
+from .codec import open_item
+from .claimed import claimed_dir
+from .durability import sync_files, sync_dirs
 
-class FSQEnqueueItem(object):
-    '''Stub for Streamable Enqueue object, e.g.
+# mtime of an item claimed by rename, leased forever
+_NEVER = 2**31 - 1
 
-        foo = FSQEnqueueItem('foo', 'bar', 'baz', 'bang')
+def _lease(path, lease):
+    '''Record the expiry of a lease of lease seconds from now (0 is
+       forever), as the mtime of path'''
+    now = time.time()
+    os.utime(path, ( now, now + lease if lease else _NEVER, ))
+
+def _own_lease(path, tmp_dir, lease):
+    '''Lease the item at path, as _lease does.  Items sharing an inode (see:
+       reenqueue, FSQ_DEDUP) share their mtime, so an item which shares its
+       inode is first replaced with a copy of its own, by way of tmp_dir.'''
+    src_fd = os.open(path, os.O_RDONLY)
+    try:
+        st = os.fstat(src_fd)
+        if 1 == st.st_nlink:
+            _lease(path, lease)
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
         try:
-            for i in ['a', 'b', 'c']:
-                foo.item.write(i)
-            foo.commit()
+            try:
+                os.fchmod(fd, stat.S_IMODE(st.st_mode))
+                if ( st.st_uid, st.st_gid, ) != os.fstat(fd)[4:6]:
+                    os.fchown(fd, st.st_uid, st.st_gid)
+                with os.fdopen(os.dup(src_fd), 'rb') as src_file:
+                    copy_file(src_file, [ fd ])
+                sync_files([ fd ])
+            finally:
+                os.close(fd)
+            _lease(tmp_path, lease)
+            os.rename(tmp_path, path)
         except Exception, e:
-            foo.abort()
-        finally:
-            del foo
-    '''
-    pass
+            try:
+                os.unlink(tmp_path)
+            except (OSError, IOError, ), err:
+                if err.errno != errno.ENOENT:
+                    raise err
+            raise e
+    finally:
+        os.close(src_fd)
+    sync_dirs(os.path.dirname(path))
 
 class FSQWorkItem(object):
     '''An FSQWorkItem object.  FSQWorkItem stores an open and potentially
@@ -43,17 +79,33 @@ class FSQWorkItem(object):
        include level functions taking a *WorkItem struct as their first
        argument.
 
+       With worker, the item is claimed by renaming it into worker's claimed
+       directory (see: fsq.claimed), rather than by locking it, should it
+       not be there already.  The claim is leased for lease seconds (default:
+       FSQ_LEASE, 0 is forever): the expiry of the lease is kept as the mtime
+       of the item, and is extended with renew.  A claimed item which shares
+       its inode with other items is given an inode of its own, so that its
+       lease is not theirs.
+
        BEWARE: If you choose not to lock, the item you are working on may be
        worked on by others, and may be moved (on failure or success) out from
        underneath you.  Should you send lock=False, it is assumed you are
        guarenteeing concurrency of 1 on the queue through some other
        mechanism.'''
+    # no per-item __dict__, so that many items may be held at once
+    __slots__ = ( 'id', 'queue', 'max_tries', 'ttl', 'lock', 'item', 'host',
+                  'worker', 'lease', 'tries', '_parsed', '_enqueued_at', )
+
     ####### MAGICAL METHODS AND ATTRS #######
     def __init__(self, trg_queue, item_id, max_tries=None, ttl=None,
-                 lock=None, no_open=False, host=None):
+                 lock=None, no_open=False, host=None, worker=None,
+                 lease=None):
         '''Construct an FSQWorkItem object from an item_id (file-name), and
            queue-name.  The lock kwarg will override the default locking
-           preference (taken from environment).'''
+           preference (taken from environment).
+
+           Only the fields needed to validate the item are parsed here, the
+           rest are parsed on first access.'''
 
         self.id = item_id
         self.queue = trg_queue
@@ -62,40 +114,34 @@ class FSQWorkItem(object):
         self.lock = _c.FSQ_LOCK if lock is None else lock
         self.item = None
         self.host = host
+        self.worker = worker
+        self.lease = _c.FSQ_LEASE if lease is None else lease
+        self._parsed = self._enqueued_at = None
 
+        if worker is not None:
+            self._claim()
         # open file immediately
         if not no_open:
             self.open()
         try:
-            self.delimiter, arguments = deconstruct(item_id)
-            try:
-                # construct datetime.datetime from enqueued_at
-                self.enqueued_at = datetime.datetime.strptime(arguments[0],
-                                                              _c.FSQ_TIMEFMT)
-                self.entropy = arguments[1]
-                self.pid = arguments[2]
-                self.hostname = arguments[3]
-                self.tries = arguments[4]
-                self.arguments = tuple(arguments[5:])
-            except IndexError, e:
+            # split, rather than deconstruct: time and tries are never
+            #  encoded
+            fields = item_id[1:].split(item_id[:1], 5)
+            if 5 > len(fields):
                 raise FSQMalformedEntryError(errno.EINVAL, u'needed at least'\
                                              u' 4 arguments to unpack, got:'\
-                                             u' {0}'.format(len(arguments)))
-            except ValueError, e:
-                raise FSQTimeFmtError(errno.EINVAL, u'invalid date string'\
-                                      u' for strptime fmt {0}:'\
-                                      u' {1}'.format(_c.FSQ_TIMEFMT,
-                                                     arguments[0]))
+                                             u' {0}'.format(len(fields)))
             try:
-                self.tries = int(self.tries)
+                self.tries = int(fields[4])
             except ValueError, e:
                 raise FSQTimeFmtError(errno.EINVAL, u'tries must be an int,'\
                                       u' not {0}: {1}'.format(
-                                        self.tries.__class__.__name__,
-                                        self.tries))
+                                        fields[4].__class__.__name__,
+                                        fields[4]))
             try:
-                check_ttl_max_tries(self.tries, self.enqueued_at,
-                                    self.max_tries, self.ttl)
+                check_ttl_max_tries_raw(self.tries, fields[0], self.max_tries,
+                                        self.ttl, _c.FSQ_TIMEFMT,
+                                        _c.FSQ_CHARSET)
             except (FSQMaxTriesError, FSQTTLExpiredError, ), e:
                 e.strerror = u': '.join([
                     e.strerror,
@@ -114,8 +160,110 @@ class FSQWorkItem(object):
         '''Always close the file when the ref count drops to 0'''
         self.close()
 
+    def _fields(self):
+        '''The delimiter and fields of the item id, deconstructed on first
+           access'''
+        if self._parsed is None:
+            self._parsed = deconstruct(self.id)
+        return self._parsed
+
 
     ####### EXPOSED METHODS AND ATTRS #######
+    @property
+    def delimiter(self):
+        return self._fields()[0]
+
+    @property
+    def enqueued_at(self):
+        '''When the item was enqueued, parsed on first access'''
+        if self._enqueued_at is None:
+            enqueued_at = self._fields()[1][0]
+            try:
+                self._enqueued_at = datetime.datetime.strptime(enqueued_at,
+                                                               _c.FSQ_TIMEFMT)
+            except ValueError, e:
+                raise FSQTimeFmtError(errno.EINVAL, u'invalid date string'\
+                                      u' for strptime fmt {0}:'\
+                                      u' {1}'.format(_c.FSQ_TIMEFMT,
+                                                     enqueued_at))
+        return self._enqueued_at
+
+    @property
+    def entropy(self):
+        return self._fields()[1][1]
+
+    @property
+    def pid(self):
+        return self._fields()[1][2]
+
+    @property
+    def hostname(self):
+        return self._fields()[1][3]
+
+    @property
+    def arguments(self):
+        return tuple(self._fields()[1][5:])
+
+    @property
+    def path(self):
+        '''Path to the item, in its queue, or in its worker's claimed
+           directory'''
+        return fsq_path.item(self.queue, self.id, host=self.host,
+                             worker=self.worker)
+
+    def _claim(self):
+        '''Rename the item from the queue into the worker's claimed
+           directory, making the directory should it not exist; raises
+           FSQWorkItemError with ENOENT should another worker have claimed
+           it'''
+        src = fsq_path.item(self.queue, self.id, host=self.host)
+        for attempt in ( 0, 1, ):
+            try:
+                # lease before rename, so the claim is never seen expired;
+                #  sweep skips claims sharing an inode until they have their
+                #  own, so these are leased once their own
+                shared = 1 != os.stat(src).st_nlink
+                if not shared:
+                    _lease(src, self.lease)
+                os.rename(src, self.path)
+            except (OSError, IOError, ), e:
+                if e.errno != errno.ENOENT:
+                    raise FSQWorkItemError(e.errno, wrap_io_os_err(e))
+            else:
+                if shared:
+                    try:
+                        _own_lease(self.path, fsq_path.tmp(self.queue,
+                                   host=self.host), self.lease)
+                    except (OSError, IOError, ), e:
+                        raise FSQWorkItemError(e.errno, wrap_io_os_err(e))
+                return
+            if os.path.exists(self.path):
+                # claimed already, by this worker
+                return
+            elif attempt or not os.path.exists(src):
+                break
+            claimed_dir(self.queue, self.worker, host=self.host)
+        raise FSQWorkItemError(errno.ENOENT, u'no such item in queue {0}:'\
+                               u' {1}'.format(self.queue, self.id))
+
+    def renew(self, lease=None):
+        '''Heartbeat: extend the lease on an item claimed by rename to lease
+           seconds (default: self.lease, 0 is forever) from now.  Raises
+           FSQWorkItemError with ENOENT should the lease have expired, and the
+           item have been swept back into the queue.'''
+        if self.worker is None:
+            raise FSQWorkItemError(errno.EINVAL, u'item is not claimed by'\
+                                   u' rename: {0}'.format(self.id))
+        try:
+            _own_lease(self.path, fsq_path.tmp(self.queue, host=self.host),
+                       self.lease if lease is None else lease)
+        except (OSError, IOError, ), e:
+            if e.errno == errno.ENOENT:
+                raise FSQWorkItemError(e.errno, u'lease expired on item in'\
+                                       u' queue {0}: {1}'.format(self.queue,
+                                                                 self.id))
+            raise FSQWorkItemError(e.errno, wrap_io_os_err(e))
+
     def close(self):
         # TODO : Why not just check to instance of file object?
         if (hasattr(self, 'item') and hasattr(self.item, 'close')
@@ -126,9 +274,9 @@ class FSQWorkItem(object):
     def open(self):
         self.close()
         try:
-            self.item = rationalize_file(fsq_path.item(self.queue, self.id,
-                                                       host=self.host),
-                                         _c.FSQ_CHARSET, lock=self.lock)
+            # compressed payloads are decompressed as they are read
+            self.item = open_item(rationalize_file(self.path,
+                                  _c.FSQ_CHARSET, lock=self.lock))
         except (OSError, IOError, ), e:
             if e.errno == errno.ENOENT:
                 raise FSQWorkItemError(e.errno, u'no such item in queue {0}:'\
@@ -147,9 +295,9 @@ class FSQWorkItem(object):
         '''Fail this item either temporarily or permanently.'''
         return fail(self, fail_type)
 
-    def fail_tmp(self):
+    def fail_tmp(self, backoff=None):
         '''Fail an item temporarily (either retry, or escalate to perm)'''
-        return fail_tmp(self)
+        return fail_tmp(self, backoff=backoff)
 
     def fail_perm(self):
         return fail_perm(self)
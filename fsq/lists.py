@@ -23,5 +23,6 @@ def hosts(trg_queue):
     return _list_dir(fsq_path.hosts(trg_queue), FSQHostsError)
 
 def queues():
-    ''' returns a tuple of queues '''
-    return _list_dir(_c.FSQ_ROOT, FSQPathError)
+    ''' returns a tuple of queues, excluding the blob store '''
+    return tuple(q for q in _list_dir(_c.FSQ_ROOT, FSQPathError)\
+                 if q != _c.FSQ_BLOBS)
@@ -3,7 +3,8 @@
 # @author: Jeff Rand <jeff.rand@axial.net>
 #
 # fsq/construct.py -- provides path construction convenience functions: tmp,
-#                     queue, done, fail, down
+#                     queue, done, fail, down, codec, blobs, blob,
+#                     claimed, delay
 #
 #     fsq is all unicode internally, if you pass in strings,
 #     they will be explicitly coerced to unicode.
@@ -67,15 +68,57 @@ def down(p_queue, host=None):
     '''Construct a path to the down file for a queue'''
     return _path(p_queue, _c.FSQ_DOWN)
 
+def codec(p_queue):
+    '''Construct a path to the codec file for a queue'''
+    return _path(p_queue, _c.FSQ_CODEC)
+
+def blobs():
+    '''Construct a path to the blob store'''
+    return _path(_c.FSQ_BLOBS)
+
+def blob_tmp():
+    '''Construct a path to the tmp dir of the blob store'''
+    return _path(_c.FSQ_BLOBS, _c.FSQ_TMP)
+
+def blob(digest):
+    '''Construct a path to a blob, by digest'''
+    return os.path.join(_path(_c.FSQ_BLOBS, digest[:2]), valid_name(digest))
+
 def hosts(p_queue):
     '''Construct a path to the hosts path for a queue'''
     return _path(p_queue, _c.FSQ_HOSTS)
 
-def item(p_queue, queue_id, host=None):
+def claimed(p_queue, worker=None, host=None):
+    '''Construct a path to the claimed dir for a queue, or to the claimed
+       dir of a worker'''
+    if host is not None:
+        p_claimed = _path(host, _c.FSQ_CLAIMED, root=hosts(p_queue))
+    else:
+        p_claimed = _path(p_queue, _c.FSQ_CLAIMED)
+    if worker is None:
+        return p_claimed
+    return os.path.join(p_claimed, valid_name(worker))
+
+def delay(p_queue, bucket=None, host=None):
+    '''Construct a path to the delay dir for a queue, or to a bucket of
+       it'''
+    if host is not None:
+        p_delay = _path(host, _c.FSQ_DELAY, root=hosts(p_queue))
+    else:
+        p_delay = _path(p_queue, _c.FSQ_DELAY)
+    if bucket is None:
+        return p_delay
+    return os.path.join(p_delay, valid_name(bucket))
+
+def item(p_queue, queue_id, host=None, worker=None):
+    if worker is not None:
+        return os.path.join(claimed(p_queue, worker, host=host),
+                            valid_name(queue_id))
     if host is not None:
         return os.path.join(_path(host, _c.FSQ_QUEUE, root=hosts(p_queue)),
                             valid_name(queue_id))
-    '''Construct a path to a queued item'''
+    '''Construct a path to a queued item (or to an item claimed by
+       worker)'''
     return os.path.join(_path(p_queue, _c.FSQ_QUEUE), valid_name(queue_id))
 
 def trigger(p_queue, trigger=_c.FSQ_TRIGGER):
@@ -16,11 +16,210 @@
 # This software is for POSIX compliant systems only.
 import os
 import errno
+import heapq
+import itertools
+import random
+import time
+import zlib
+
+# scandir reads directories lazily (os.scandir in python 3.5+, else the
+#  scandir backport, if installed), without it we fall back to listdir
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
 
 from . import constants as _c, FSQWorkItem, path as fsq_path, FSQScanError,\
               FSQCannotLockError, FSQWorkItemError, FSQDownError, FSQError,\
-              is_down, hosts as fsq_hosts, host_is_down
-from .internal import wrap_io_os_err
+              is_down, hosts as fsq_hosts, host_is_down, FSQWatchError,\
+              FSQTriggerWatcher, FSQInotifyWatcher, FSQClaimError,\
+              FSQMaxTriesError, FSQTTLExpiredError, fail_tmp
+from .internal import wrap_io_os_err, coerce_unicode
+from .watch import IN_CHANGES
+from .claimed import worker_name
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+def _scan_error(queue, e):
+    '''Translate an OSError or IOError from listing a queue to an FSQError'''
+    if isinstance(e, FSQError):
+        return e
+    elif e.errno == errno.ENOENT:
+        return FSQScanError(e.errno, u'no such queue: {0}'.format(queue))
+    return FSQScanError(e.errno, wrap_io_os_err(e))
+
+def _list(queue, host=False, hosts=None):
+    '''List the item ids in a queue (or for each of hosts), time then entropy
+       sorted, as (host, item_id, ) tuples in host mode'''
+    item_ids = []
+    try:
+        if not host and hosts is None:
+            item_ids = os.listdir(fsq_path.queue(queue))
+            item_ids.sort()
+        else:
+            if hosts is None:
+                hosts = fsq_hosts(queue)
+            for trg_host in hosts:
+                item_ids.append(( trg_host,
+                                  os.listdir(fsq_path.queue(queue, trg_host)),
+                                ))
+            item_ids = _merge_hosts(item_ids)
+    except (OSError, IOError, ), e:
+        raise _scan_error(queue, e)
+
+    return item_ids
+
+def _merge_hosts(listings):
+    '''Given (host, [item_id, ...], ) listings, lazily generate (host,
+       item_id, ) tuples, time then entropy sorted across all hosts, by way
+       of a k-way merge of each host's sorted listing'''
+    merging = []
+    for trg_host, item_ids in listings:
+        item_ids.sort()
+        merging.append(itertools.izip(item_ids, itertools.repeat(trg_host)))
+    for item_id, trg_host in heapq.merge(*merging):
+        yield trg_host, item_id
+
+def _iterdir(queue, host=None):
+    '''Iterate over the item ids in a queue (or host queue) directory, in
+       directory order, reading the directory lazily where we can'''
+    try:
+        if _scandir is None:
+            names = os.listdir(fsq_path.queue(queue, host))
+        else:
+            names = ( entry.name for entry in _scandir(fsq_path.queue(queue,
+                                                                      host)) )
+        for name in names:
+            yield name
+    except (OSError, IOError, ), e:
+        raise _scan_error(queue, e)
+
+def _untried(item_id):
+    '''The item id up to, and not including, its tries: time, entropy, pid
+       and host, which retrying an item in place (fail_tmp) does not
+       change.  Sorts as the item id does, but for tries.'''
+    end = -1
+    for i in range(5):
+        end = item_id.find(item_id[:1], end + 1)
+        if 0 > end:
+            return item_id
+    return item_id[:end + 1]
+
+def _window(queue, window, limit=None, host=False, hosts=None):
+    '''Generate the item ids in a queue (or for each of hosts), time then
+       entropy sorted, holding no more than window item ids in memory at a
+       time: each pass over the directory keeps a heap of the window oldest
+       items newer than the last item generated.  Items are compared but for
+       their tries, so that an item retried in place during the scan is not
+       generated again.  Stops after limit items (None, never).'''
+    if not host and hosts is None:
+        key = _untried
+        lister = lambda: _iterdir(queue)
+    else:
+        if hosts is None:
+            hosts = fsq_hosts(queue)
+        key = lambda x: ( _untried(x[1]), x[0], )
+        lister = lambda: ( ( trg_host, item, ) for trg_host in hosts\
+                           for item in _iterdir(queue, trg_host) )
+    last = None
+    while limit is None or 0 < limit:
+        size = window if limit is None else min(window, limit)
+        item_ids = lister()
+        if last is not None:
+            item_ids = itertools.ifilter(lambda x: last < key(x), item_ids)
+        item_ids = heapq.nsmallest(size, item_ids, key=key)
+        for item_id in item_ids:
+            yield item_id
+        if size > len(item_ids):
+            break
+        last = key(item_ids[-1])
+        if limit is not None:
+            limit -= len(item_ids)
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+def _order(worker, size):
+    '''( offset, stride, ) with which worker visits each of a window of size
+       items once: hashed from worker, should it be named, else random.  The
+       stride is coprime to size, and differs from worker to worker, so that
+       workers which meet on an item go their separate ways, rather than
+       following one another through a run of locked items.'''
+    if 2 > size:
+        return 0, 1
+    elif worker is None:
+        offset, stride = random.randrange(size), random.randrange(1, size)
+    else:
+        worker = unicode(worker).encode(_c.FSQ_CHARSET)
+        offset = (zlib.crc32(worker) & 0xffffffff) % size
+        stride = 1 + (zlib.adler32(worker) & 0xffffffff) % (size - 1)
+    while 1 != _gcd(stride, size):
+        stride -= 1
+    return offset, stride
+
+def _watcher(queue, host=False, hosts=None):
+    '''Watch a queue (or each of hosts) with inotify, if we can, else with
+       the queue trigger (which polls, should the queue have no trigger)'''
+    try:
+        watcher = FSQInotifyWatcher()
+        try:
+            if not host and hosts is None:
+                watcher.add(fsq_path.queue(queue))
+            else:
+                for trg_host in (fsq_hosts(queue) if hosts is None else hosts):
+                    watcher.add(fsq_path.queue(queue, trg_host), trg_host)
+        except FSQWatchError:
+            watcher.close()
+            raise
+        return watcher
+    except FSQWatchError:
+        return FSQTriggerWatcher(queue, trigger=_c.FSQ_HOSTS_TRIGGER if (
+                                 host or hosts is not None) else None)
+
+def _follow(queue, lister, host=False, hosts=None, rescan=None):
+    '''Generate item ids for a queue forever: first all items in the queue
+       (from lister), then each new item as it is enqueued.  When inotify is
+       available only new items are generated, and the queue is re-listed on
+       overflow, or every rescan seconds (None, never), to catch items which
+       are retried in place; otherwise the queue is re-listed each time the
+       trigger is pulled, or every rescan seconds.'''
+    host = host or hosts is not None
+    watcher = _watcher(queue, host=host, hosts=hosts)
+    try:
+        # watch before listing, so that nothing falls between the two; items
+        # enqueued as we list are both listed and watched, so skip events for
+        # items listed in this pass
+        relist = True
+        listed = set()
+        while True:
+            if relist:
+                relist = False
+                listed.clear()
+                for item_id in lister():
+                    listed.add(item_id)
+                    yield item_id
+            if not watcher.wait(rescan):
+                relist = rescan is not None
+                continue
+            if not isinstance(watcher, FSQInotifyWatcher):
+                relist = True
+                continue
+            new, relist = watcher.read()
+            if relist:
+                continue
+            # every event from before the listing finished has now been read
+            seen, listed = listed, set()
+            new.sort(key=lambda x: x[1])
+            for trg_host, item_id in new:
+                item_id = ( trg_host, item_id, ) if host else item_id
+                if item_id not in seen:
+                    yield item_id
+    finally:
+        watcher.close()
 
 ####### EXPOSED METHODS AND CLASSES #######
 class FSQScanGenerator(object):
@@ -39,22 +238,40 @@ class FSQScanGenerator(object):
        down-files, pass in None or an empty string as the kwarg ``down'', this
        functionality is useful for introspecting down'ed queues.
 
+       The state of the down-file may be cached, rather than stat'ed for each
+       item: it is re-checked after down_cache_ms milliseconds, or after
+       down_cache_items items, whichever comes first (0 is no bound, both
+       0 is strict, and stats for every item).  With down_watch, the cache
+       is also invalidated by inotify when the down-file is changed, should
+       inotify be available, in which case neither bound is required.
+
        FSQScanGenerator is intended to be a minimalist object, capable of
        reverse engineering to a C-struct.  The C-struct will be similar to FTS
        (man 3 fts).
 
+       With rename (default: FSQ_RENAME), items are claimed by renaming them
+       into a claimed directory for worker (default: worker_name()), rather
+       than by locking them (see: fsq.claimed), and are not locked, unless
+       lock is passed.  Claims are leased for lease seconds (default:
+       FSQ_LEASE, see: FSQWorkItem.renew and sweep).
+
        BEWARE: If you choose not to lock, the item you are working on may be
        worked on by others, and may be moved (on failure or success) out from
        underneath you.  Should you send lock=False, it is assumed you are
        guarenteeing concurrency of 1 on the queue through some other
        mechanism.'''
+    # class of the items generated, for subclasses generating subclasses
+    work_item = FSQWorkItem
+
     ####### MAGICAL METHODS AND ATTRS #######
     def __init__(self, queue, item_ids, lock=None, ttl=None,
                  max_tries=None, ignore_down=False, no_open=False,
-                 host=False):
-        '''Construct an FSQScanGenerator object from a list of item_ids and a
-           queue name.  The lock kwarg will override the default locking
-           preference (taken from environment).'''
+                 host=False, down_cache_ms=None, down_cache_items=None,
+                 down_watch=None, rename=None, worker=None, lease=None):
+        '''Construct an FSQScanGenerator object from a list (or any iterable,
+           e.g. a watcher generating new items as they arrive) of item_ids
+           and a queue name.  The lock kwarg will override the default
+           locking preference (taken from environment).'''
         # index of current item
         self._index = -1
 
@@ -65,11 +282,34 @@ class FSQScanGenerator(object):
 
         # list of item ids
         self.item_ids = item_ids
-        self.lock = _c.FSQ_LOCK if lock is None else lock
+        self._item_ids = iter(item_ids)
+        self.rename = _c.FSQ_RENAME if rename is None else rename
+        self.worker = None
+        if self.rename:
+            self.worker = worker_name() if worker is None else worker
+        if lock is None:
+            lock = 0 if self.rename else _c.FSQ_LOCK
+        self.lock = lock
+        self.lease = lease
         self.ttl = _c.FSQ_TTL if ttl is None else ttl
         self.max_tries = _c.FSQ_MAX_TRIES if max_tries is None else max_tries
         self.ignore_down = ignore_down
         self.no_open = no_open
+        self.down_cache_ms = _c.FSQ_DOWN_CACHE_MS if down_cache_ms is None\
+                                 else down_cache_ms
+        self.down_cache_items = _c.FSQ_DOWN_CACHE_ITEMS if down_cache_items\
+                                    is None else down_cache_items
+        self.down_watch = _c.FSQ_DOWN_WATCH if down_watch is None\
+                              else down_watch
+        # host (None for queue) -> [ is_down, checked_at, items_since, ]
+        self._down = {}
+        self._down_watcher = None
+        self._down_watched = set()
+        if self.down_watch and not self.ignore_down:
+            try:
+                self._down_watcher = FSQInotifyWatcher(mask=IN_CHANGES)
+            except FSQWatchError:
+                pass
 
     def __iter__(self):
         return self
@@ -78,33 +318,72 @@ class FSQScanGenerator(object):
         '''Always explicitely del the item to close a file if refcount = 0'''
         if hasattr(self, 'item'):
             del self.item
+        if getattr(self, '_down_watcher', None) is not None:
+            self._down_watcher.close()
+
+    def _is_down(self, host=None):
+        '''is_down, or host_is_down, cached per down_cache_ms,
+           down_cache_items and down_watch'''
+        watcher = self._down_watcher
+        if watcher is not None:
+            if host not in self._down_watched:
+                down_path = fsq_path.down(self.queue, host=host)
+                try:
+                    watcher.add(os.path.dirname(down_path), host)
+                    self._down_watched.add(host)
+                except FSQWatchError:
+                    watcher.close()
+                    watcher = self._down_watcher = None
+                    self._down.clear()
+            elif watcher.wait(0):
+                events, lost = watcher.events()
+                if lost:
+                    self._down.clear()
+                for key, name, mask, cookie in events:
+                    if name == _c.FSQ_DOWN:
+                        self._down.pop(key, None)
+
+        now = time.time()
+        cached = self._down.get(host)
+        if cached is not None and ( watcher is not None or\
+                self.down_cache_ms or self.down_cache_items ) and\
+                ( not self.down_cache_ms or\
+                  now - cached[1] < self.down_cache_ms/1000.0 ) and\
+                ( not self.down_cache_items or\
+                  cached[2] < self.down_cache_items ):
+            cached[2] += 1
+            return cached[0]
+
+        down = is_down(self.queue) if host is None else\
+                   host_is_down(self.queue, host)
+        self._down[host] = [ down, now, 1, ]
+        return down
 
     def next(self):
-        while self._index < len(self.item_ids)-1:
+        for item in self._item_ids:
             self._index += 1
             # always destroy self.item to close file if necessary
             if getattr(self, 'item', None) is not None:
                 del self.item
             if self.host:
-                host = self.item_ids[self._index][0]
-                item = self.item_ids[self._index][1]
+                host, item = item
             else:
                 host = None
-                item = self.item_ids[self._index]
-            if not self.ignore_down and is_down(self.queue) and ( not host or
-                    host_is_down(self.queue, host)):
+            if not self.ignore_down and self._is_down() and ( not host or
+                    self._is_down(host)):
                 raise FSQDownError(errno.EAGAIN, u'queue {0}: is'\
                                    u' down'.format(self.queue))
             try:
-                self.item = FSQWorkItem(self.queue,
-                                        item,
-                                        lock=self.lock, ttl=self.ttl,
-                                        max_tries=self.max_tries,
-                                        no_open=self.no_open,
-                                        host=host)
+                self.item = self.work_item(self.queue,
+                                           item,
+                                           lock=self.lock, ttl=self.ttl,
+                                           max_tries=self.max_tries,
+                                           no_open=self.no_open,
+                                           host=host, worker=self.worker,
+                                           lease=self.lease)
             except (FSQWorkItemError, FSQCannotLockError, ), e:
                 # we discard on ENOENT -- e.g. something else already did the
-                #  work
+                #  work, or claimed it
                 # or EAGAIN -- e.g. cannot lock because something else is
                 #  already doing the work
                 if e.errno == errno.EAGAIN or e.errno == errno.ENOENT:
@@ -119,33 +398,147 @@ class FSQScanGenerator(object):
         raise StopIteration()
 
 def scan(queue, lock=None, ttl=None, max_tries=None, ignore_down=False,
-         no_open=False, generator=FSQScanGenerator, host=False, hosts=None):
+         no_open=False, generator=FSQScanGenerator, host=False, hosts=None,
+         follow=False, rescan=60, window=None, limit=None, rename=None,
+         worker=None, lease=None):
     '''Given a queue, generate a list of files in that queue, and pass it to
        FSQScanGenerator for iteration.  The generator kwarg is provided here
-       as a means of implementing a custom generator, use with caution.'''
-    lock = _c.FSQ_LOCK if lock is None else lock
+       as a means of implementing a custom generator, use with caution.
+
+       With window (default: FSQ_SCAN_WINDOW, 0 is unbounded), the queue is
+       streamed, rather than listed and sorted in memory, window items at a
+       time (see: _window); with limit, no more than limit items are
+       generated, and the queue is streamed limit items at a time.
+
+       With follow, the generator never stops: once the items in the queue
+       are exhausted, it blocks for new items to be enqueued (see: _follow),
+       re-listing the queue every rescan seconds.
+
+       With rename, items are claimed by rename, and leased for lease
+       seconds, rather than locked (see: FSQScanGenerator).'''
+    rename = _c.FSQ_RENAME if rename is None else rename
+    if lock is None:
+        lock = 0 if rename else _c.FSQ_LOCK
     ttl = _c.FSQ_TTL if lock is None else ttl
     max_tries = _c.FSQ_MAX_TRIES if max_tries is None else max_tries
-    item_ids = []
-    try:
-        if not host and hosts is None:
-            item_ids = os.listdir(fsq_path.queue(queue))
-            item_ids.sort()
-        else:
-            if hosts is None:
-                hosts = fsq_hosts(queue)
-            for trg_host in hosts:
-                for item in os.listdir(fsq_path.queue(queue, trg_host)):
-                    item_ids.append((trg_host, item))
-            item_ids.sort(key=lambda x: x[1])
-    except (OSError, IOError, ), e:
-        if e.errno == errno.ENOENT:
-            raise FSQScanError(e.errno, u'no such queue:'\
+    window = _c.FSQ_SCAN_WINDOW if window is None else int(window)
+    if limit is not None:
+        limit = int(limit)
+        window = min(window, limit) if window else limit
+    if follow:
+        # fail now, rather than on first iteration, for no such queue
+        if not host and hosts is None and not os.path.isdir(
+                fsq_path.queue(queue)):
+            raise FSQScanError(errno.ENOENT, u'no such queue:'\
                                u' {0}'.format(queue))
-        elif isinstance(e, FSQError):
-            raise e
-        raise FSQScanError(e.errno, wrap_io_os_err(e))
+        if window:
+            lister = lambda: _window(queue, window, host=host, hosts=hosts)
+        else:
+            lister = lambda: _list(queue, host=host, hosts=hosts)
+        item_ids = _follow(queue, lister, host=host, hosts=hosts,
+                           rescan=rescan)
+        if limit is not None:
+            item_ids = itertools.islice(item_ids, limit)
+    elif window:
+        item_ids = _window(queue, window, limit=limit, host=host, hosts=hosts)
+        # fail now, rather than on first iteration, for no such queue
+        try:
+            item_ids = itertools.chain(( item_ids.next(), ), item_ids)
+        except StopIteration:
+            item_ids = []
+    else:
+        # sort here should yield time then entropy sorted
+        item_ids = _list(queue, host=host, hosts=hosts)
 
-    # sort here should yield time then entropy sorted
     return generator(queue, item_ids, lock=lock, ttl=ttl, max_tries=max_tries,
-                     no_open=no_open, host=host)
+                     no_open=no_open, host=host, rename=rename, worker=worker,
+                     lease=lease)
+
+def claim(queue, n, worker=None, window=None, lock=None, ttl=None,
+          max_tries=None, ignore_down=False, no_open=False,
+          generator=FSQScanGenerator, host=False, hosts=None, rename=None,
+          lease=None):
+    '''Lock up to n items in a queue in one pass, returning a list of
+       FSQWorkItems (empty should none be available).
+
+       Rather than each consumer working from the oldest item, as scan does,
+       the window oldest items (default: FSQ_CLAIM_WINDOW, 0 is the whole
+       queue) are tried starting from an offset hashed from worker (or
+       random, should worker be None), wrapping around to the oldest, so that
+       concurrent consumers spread across the window, rather than contending
+       for its head.  Items locked by others are skipped, as with scan.
+
+       With rename (default: FSQ_RENAME), items are claimed by renaming
+       them into worker's claimed directory (default: worker_name()), and
+       leased for lease seconds, rather than locked.'''
+    window = _c.FSQ_CLAIM_WINDOW if window is None else int(window)
+    rename = _c.FSQ_RENAME if rename is None else rename
+    if rename and worker is None:
+        worker = worker_name()
+    # listing and sorting is cheaper than a heap for all but huge queues
+    item_ids = list(itertools.islice(_list(queue, host=host, hosts=hosts),
+                                     window or None))
+    size = len(item_ids)
+    offset, stride = _order(worker, size)
+    ordered = ( item_ids[(offset + i*stride) % size] for i in xrange(size) )
+    items = generator(queue, ordered, lock=lock, ttl=ttl,
+                      max_tries=max_tries, ignore_down=ignore_down,
+                      no_open=no_open, host=host or hosts is not None,
+                      rename=rename, worker=worker, lease=lease)
+    return list(itertools.islice(items, n))
+
+def sweep(queue, host=None, max_tries=None, ttl=None):
+    '''Re-offer each item claimed by rename whose lease has expired, by
+       returning it to the queue with its tries bumped, as fail_tmp does
+       (or failing it permanently, should it exceed max_tries or ttl);
+       returns the new ids of the items re-offered.  The worker which held
+       an item learns it has lost it when it next renews, or completes it.'''
+    max_tries = _c.FSQ_MAX_TRIES if max_tries is None else max_tries
+    ttl = _c.FSQ_TTL if ttl is None else ttl
+    swept = []
+    try:
+        try:
+            workers = os.listdir(fsq_path.claimed(queue, host=host))
+        except (OSError, IOError, ), e:
+            if e.errno != errno.ENOENT:
+                raise e
+            return swept
+        now = time.time()
+        for worker in workers:
+            worker = coerce_unicode(worker, _c.FSQ_CHARSET)
+            try:
+                item_ids = os.listdir(fsq_path.claimed(queue, worker,
+                                                       host=host))
+            except (OSError, IOError, ), e:
+                # reaped
+                if e.errno != errno.ENOENT:
+                    raise e
+                continue
+            for item_id in item_ids:
+                item_id = coerce_unicode(item_id, _c.FSQ_CHARSET)
+                try:
+                    st = os.stat(fsq_path.item(queue, item_id, host=host,
+                                 worker=worker))
+                    # a claim sharing its inode is not yet leased, its mtime
+                    #  is not its own (see: FSQWorkItem.renew)
+                    if st.st_mtime > now or 1 != st.st_nlink:
+                        continue
+                    # already claimed, by worker
+                    item = FSQWorkItem(queue, item_id, host=host,
+                                       worker=worker, lock=False,
+                                       no_open=True, max_tries=0, ttl=0)
+                    # re-offered now, rather than backed off
+                    swept.append(fail_tmp(item, max_tries=max_tries,
+                                          ttl=ttl, backoff=0))
+                except (FSQMaxTriesError, FSQTTLExpiredError, ):
+                    # failed permanently
+                    pass
+                except (OSError, IOError, ), e:
+                    # completed, as we swept
+                    if e.errno != errno.ENOENT:
+                        raise e
+    except (OSError, IOError, ), e:
+        if isinstance(e, FSQError):
+            raise e
+        raise FSQClaimError(e.errno, wrap_io_os_err(e))
+    return swept
@@ -1,8 +1,13 @@
 from .FSQTestCase import FSQTestCase
 from .run import run_paths, run_install, run_updownisdown, run_triggers,\
                  run_consts, run_encodedecode, run_construct, run_enqueue,\
-                 run_all
+                 run_utility, run_work, run_watch, run_copyfile,\
+                 run_reenqueue, run_durability, run_mkid, run_aio, run_codec,\
+                 run_blobs, run_claimed, run_delay, run_items, run_all
 
 __all__ = [ 'FSQTestCase', 'run_paths', 'run_install', 'run_updownisdown',
             'run_triggers', 'run_consts', 'run_encodedecode', 'run_construct',
-            'run_enqueue', 'run_all' ]
+            'run_enqueue', 'run_utility', 'run_work', 'run_watch',
+            'run_copyfile', 'run_reenqueue', 'run_durability', 'run_mkid',
+            'run_aio', 'run_codec', 'run_blobs', 'run_claimed', 'run_delay',
+            'run_items', 'run_all' ]
@@ -0,0 +1,48 @@
+import os
+import time
+import threading
+
+from . import FSQTestCase, constants as _test_c
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, aio, path as fsq_path, FSQScanError
+
+class TestAio(FSQTestCase):
+    def test_aio(self):
+        '''Test aenqueue, asenqueue, ascan and asuccess'''
+        queue = normalize()
+        install(queue)
+        with open(_test_c.FILE, 'w') as f:
+            f.write(_test_c.PAYLOAD.encode('utf8'))
+        with open(_test_c.FILE, 'r') as f:
+            item_id = aio.aenqueue(queue, f, u'arg').get(5)
+        self.assertEquals([ item_id ], os.listdir(fsq_path.queue(queue)))
+        with open(fsq_path.item(queue, item_id)) as f:
+            self.assertEquals(_test_c.PAYLOAD.encode('utf8'), f.read())
+        results = [ aio.asenqueue(queue, 'async', i) for i in range(10) ]
+        self.assertEquals(10, len(set(r.get(5) for r in results)))
+
+        seen = []
+        lock = threading.Lock()
+        def callback(item):
+            with lock:
+                seen.append(item.id)
+            item.asuccess()
+        errors = []
+        scanner = aio.ascan(queue, callback, errback=errors.append)
+        try:
+            # items in the queue, then items as they are enqueued
+            for expected in ( 11, 12, ):
+                if 12 == expected:
+                    senqueue(queue, 'late')
+                for i in range(50):
+                    if len(os.listdir(fsq_path.done(queue))) == expected:
+                        break
+                    time.sleep(0.1)
+                self.assertEquals(expected, len(set(seen)))
+                self.assertEquals(expected,
+                                  len(os.listdir(fsq_path.done(queue))))
+        finally:
+            scanner.close()
+        self.assertEquals([], errors)
+        self.assertRaises(FSQScanError, aio.ascan, normalize(), callback)
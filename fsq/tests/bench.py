@@ -0,0 +1,565 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/tests/bench.py -- benchmarks for fsq, not run as part of run_all, run
+#   all benchmarks with:
+#
+#       python -m fsq.tests.bench
+#
+#   or some benchmarks by name:
+#
+#       python -m fsq.tests.bench host_merge
+#
+# This software is for POSIX compliant systems only.
+import os
+import sys
+import time
+import errno
+import select
+import random
+import shutil
+import socket
+import tempfile
+import datetime
+import threading
+import itertools
+import json
+
+from contextlib import closing
+
+from .. import construct, deconstruct, decode, install, uninstall, senqueue,\
+              vsenqueue, vsenqueue_many, scan, success, sync, aio,\
+              set_codec, vreenqueue, gc_blobs, claim, FSQWorkItem,\
+              FSQScanGenerator, promote, constants as _c
+from ..construct import _deconstruct_walk
+from ..encode import _decode_walk
+from ..internal import copy_file, fsync_fds, rationalize_file, mkid,\
+                       fmt_time, coerce_unicode
+
+############ INTERNAL HELPERS
+def _time(fn, *args, **kwargs):
+    '''Return the wall-clock time of the best of 3 calls to fn'''
+    best = None
+    for i in range(3):
+        start = time.time()
+        fn(*args, **kwargs)
+        took = time.time() - start
+        best = took if best is None else min(best, took)
+    return best
+
+def _report(name, *timings, **kwargs):
+    unit = kwargs.get('unit', 's')
+    print >> sys.stdout, '{0}:'.format(name)
+    for label, took in timings:
+        print >> sys.stdout, '    {0:<32} {1:>10.4f}{2}'.format(label, took,
+                                                                unit)
+    sys.stdout.flush()
+
+def _item_ids(n, host=u'localhost'):
+    '''Generate n plausible, unsorted, queue item ids'''
+    item_ids = []
+    for i in xrange(n):
+        item_ids.append(construct((u'2012{0:010d}'.format(
+                                   random.randint(0, 10**6)),
+                                   i, 1234, host, 0, u'arg', )))
+    random.shuffle(item_ids)
+    return item_ids
+
+def _select_copy(src_file, trg_fd):
+    '''The enqueue copy loop, prior to copy_file'''
+    with closing(os.fdopen(os.dup(trg_fd), 'wb', 1)) as trg_file:
+        while True:
+            reads, dis, card = select.select([src_file], [], [])
+            try:
+                msg = os.read(reads[0].fileno(), 2048)
+                if 0 == len(msg):
+                    break
+            except (OSError, IOError, ), e:
+                if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN,):
+                    continue
+                raise e
+            trg_file.write(msg)
+        trg_file.flush()
+
+def _chunk_fsync_copy(src_file, trg_fds):
+    '''The reenqueue copy loop, prior to copy_file and fsync_fds'''
+    trg_files = [ os.fdopen(os.dup(trg_fd), 'wb', 1) for trg_fd in trg_fds ]
+    try:
+        while True:
+            chunk = os.read(src_file.fileno(), 2048)
+            if 0 == len(chunk):
+                break
+            for trg_file in trg_files:
+                trg_file.write(chunk)
+                trg_file.flush()
+                os.fsync(trg_file.fileno())
+    finally:
+        for trg_file in trg_files:
+            trg_file.close()
+
+_ENTROPY = [ None, 0, ]
+def _fmt_mkentropy(timefmt, charset):
+    '''The item id fields, prior to mkid: strftime per id, and a counter
+       reset on each change of formatted time, without a lock'''
+    now = fmt_time(datetime.datetime.now(), timefmt, charset)
+    pid = coerce_unicode(os.getpid(), charset)
+    host = coerce_unicode(socket.gethostname(), charset)
+    if _ENTROPY[0] == ( pid, now, host, ):
+        _ENTROPY[1] += 1
+    else:
+        _ENTROPY[:] = [ ( pid, now, host, ), 0, ]
+    return now, _ENTROPY[1], pid, host
+
+############ BENCHMARKS
+def bench_host_merge(hosts=100, items=10000):
+    '''k-way merge vs. concatenate-and-sort for multi-host scans'''
+    fsq_scan = sys.modules['fsq.scan']
+    listings = [ ( u'host{0}'.format(i), _item_ids(items,
+                   u'host{0}'.format(i)), ) for i in range(hosts) ]
+
+    def concat_sort():
+        item_ids = []
+        for trg_host, host_ids in listings:
+            for item in host_ids:
+                item_ids.append((trg_host, item))
+        item_ids.sort(key=lambda x: x[1])
+        return item_ids
+
+    def merge():
+        return list(fsq_scan._merge_hosts([ ( trg_host, list(host_ids), )\
+                                        for trg_host, host_ids in listings ]))
+
+    def merge_first():
+        return fsq_scan._merge_hosts([ ( trg_host, list(host_ids), )\
+                                   for trg_host, host_ids in listings ]).next()
+
+    _report('host_merge ({0} hosts x {1} items)'.format(hosts, items),
+            ('concatenate and sort', _time(concat_sort), ),
+            ('k-way merge', _time(merge), ),
+            ('k-way merge, first item', _time(merge_first), ))
+
+def bench_deconstruct(items=20000, args=20):
+    '''fast decode/deconstruct vs. the char-wise walk'''
+    names = [ construct((u'20120101000000', i, 1234, u'localhost', 0, ) +\
+              tuple(u'arg/{0}_{1}%'.format(j, i) for j in range(args)))\
+              for i in xrange(items) ]
+    encoded = [ u'/path%2fto%5fsome%25file{0}'.format(i)\
+                for i in xrange(items) ]
+
+    _report('deconstruct ({0} items x {1} args)'.format(items, args),
+            ('construct', _time(lambda: [ construct((u'20120101000000', i,
+                1234, u'localhost', 0, ) + tuple(u'arg/{0}_{1}%'.format(j, i)\
+                for j in range(args))) for i in xrange(items) ]), ),
+            ('char-wise deconstruct', _time(lambda: [ _deconstruct_walk(
+                name, u'_', u'%') for name in names ]), ),
+            ('deconstruct', _time(lambda: [ deconstruct(name)\
+                                            for name in names ]), ),
+            ('char-wise decode', _time(lambda: [ _decode_walk(arg, u'%')\
+                                                 for arg in encoded ]), ),
+            ('decode', _time(lambda: [ decode(arg) for arg in encoded ]), ))
+
+def bench_copy(small=4096, medium=1024*1024, large=64*1024*1024):
+    '''copy_file vs. the select/read/line-buffered write loop, for regular
+       files'''
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        timings = []
+        for size in ( small, medium, large, ):
+            src = os.path.join(tmp_dir, 'src')
+            with open(src, 'wb') as f:
+                f.write(os.urandom(size))
+
+            def copy(copier):
+                with closing(rationalize_file(src, 'utf8')) as src_file:
+                    trg_fd = os.open(os.path.join(tmp_dir, 'trg'),
+                                     os.O_WRONLY|os.O_CREAT|os.O_TRUNC)
+                    try:
+                        copier(src_file, trg_fd)
+                    finally:
+                        os.close(trg_fd)
+            # small copies are timed in bulk, and reported per copy
+            count = max(1, medium // size)
+            def copies(copier):
+                for i in xrange(count):
+                    copy(copier)
+            timings.append(( '{0} bytes, select loop'.format(size),
+                             _time(copies, _select_copy)/count, ))
+            timings.append(( '{0} bytes, copy_file'.format(size),
+                             _time(copies, lambda src_file, trg_fd: copy_file(
+                                   src_file, ( trg_fd, )))/count, ))
+        _report('copy', *timings)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def bench_fanout(size=10*1024*1024, targets=5):
+    '''copy once and fsync once per target vs. fsync per chunk per target,
+       as in a reenqueue to many queues (set TMPDIR to benchmark a
+       file-system other than /tmp)'''
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp_dir, 'src')
+        with open(src, 'wb') as f:
+            f.write(os.urandom(size))
+
+        def fanout(copier):
+            trg_fds = [ os.open(os.path.join(tmp_dir, 'trg{0}'.format(i)),
+                                os.O_WRONLY|os.O_CREAT|os.O_TRUNC)\
+                        for i in range(targets) ]
+            try:
+                with closing(rationalize_file(src, 'utf8')) as src_file:
+                    copier(src_file, trg_fds)
+            finally:
+                for trg_fd in trg_fds:
+                    os.close(trg_fd)
+
+        def copy_fsync(parallel):
+            def copier(src_file, trg_fds):
+                copy_file(src_file, trg_fds)
+                fsync_fds(trg_fds, parallel=parallel)
+            return copier
+
+        _report('fanout ({0} bytes x {1} targets)'.format(size, targets),
+                ('fsync per chunk', _time(fanout, _chunk_fsync_copy), ),
+                ('copy_file, fsync once', _time(fanout, copy_fsync(False)), ),
+                ('copy_file, parallel fsync', _time(fanout,
+                                                    copy_fsync(True)), ))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def bench_durability(ops=1000):
+    '''enqueue and success ops/sec at each FSQ_DURABILITY level, in a
+       scratch queue under FSQ_ROOT'''
+    queue = u'bench-durability-{0}'.format(os.getpid())
+    orig_durability = _c.FSQ_DURABILITY
+    install(queue)
+    try:
+        def enqueue_success():
+            for i in xrange(ops):
+                senqueue(queue, 'payload', i)
+            for item in scan(queue):
+                success(item)
+            sync()
+
+        timings = []
+        for level in ( u'none', u'data', u'group', u'full', ):
+            _c.FSQ_DURABILITY = level
+            timings.append(( '{0}, ops/sec'.format(level),
+                             2*ops/_time(enqueue_success), ))
+        _report('durability ({0} enqueues + {0} successes)'.format(ops),
+                *timings, unit='')
+    finally:
+        _c.FSQ_DURABILITY = orig_durability
+        uninstall(queue)
+
+def bench_enqueue_many(items=5000):
+    '''vsenqueue_many vs. vsenqueue in a loop, at each FSQ_DURABILITY level,
+       in a scratch queue under FSQ_ROOT'''
+    queue = u'bench-enqueue-many-{0}'.format(os.getpid())
+    orig_durability = _c.FSQ_DURABILITY
+    install(queue)
+    try:
+        payloads = [ ( 'payload {0}'.format(i), [ u'arg', i, ], )\
+                     for i in xrange(items) ]
+        def loop():
+            for payload, args in payloads:
+                vsenqueue(queue, payload, args)
+        timings = []
+        for level in ( u'data', u'full', ):
+            _c.FSQ_DURABILITY = level
+            for label, fn in ( ( 'vsenqueue loop', loop, ),
+                               ( 'vsenqueue_many', lambda: vsenqueue_many(
+                                   queue, payloads), ), ):
+                timings.append(( '{0}, {1}, ops/sec'.format(level, label),
+                                 items/_time(fn), ))
+                uninstall(queue)
+                install(queue)
+        _report('enqueue_many ({0} items)'.format(items), *timings, unit='')
+    finally:
+        _c.FSQ_DURABILITY = orig_durability
+        uninstall(queue)
+
+def bench_tmpfile(items=5000):
+    '''enqueue ops/sec with anonymous (O_TMPFILE) files vs. files in tmp, at
+       each FSQ_DURABILITY level, in a scratch queue under FSQ_ROOT (set
+       FSQ_ROOT to benchmark other file-systems)'''
+    queue = u'bench-tmpfile-{0}'.format(os.getpid())
+    orig = _c.FSQ_DURABILITY, _c.FSQ_TMPFILE
+    install(queue)
+    try:
+        def loop():
+            for i in xrange(items):
+                vsenqueue(queue, 'payload', [ i ])
+        timings = []
+        for level in ( u'none', u'data', u'full', ):
+            _c.FSQ_DURABILITY = level
+            for label, tmpfile in ( ( 'tmp', 0, ), ( 'O_TMPFILE', 1, ), ):
+                _c.FSQ_TMPFILE = tmpfile
+                timings.append(( '{0}, {1}, ops/sec'.format(level, label),
+                                 items/_time(loop), ))
+                uninstall(queue)
+                install(queue)
+        _report('tmpfile ({0} items)'.format(items), *timings, unit='')
+    finally:
+        _c.FSQ_DURABILITY, _c.FSQ_TMPFILE = orig
+        uninstall(queue)
+
+def bench_ids(ids=100000, items=4000):
+    '''item id fields per second, mkid vs. strftime per id, and threaded
+       enqueue ops/sec, at second and sub-second FSQ_TIMEFMT'''
+    queue = u'bench-ids-{0}'.format(os.getpid())
+    orig = _c.FSQ_TIMEFMT
+    install(queue)
+    try:
+        for timefmt in ( u'%Y%m%d%H%M%S', u'%Y%m%d%H%M%S%f', ):
+            def loop(fn):
+                for i in xrange(ids):
+                    fn(timefmt, _c.FSQ_CHARSET)
+            timings = [ ( 'strftime per id, ids/sec',
+                          ids/_time(loop, _fmt_mkentropy), ),
+                        ( 'mkid, ids/sec', ids/_time(loop, mkid), ), ]
+            _c.FSQ_TIMEFMT = timefmt
+            for n in ( 1, 4, 16, ):
+                def produce():
+                    for i in xrange(items/n):
+                        senqueue(queue, 'payload')
+                def threaded():
+                    threads = [ threading.Thread(target=produce)\
+                                for i in range(n) ]
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+                timings.append(( 'enqueue, {0} threads, ops/sec'.format(n),
+                                 items/_time(threaded), ))
+                uninstall(queue)
+                install(queue)
+            _report('ids ({0}, {1} ids, {2} items)'.format(timefmt, ids,
+                    items), *timings, unit='')
+    finally:
+        _c.FSQ_TIMEFMT = orig
+        uninstall(queue)
+
+def bench_aio(queues=1000, rounds=3):
+    '''latency from enqueue to ascan callback, and threads used, with one
+       process scanning many queues'''
+    names = [ u'bench-aio-{0}-{1}'.format(os.getpid(), i)\
+              for i in xrange(queues) ]
+    for name in names:
+        install(name)
+    cond = threading.Condition()
+    latencies = []
+    def callback(item):
+        took = time.time() - float(item.arguments[0])
+        item.asuccess()
+        with cond:
+            latencies.append(took)
+            cond.notify()
+    scanners = []
+    try:
+        start = time.time()
+        for name in names:
+            scanners.append(aio.ascan(name, callback, rescan=None))
+        timings = [ ( 'ascan {0} queues, s'.format(queues),
+                      time.time() - start, ) ]
+        for i in xrange(rounds):
+            del latencies[:]
+            for name in names:
+                senqueue(name, 'payload', repr(time.time()))
+            with cond:
+                while len(latencies) < queues:
+                    cond.wait(1)
+            latencies.sort()
+            timings.append(( 'round {0}, median latency, s'.format(i),
+                             latencies[len(latencies)/2], ))
+            timings.append(( 'round {0}, max latency, s'.format(i),
+                             latencies[-1], ))
+        timings.append(( 'threads', threading.active_count(), ))
+        _report('aio ({0} queues)'.format(queues), *timings, unit='')
+    finally:
+        for scanner in scanners:
+            scanner.close()
+        for name in names:
+            uninstall(name)
+
+def _cpu():
+    '''user + system CPU seconds of this process'''
+    times = os.times()
+    return times[0] + times[1]
+
+def bench_codec(items=2000, records=50):
+    '''bytes stored, enqueue and read ops/sec and CPU seconds per 1000
+       items, for JSON payloads, uncompressed and with each codec'''
+    queue = u'bench-codec-{0}'.format(os.getpid())
+    payloads = [ json.dumps([ { 'id': i*records + j, 'name': 'item',
+                                'state': random.choice(( 'new', 'done', )),
+                                'tags': [ 'a', 'b', 'c', ],
+                                'value': random.randint(0, 1000), }\
+                              for j in xrange(records) ])\
+                 for i in xrange(items) ]
+    for codec in ( None, u'zlib', u'bz2', ):
+        install(queue)
+        try:
+            set_codec(queue, codec)
+            start, cpu = time.time(), _cpu()
+            for payload in payloads:
+                vsenqueue(queue, payload, [])
+            took, cpu = time.time() - start, _cpu() - cpu
+            stored = sum(os.path.getsize(os.path.join(root, name)) for root,\
+                         dirs, names in os.walk(os.path.join(_c.FSQ_ROOT,
+                         queue, _c.FSQ_QUEUE)) for name in names)
+            timings = [ ( 'payload bytes', sum(len(p) for p in payloads), ),
+                        ( 'stored bytes', stored, ),
+                        ( 'enqueue ops/sec', items/took, ),
+                        ( 'enqueue cpu s/1000', cpu*1000/items, ), ]
+            start, cpu = time.time(), _cpu()
+            for item in scan(queue):
+                item.item.read()
+                del item
+            took, cpu = time.time() - start, _cpu() - cpu
+            timings.extend([ ( 'read ops/sec', items/took, ),
+                             ( 'read cpu s/1000', cpu*1000/items, ), ])
+            _report('codec {0} ({1} items)'.format(codec, items), *timings,
+                    unit='')
+        finally:
+            uninstall(queue)
+
+def bench_dedup(items=500, fanout=8, size=64*1024):
+    '''bytes stored and reenqueue ops/sec, reenqueueing each of items to
+       fanout queues, as copies and by way of the blob store'''
+    src = u'bench-dedup-{0}'.format(os.getpid())
+    queues = [ u'{0}-{1}'.format(src, i) for i in xrange(fanout) ]
+    install(src)
+    try:
+        for i in xrange(items):
+            senqueue(src, os.urandom(size))
+        for dedup in ( False, True, ):
+            for queue in queues:
+                install(queue)
+            try:
+                start, cpu = time.time(), _cpu()
+                for item in scan(src):
+                    vreenqueue(item, queues, dedup=dedup)
+                    del item
+                took, cpu = time.time() - start, _cpu() - cpu
+                inodes = {}
+                for root, dirs, names in os.walk(_c.FSQ_ROOT):
+                    if root == os.path.join(_c.FSQ_ROOT, src, _c.FSQ_QUEUE):
+                        continue
+                    for name in names:
+                        st = os.stat(os.path.join(root, name))
+                        inodes[st.st_ino] = st.st_size
+                _report('dedup={0} ({1} items x {2} queues)'.format(dedup,
+                        items, fanout),
+                        ( 'payload bytes', items*size, ),
+                        ( 'stored bytes', sum(inodes.itervalues()), ),
+                        ( 'reenqueue ops/sec', items/took, ),
+                        ( 'reenqueue cpu s/1000', cpu*1000/items, ),
+                        unit='')
+            finally:
+                for queue in queues:
+                    uninstall(queue)
+                gc_blobs(grace=0)
+    finally:
+        uninstall(src)
+
+def _consume(queue, mode, batch, wfd):
+    '''Drain queue, by scan, or by claim with flock or rename, until nothing
+       can be claimed, and report ( items tried, items completed, ) to wfd'''
+    counts = [ 0, 0, ]
+    def work_item(*args, **kwargs):
+        counts[0] += 1
+        return FSQWorkItem(*args, **kwargs)
+    class Counting(FSQScanGenerator):
+        pass
+    Counting.work_item = staticmethod(work_item)
+    worker = u'{0}-{1}'.format(socket.gethostname(), os.getpid())
+    while True:
+        if 'scan' == mode:
+            items = scan(queue, generator=Counting)
+        else:
+            items = claim(queue, batch, worker=worker, generator=Counting,
+                          rename='rename' == mode)
+        got = 0
+        for item in items:
+            item.success()
+            got += 1
+        del items
+        counts[1] += got
+        # all that remains is held by others, who will complete it
+        if not got:
+            break
+    os.write(wfd, '{0} {1}\n'.format(*counts))
+
+def bench_claim(items=4000, consumers=( 1, 8, 64, ), batch=16):
+    '''items/sec, and claims wasted per item (on items locked, or completed,
+       by others), for concurrent consumers draining a queue, by scan, and by
+       claim with flock and with rename'''
+    queue = u'bench-claim-{0}'.format(os.getpid())
+    for n in consumers:
+        for mode in ( 'scan', 'claim', 'rename', ):
+            install(queue)
+            try:
+                for i in xrange(items):
+                    senqueue(queue, 'payload')
+                rfd, wfd = os.pipe()
+                start, pids = time.time(), []
+                for i in xrange(n):
+                    pid = os.fork()
+                    if 0 == pid:
+                        try:
+                            random.seed()
+                            _consume(queue, mode, batch, wfd)
+                        finally:
+                            os._exit(0)
+                    pids.append(pid)
+                for pid in pids:
+                    os.waitpid(pid, 0)
+                took = time.time() - start
+                os.close(wfd)
+                tried = done = 0
+                with os.fdopen(rfd) as counts:
+                    for line in counts:
+                        line = line.split()
+                        tried, done = tried + int(line[0]), done + int(line[1])
+                _report('{0} ({1} items, {2} consumers)'.format(mode, items,
+                        n), ( 'items/sec', done/took, ),
+                        ( 'wasted claims/item', (tried - done)/float(done), ),
+                        unit='')
+            finally:
+                uninstall(queue)
+
+def bench_not_before(future=( 1000, 10000, ), polls=5):
+    '''seconds per poll (scan, and promote) of a queue holding future
+       work-items, kept in the queue and failed temporarily on each poll, as
+       a handler exiting FSQ_FAIL_TMP would, vs. enqueued with not_before'''
+    queue = u'bench-not-before-{0}'.format(os.getpid())
+    for n in future:
+        for mode in ( 'fail_tmp', 'not_before', ):
+            install(queue)
+            try:
+                not_before = time.time() + 3600 if mode == 'not_before'\
+                                 else None
+                for i in xrange(n):
+                    senqueue(queue, 'payload', not_before=not_before)
+                start, cpu = time.time(), _cpu()
+                for i in xrange(polls):
+                    promote(queue)
+                    for item in scan(queue, max_tries=0):
+                        item.fail_tmp(backoff=0)
+                        del item
+                took, cpu = time.time() - start, _cpu() - cpu
+                _report('{0} ({1} future items)'.format(mode, n),
+                        ( 'sec/poll', took/polls, ),
+                        ( 'cpu sec/poll', cpu/polls, ), unit='')
+            finally:
+                uninstall(queue)
+
+############ RUNNER
+def main(argv):
+    names = argv[1:] or [ n[len('bench_'):] for n in sorted(globals())\
+                          if n.startswith('bench_') ]
+    for name in names:
+        globals()['bench_{0}'.format(name)]()
+
+if __name__ == '__main__':
+    main(sys.argv)
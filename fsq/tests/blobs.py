@@ -0,0 +1,62 @@
+import os
+
+from . import FSQTestCase
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, scan, vreenqueue, set_codec, gc_blobs,\
+               lists, constants as _c, path as fsq_path
+
+class TestBlobs(FSQTestCase):
+    def test_dedup(self):
+        '''Test reenqueue by way of the blob store, and collecting blobs'''
+        src = normalize()
+        queues = [ normalize() for i in range(3) ]
+        for queue in [ src ] + queues:
+            install(queue)
+        set_codec(queues[2], u'zlib')
+        payload = 'x'*4096
+        with open(__file__, 'rb') as f:
+            first = senqueue(src, f.read())
+        item_id = senqueue(src, payload)
+        for item in scan(src):
+            if item.id == first:
+                vreenqueue(item, queues, dedup=True)
+            else:
+                # again, as on retry, shares the blob stored the first time
+                vreenqueue(item, queues[1:], dedup=True)
+                item.open()
+                vreenqueue(item, queues[1:], dedup=True)
+            del item
+        stats = [ os.stat(fsq_path.item(queue, item_id)) for queue\
+                  in queues[1:] ]
+        first = [ os.stat(fsq_path.item(queue, first)) for queue in queues ]
+        self.assertEquals(first[0].st_ino, first[1].st_ino)
+        self.assertNotEquals(first[0].st_ino, first[2].st_ino)
+        # one link per item, plus the blob
+        self.assertEquals(3, first[0].st_nlink)
+        self.assertEquals(2, first[2].st_nlink)
+        self.assertEquals(2, stats[0].st_nlink)
+        with open(fsq_path.item(queues[1], item_id), 'rb') as f:
+            self.assertEquals(payload, f.read())
+        for item in scan(queues[2]):
+            if item.id == item_id:
+                self.assertEquals(payload, item.item.read())
+            del item
+        self.assertEquals([], os.listdir(fsq_path.blob_tmp()))
+        # the blob store is not a queue
+        self.assertTrue(os.path.isdir(os.path.join(_c.FSQ_ROOT,
+                        _c.FSQ_BLOBS)))
+        self.assertFalse(_c.FSQ_BLOBS in lists.queues())
+        self.assertTrue(src in lists.queues())
+        # referenced blobs, and blobs within the grace, are kept
+        self.assertEquals(0, gc_blobs(grace=0))
+        self.assertEquals(0, gc_blobs())
+        for queue in [ src ] + queues:
+            for item in scan(queue):
+                item.success()
+                del item
+            for done in os.listdir(fsq_path.done(queue)):
+                os.unlink(os.path.join(fsq_path.done(queue), done))
+        self.assertEquals(0, gc_blobs())
+        self.assertEquals(4, gc_blobs(grace=0))
+        self.assertEquals(0, gc_blobs(grace=0))
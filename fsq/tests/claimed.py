@@ -0,0 +1,136 @@
+import os
+import time
+
+from . import FSQTestCase
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, scan, claim, sweep, reap, deconstruct,\
+               vreenqueue, worker_name, worker_is_alive, path as fsq_path,\
+               FSQWorkItem, FSQWorkItemError, FSQDoneError
+
+class TestClaimed(FSQTestCase):
+    def test_rename(self):
+        '''Test claiming items by rename, completing and reaping them'''
+        queue = normalize()
+        other = normalize()
+        install(queue)
+        install(other)
+        payloads = dict(( senqueue(queue, str(i)), str(i), ) for i in range(5))
+        item_ids = sorted(payloads)
+        items = list(scan(queue, rename=True, worker=u'w1', max_tries=3))
+        self.assertEquals(item_ids, [ item.id for item in items ])
+        self.assertEquals([], os.listdir(fsq_path.queue(queue)))
+        self.assertEquals(item_ids, sorted(os.listdir(fsq_path.claimed(queue,
+                                                                  u'w1'))))
+        # claimed items are neither locked, nor listed
+        self.assertEquals([], list(scan(queue)))
+        self.assertEquals(payloads[items[0].id], items[0].item.read())
+        vreenqueue(items[0], [ other ], link=True)
+        self.assertTrue(os.path.exists(fsq_path.item(other, item_ids[0])))
+        items[0].success()
+        self.assertTrue(os.path.exists(os.path.join(fsq_path.done(queue),
+                                                    item_ids[0])))
+        retry_id = items[1].fail_tmp()
+        self.assertEquals([ retry_id ], os.listdir(fsq_path.queue(queue)))
+        items[2].fail_perm()
+        self.assertTrue(os.path.exists(os.path.join(fsq_path.fail(queue),
+                                                    item_ids[2])))
+        retried = claim(queue, 2, rename=True, worker=u'w2', max_tries=3)
+        self.assertEquals([ retry_id ], [ item.id for item in retried ])
+        self.assertEquals(1, retried[0].tries)
+        # only dead workers are reaped
+        self.assertEquals(sorted(item_ids[3:]), sorted(reap(queue,
+                          alive=lambda worker: worker != u'w1')))
+        self.assertEquals([ u'w2' ], os.listdir(fsq_path.claimed(queue)))
+        self.assertEquals(sorted(item_ids[3:]),
+                          sorted(os.listdir(fsq_path.queue(queue))))
+        # and, by default, workers of this host whose pid has exited
+        self.assertTrue(worker_is_alive(worker_name()))
+        self.assertTrue(worker_is_alive(u'w2'))
+        pid = os.fork()
+        if 0 == pid:
+            os._exit(0)
+        os.waitpid(pid, 0)
+        dead = worker_name().rpartition(u':')[0] + u':{0}'.format(pid)
+        self.assertFalse(worker_is_alive(dead))
+        self.assertEquals(2, len(list(scan(queue, rename=True, worker=dead))))
+        self.assertEquals(sorted(item_ids[3:]), sorted(reap(queue)))
+        self.assertEquals([ u'w2' ], os.listdir(fsq_path.claimed(queue)))
+        self.assertEquals(2, len(list(scan(queue))))
+
+    def test_lease(self):
+        '''Test leasing claims, renewing them, and sweeping expired leases'''
+        queue = normalize()
+        install(queue)
+        item_ids = sorted(senqueue(queue, str(i)) for i in range(3))
+        now = time.time()
+        items = list(scan(queue, rename=True, worker=u'w1', lease=60,
+                          max_tries=3))
+        self.assertEquals(3, len(items))
+        for item in items:
+            self.assertTrue(now + 59 < os.stat(item.path).st_mtime < now + 62)
+        self.assertEquals([], sweep(queue))
+        # leased forever
+        items[2].renew(0)
+        self.assertTrue(os.stat(items[2].path).st_mtime > now + 10**8)
+        os.utime(items[0].path, ( now, now - 1, ))
+        os.utime(items[1].path, ( now, now - 1, ))
+        items[1].renew()
+        swept = sweep(queue, max_tries=3)
+        self.assertEquals(1, len(swept))
+        self.assertEquals([ swept[0] ], os.listdir(fsq_path.queue(queue)))
+        # tries are bumped, as by fail_tmp
+        self.assertEquals(u'1', deconstruct(swept[0])[1][4])
+        self.assertRaises(FSQWorkItemError, items[0].renew)
+        self.assertRaises(FSQDoneError, items[0].success)
+        items[1].success()
+        self.assertRaises(FSQWorkItemError, list(scan(queue,
+                          max_tries=3))[0].renew)
+        # expired, beyond max_tries, is failed permanently
+        retried = claim(queue, 1, rename=True, worker=u'w2', lease=1,
+                        max_tries=3)
+        os.utime(retried[0].path, ( now, now - 1, ))
+        self.assertEquals([], sweep(queue, max_tries=2))
+        self.assertEquals([ retried[0].id ], os.listdir(fsq_path.fail(queue)))
+        self.assertEquals([], os.listdir(fsq_path.queue(queue)))
+
+    def test_lease_shared(self):
+        '''Test that leased claims on items sharing an inode are given an
+           inode of their own, leaving the lease of each link be'''
+        src = normalize()
+        queue = normalize()
+        other = normalize()
+        for trg_queue in ( src, queue, other, ):
+            install(trg_queue)
+        item_id = senqueue(src, 'shared')
+        src_path = fsq_path.item(src, item_id)
+        item = FSQWorkItem(src, item_id, lock=False, no_open=True)
+        vreenqueue(item, [ queue ], link=True)
+        del item
+        mtime = os.stat(src_path).st_mtime
+        now = time.time()
+        items = claim(queue, 1, rename=True, worker=u'w1', lease=60,
+                      max_tries=3)
+        st = os.stat(items[0].path)
+        self.assertEquals(1, st.st_nlink)
+        self.assertTrue(now + 59 < st.st_mtime < now + 62)
+        self.assertEquals(os.stat(src_path).st_mode, st.st_mode)
+        self.assertEquals(1, os.stat(src_path).st_nlink)
+        self.assertEquals(mtime, os.stat(src_path).st_mtime)
+        self.assertEquals('shared', items[0].item.read())
+        self.assertEquals([], os.listdir(fsq_path.tmp(queue)))
+
+        # shared once claimed, is not swept until renewed
+        vreenqueue(items[0], [ other ], link=True)
+        expired = int(now) - 1
+        os.utime(items[0].path, ( now, expired, ))
+        self.assertEquals([], sweep(queue, max_tries=3))
+        other_path = fsq_path.item(other, item_id)
+        for lease in ( None, 0, ):
+            items[0].renew(lease)
+            self.assertEquals(1, os.stat(items[0].path).st_nlink)
+            self.assertTrue(os.stat(items[0].path).st_mtime > now + 59)
+            self.assertEquals(( 1, expired, ), ( os.stat(other_path).st_nlink,
+                              int(os.stat(other_path).st_mtime), ))
+        os.utime(items[0].path, ( now, expired, ))
+        self.assertEquals(1, len(sweep(queue, max_tries=3)))
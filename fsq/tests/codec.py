@@ -0,0 +1,113 @@
+import os
+
+from . import FSQTestCase
+from .internal import normalize
+from ..codec import FSQCodecReader, feed
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, scan, vreenqueue, set_codec, get_codec,\
+               path as fsq_path, FSQCodecError, fork_exec_items, const,\
+               constants as _c
+
+class TestCodec(FSQTestCase):
+    def _feed(self, reader, payload, read=True):
+        '''Feed reader to a child, which exits 0 should it read payload on
+           stdin (or, without read, exits 0 without reading), returns the
+           exit code of the feeder'''
+        pid = os.fork()
+        if 0 == pid:
+            try:
+                feed(reader)
+                if not read:
+                    os._exit(0)
+                fed = ''.join(iter(lambda: os.read(0, 4096), ''))
+                os._exit(0 if fed == payload else 1)
+            finally:
+                os._exit(2)
+        status = os.waitpid(pid, 0)[1]
+        self.assertTrue(os.WIFEXITED(status))
+        return os.WEXITSTATUS(status)
+
+    def test_codec(self):
+        '''Test payloads compressed per queue, decompressed on read, and
+           reenqueued as stored'''
+        queue = normalize()
+        install(queue)
+        plain = normalize()
+        install(plain)
+        self.assertEquals(None, get_codec(queue))
+        self.assertRaises(FSQCodecError, set_codec, queue, u'nonesuch')
+        set_codec(queue, u'zlib')
+        self.assertEquals(u'zlib', get_codec(queue))
+        payload = ''.join('{0}: {1}\n'.format(i, 'x'*i) for i in range(200))
+        item_id = senqueue(queue, payload)
+        with open(fsq_path.item(queue, item_id), 'rb') as f:
+            stored = f.read()
+        self.assertTrue(stored.startswith('\0fsq-codec:zlib\n'))
+        self.assertTrue(len(stored) < len(payload))
+        senqueue(queue, payload, codec=False)
+        for item in scan(queue):
+            if item.id == item_id:
+                self.assertTrue(isinstance(item.item, FSQCodecReader))
+                self.assertEquals(payload.splitlines(True), list(item.item))
+                item.open()
+                self.assertEquals(0, self._feed(item.item, payload))
+                vreenqueue(item, [ plain ])
+            else:
+                self.assertEquals(payload, item.item.read())
+            del item
+        with open(fsq_path.item(plain, item_id), 'rb') as f:
+            self.assertEquals(stored, f.read())
+        set_codec(queue)
+        self.assertEquals(None, get_codec(queue))
+
+    def test_feed(self):
+        '''Test that items are done or failed as their program exits,
+           whether or not it reads all of its payload, unless the payload is
+           corrupt'''
+        orig_max_tries = _c.FSQ_MAX_TRIES
+        try:
+            # so that fail_tmp retries, rather than failing permanently
+            _c.FSQ_MAX_TRIES = 2
+            queue = normalize()
+            install(queue)
+            set_codec(queue, u'zlib')
+            payload = 'x'*(1024*1024)
+            item_id = senqueue(queue, payload)
+            for item in scan(queue):
+                # the child stops reading, and its exit wins
+                self.assertEquals(const('FSQ_SUCCESS'), self._feed(
+                                  item.item, payload, read=False))
+                del item
+            with open(fsq_path.item(queue, item_id), 'rb+') as f:
+                # past the codec and zlib headers
+                f.seek(len('\0fsq-codec:zlib\n') + 2)
+                f.write('\xff'*64)
+            for item in scan(queue):
+                self.assertRaises(FSQCodecError, item.item.read)
+                item.open()
+                self.assertEquals(const('FSQ_FAIL_PERM'), self._feed(
+                                  item.item, payload, read=False))
+                del item
+
+            # programs which read all they are fed are done as they exit
+            self.assertEquals(const('FSQ_FAIL_PERM'), fork_exec_items(queue,
+                              exec_args=( 'sh', '-c', 'cat >/dev/null', )))
+            self.assertEquals([ item_id ], os.listdir(fsq_path.fail(queue)))
+            item_id = senqueue(queue, payload)
+            self.assertEquals(const('FSQ_SUCCESS'), fork_exec_items(queue,
+                              exec_args=( 'sh', '-c', 'cat >/dev/null', )))
+            self.assertEquals([ item_id ], os.listdir(fsq_path.done(queue)))
+
+            # as are programs which do not read what they are fed
+            os.unlink(os.path.join(fsq_path.done(queue), item_id))
+            item_id = senqueue(queue, payload)
+            self.assertEquals(const('FSQ_SUCCESS'), fork_exec_items(queue,
+                              exec_args=( 'true', )))
+            self.assertEquals([ item_id ], os.listdir(fsq_path.done(queue)))
+            item_id = senqueue(queue, payload)
+            self.assertEquals(const('FSQ_FAIL_TMP'), fork_exec_items(queue,
+                              exec_args=( 'sh', '-c', 'exit {0}'.format(
+                                          const('FSQ_FAIL_TMP')), )))
+            self.assertEquals(1, len(os.listdir(fsq_path.queue(queue))))
+        finally:
+            _c.FSQ_MAX_TRIES = orig_max_tries
@@ -1,10 +1,14 @@
+import random
+import itertools
+
 from . import FSQTestCase
 from .internal import normalize
 from . import constants as _test_c
 
 # FROM PAPA-BEAR IMPORT THE FOLLOWING
 from .. import construct, deconstruct, constants as _c, FSQCoerceError,\
-               FSQEncodeError, FSQMalformedEntryError
+               FSQEncodeError, FSQMalformedEntryError, FSQError
+from ..construct import _deconstruct_walk
 
 class TestConstruct(FSQTestCase):
     def _cycle(self, args, fsq_encode=None, fsq_delimiter=None,
@@ -112,3 +116,22 @@ class TestConstruct(FSQTestCase):
         # non coercable passed as arg
         normalize()
         self.assertRaises(FSQCoerceError, deconstruct, _test_c.NORMAL)
+
+    def test_walk(self):
+        # the fast deconstruct must agree with the char-wise walk, in result
+        # and in failure
+        def result(fn, *args):
+            try:
+                return fn(*args)
+            except FSQError, e:
+                return e.__class__
+        normalize()
+        rand = random.Random(0)
+        chars = ( _c.FSQ_DELIMITER, _c.FSQ_ENCODE, u'0', u'f', u'F', u'g',
+                  u' ', _test_c.NON_ASCII, )
+        for i in range(5000):
+            name = u''.join(itertools.chain(( _c.FSQ_DELIMITER, ), (
+                rand.choice(chars) for i in range(rand.randint(1, 12)))))
+            self.assertEquals(result(deconstruct, name),
+                              result(_deconstruct_walk, name,
+                                     _c.FSQ_DELIMITER, _c.FSQ_ENCODE))
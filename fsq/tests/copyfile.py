@@ -0,0 +1,79 @@
+import os
+import threading
+import StringIO
+import cStringIO
+
+from . import FSQTestCase, constants as _test_c
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from ..internal import copy_file
+
+# more than one kernel copy, and more than one read
+_PAYLOAD = os.urandom(3*1024*1024 + 17)
+
+class TestCopyFile(FSQTestCase):
+    def _targets(self, n):
+        '''Open n target files, returns their paths and fds'''
+        paths = [ os.path.join(_test_c.TEST_DIR, u'trg{0}'.format(i)) for\
+                  i in range(n) ]
+        return paths, [ os.open(p, os.O_WRONLY|os.O_CREAT|os.O_EXCL, 0600)\
+                        for p in paths ]
+
+    def _assert_copied(self, src_file, payload, n=2, **kwargs):
+        '''Copy src_file to n targets, and assert that each is payload'''
+        paths, fds = self._targets(n)
+        try:
+            self.assertEquals(len(payload), copy_file(src_file, fds,
+                              **kwargs))
+        finally:
+            for fd in fds:
+                os.close(fd)
+        for p in paths:
+            with open(p, 'rb') as f:
+                self.assertTrue(payload == f.read())
+            os.unlink(p)
+
+    def test_regular(self):
+        '''Test copying the rest of a regular file, from its offset, leaving
+           it at its end'''
+        src_path = os.path.join(_test_c.TEST_DIR, u'src')
+        with open(src_path, 'wb') as f:
+            f.write(_PAYLOAD)
+        for n in ( 1, 3, ):
+            with open(src_path, 'rb') as src_file:
+                self._assert_copied(src_file, _PAYLOAD, n=n)
+                self.assertEquals('', src_file.read())
+            with open(src_path, 'rb') as src_file:
+                src_file.seek(1000)
+                self._assert_copied(src_file, _PAYLOAD[1000:], n=n)
+        # empty
+        with open(src_path, 'wb') as f:
+            pass
+        with open(src_path, 'rb') as src_file:
+            self._assert_copied(src_file, '')
+
+    def test_pipe(self):
+        '''Test copying from a pipe, to one target, and to many'''
+        for n in ( 1, 3, ):
+            rfd, wfd = os.pipe()
+            def write():
+                try:
+                    os.write(wfd, _PAYLOAD[:100])
+                    with os.fdopen(os.dup(wfd), 'wb') as f:
+                        f.write(_PAYLOAD[100:])
+                finally:
+                    os.close(wfd)
+            writer = threading.Thread(target=write)
+            writer.start()
+            try:
+                with os.fdopen(rfd, 'rb') as src_file:
+                    self._assert_copied(src_file, _PAYLOAD, n=n)
+            finally:
+                writer.join()
+
+    def test_stringio(self):
+        '''Test copying from file-like objects without a file descriptor'''
+        for cls in ( StringIO.StringIO, cStringIO.StringIO, ):
+            self._assert_copied(cls(_PAYLOAD), _PAYLOAD)
+            self._assert_copied(cls(_PAYLOAD), _PAYLOAD, bufsize=4093)
+        # unicode is coerced as file.write would
+        self._assert_copied(StringIO.StringIO(u'abc'*1000), 'abc'*1000)
@@ -0,0 +1,80 @@
+import os
+import time
+import datetime
+
+from . import FSQTestCase
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, vsenqueue, scan, promote, next_due,\
+               deconstruct, constants as _c, path as fsq_path
+from ..delay import backoff
+
+class TestDelay(FSQTestCase):
+    def test_backoff(self):
+        '''Test backing off retries into the delay directory, and promoting
+           them once they come due'''
+        self.assertEquals(0, backoff(3, 0))
+        self.assertEquals(10, backoff(1, 10))
+        self.assertEquals(40, backoff(3, 10))
+        self.assertEquals(_c.FSQ_BACKOFF_MAX, backoff(30, 10))
+        self.assertEquals(7, backoff(2, lambda tries: tries + 5))
+        queue = normalize()
+        install(queue)
+        self.assertEquals(None, next_due(queue))
+        self.assertEquals([], promote(queue))
+        senqueue(queue, 'retry me')
+        now = time.time()
+        item = list(scan(queue, max_tries=3))[0]
+        item_id = item.fail_tmp(backoff=600)
+        item.close()
+        self.assertEquals(u'1', deconstruct(item_id)[1][4])
+        self.assertEquals([], os.listdir(fsq_path.queue(queue)))
+        # not before the backoff, and no more than a bucket after
+        due = next_due(queue)
+        self.assertTrue(now + 600 <= due <= now + 601 + _c.FSQ_DELAY_BUCKET)
+        self.assertEquals([ item_id ], os.listdir(fsq_path.delay(queue,
+                          u'{0:010d}'.format(due))))
+        # scans never see delayed work-items
+        self.assertEquals([], list(scan(queue, max_tries=3)))
+        self.assertEquals([], promote(queue, now=due - 1))
+        self.assertEquals([ item_id ], promote(queue, now=due))
+        self.assertEquals(None, next_due(queue))
+        self.assertEquals([], os.listdir(fsq_path.delay(queue)))
+        retried = list(scan(queue, max_tries=3))
+        self.assertEquals([ item_id ], [ i.id for i in retried ])
+        self.assertEquals('retry me', retried[0].item.read())
+        # backoff=0 retries immediately
+        self.assertEquals([ retried[0].fail_tmp(backoff=0) ],
+                          os.listdir(fsq_path.queue(queue)))
+
+    def test_not_before(self):
+        '''Test enqueueing work-items which may not be worked before some
+           time'''
+        queue = normalize()
+        install(queue)
+        now = time.time()
+        later = senqueue(queue, 'later', 'a', not_before=now + 3600)
+        # a datetime is local time, as enqueued_at
+        at = datetime.datetime.fromtimestamp(now + 7200)
+        latest = vsenqueue(queue, 'latest', ( 'b', ), not_before=at)
+        # not before a time which has passed is now
+        sooner = senqueue(queue, 'sooner', not_before=now - 60)
+        self.assertEquals([ sooner ], os.listdir(fsq_path.queue(queue)))
+        self.assertEquals([], os.listdir(fsq_path.tmp(queue)))
+        due = next_due(queue)
+        self.assertTrue(now + 3600 <= due <= now + 3601 + _c.FSQ_DELAY_BUCKET)
+        self.assertEquals(2, len(os.listdir(fsq_path.delay(queue))))
+        self.assertEquals([ sooner ], [ i.id for i in scan(queue) ])
+        # only the buckets which have come due are promoted
+        self.assertEquals([], promote(queue, now=due - 1))
+        self.assertEquals([ later ], promote(queue, now=due))
+        self.assertEquals(1, len(os.listdir(fsq_path.delay(queue))))
+        self.assertEquals([ latest ], promote(queue, now=now + 7200 +
+                                              _c.FSQ_DELAY_BUCKET))
+        self.assertEquals([], os.listdir(fsq_path.delay(queue)))
+        self.assertEquals(sorted([ sooner, later, latest ]),
+                          sorted(os.listdir(fsq_path.queue(queue))))
+        items = dict(( i.id, i, ) for i in scan(queue))
+        self.assertEquals('later', items[later].item.read())
+        self.assertEquals(( u'a', ), items[later].arguments)
+        self.assertEquals('latest', items[latest].item.read())
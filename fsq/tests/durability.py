@@ -0,0 +1,146 @@
+import os
+import stat
+import time
+
+from . import FSQTestCase
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, scan, success, fail_perm, sync,\
+               constants as _c, path as fsq_path, FSQEnvError
+from ..durability import sync_dirs
+
+class TestDurability(FSQTestCase):
+    def _fsyncs(self):
+        '''Record each os.fsync as ( is_dir, path, ), on self.synced'''
+        self.synced = []
+        fsync = self.fsync = os.fsync
+        def recorder(fd):
+            is_dir = stat.S_ISDIR(os.fstat(fd).st_mode)
+            self.synced.append(( is_dir, os.path.realpath(
+                                 os.readlink('/proc/self/fd/{0}'.format(fd)))
+                                 if is_dir else None, ))
+            return fsync(fd)
+        os.fsync = recorder
+
+    def _dirs(self):
+        return [ p for is_dir, p in self.synced if is_dir ]
+
+    def _files(self):
+        return len([ is_dir for is_dir, p in self.synced if not is_dir ])
+
+    def _wait(self, n, timeout=2):
+        start = time.time()
+        while len(self._dirs()) < n and time.time() - start < timeout:
+            time.sleep(0.01)
+
+    def _idle(self):
+        '''Drain any group pending from a prior test, and let the flusher
+           thread finish a timed wait begun by it'''
+        # wake a flusher left waiting on a long interval
+        sync()
+        sync_dirs(_c.FSQ_ROOT, durability=u'group')
+        sync()
+        time.sleep(max(0.1, _c.FSQ_DURABILITY_GROUP_MS/500.0))
+
+    def test_durability(self):
+        '''Test enqueue, success and fail at each durability level'''
+        orig_durability = _c.FSQ_DURABILITY
+        orig_ms = _c.FSQ_DURABILITY_GROUP_MS
+        self._idle()
+        self._fsyncs()
+        try:
+            # group fsyncs wait on sync, here
+            _c.FSQ_DURABILITY_GROUP_MS = 60000
+            for durability in ( u'none', u'data', u'full', u'group', ):
+                queue = normalize()
+                install(queue)
+                _c.FSQ_DURABILITY = durability
+                del self.synced[:]
+                senqueue(queue, 'durable', 'success')
+                senqueue(queue, 'durable', 'fail')
+                for item in scan(queue):
+                    if u'success' == item.arguments[0]:
+                        success(item)
+                    else:
+                        fail_perm(item)
+                    del item
+                dirs = set(self._dirs())
+                if u'none' == durability:
+                    self.assertEquals([], self.synced)
+                else:
+                    # one fsync per enqueued file
+                    self.assertEquals(2, self._files())
+                if durability in ( u'none', u'data', u'group', ):
+                    self.assertEquals(set(), dirs)
+                else:
+                    # the parent directory of each link, unlink and rename
+                    self.assertTrue(set([ os.path.realpath(d) for d in\
+                                    ( fsq_path.queue(queue),
+                                      fsq_path.done(queue),
+                                      fsq_path.fail(queue), ) ]) <= dirs)
+                    base = os.path.realpath(fsq_path.base(queue))
+                    for d in dirs:
+                        self.assertTrue(d.startswith(base))
+                sync()
+                if u'group' == durability:
+                    # deferred to the background, or now by sync
+                    self.assertTrue(os.path.realpath(fsq_path.done(queue))\
+                                    in self._dirs())
+                self.assertEquals(1, len(os.listdir(fsq_path.done(queue))))
+                self.assertEquals(1, len(os.listdir(fsq_path.fail(queue))))
+                self.assertEquals([], os.listdir(fsq_path.queue(queue)))
+
+            normalize()
+            _c.FSQ_DURABILITY = u'always'
+            self.assertRaises(FSQEnvError, senqueue, queue, 'durable')
+        finally:
+            os.fsync = self.fsync
+            _c.FSQ_DURABILITY = orig_durability
+            _c.FSQ_DURABILITY_GROUP_MS = orig_ms
+            self._idle()
+
+    def test_group(self):
+        '''Test group directory fsyncs wait on the ops count or interval'''
+        orig_ms = _c.FSQ_DURABILITY_GROUP_MS
+        orig_ops = _c.FSQ_DURABILITY_GROUP_OPS
+        queue = normalize()
+        install(queue)
+        trg_dir = os.path.realpath(fsq_path.queue(queue))
+        self._idle()
+        self._fsyncs()
+        try:
+            # flushed on the ops count, long before the interval
+            _c.FSQ_DURABILITY_GROUP_MS = 60000
+            _c.FSQ_DURABILITY_GROUP_OPS = 3
+            for i in range(2):
+                sync_dirs(trg_dir, durability=u'group')
+            time.sleep(0.1)
+            self.assertEquals([], self._dirs())
+            sync_dirs(trg_dir, durability=u'group')
+            self._wait(1)
+            self.assertEquals([ trg_dir ], self._dirs())
+            self.assertEquals(0, self._files())
+
+            # flushed on the interval, short of the ops count
+            del self.synced[:]
+            _c.FSQ_DURABILITY_GROUP_MS = 200
+            _c.FSQ_DURABILITY_GROUP_OPS = 1000
+            start = time.time()
+            sync_dirs(trg_dir, durability=u'group')
+            self.assertEquals([], self._dirs())
+            self._wait(1)
+            self.assertEquals([ trg_dir ], self._dirs())
+            self.assertTrue(time.time() - start >= 0.15)
+
+            # and flushed now by sync
+            del self.synced[:]
+            _c.FSQ_DURABILITY_GROUP_MS = 60000
+            sync_dirs(trg_dir, durability=u'group')
+            self.assertEquals([], self._dirs())
+            sync()
+            self.assertEquals([ trg_dir ], self._dirs())
+        finally:
+            os.fsync = self.fsync
+            _c.FSQ_DURABILITY_GROUP_MS = orig_ms
+            _c.FSQ_DURABILITY_GROUP_OPS = orig_ops
+            self._idle()
@@ -11,7 +11,8 @@ from .internal import test_type_own_mode, normalize
 # FROM PAPA-BEAR IMPORT THE FOLLOWING
 from .. import enqueue, venqueue, senqueue, vsenqueue, install, deconstruct,\
                constants as _c, FSQPathError, FSQCoerceError,\
-               FSQEnqueueError, FSQEncodeError
+               FSQEnqueueError, FSQEncodeError, scan, path as fsq_path,\
+               venqueue_many, vsenqueue_many, FSQEnqueueItem, set_codec
 
 def _raise(signum, frame):
     raise IOError(errno.EAGAIN, 'Operation timed out')
@@ -722,3 +723,130 @@ class TestEnqueue(FSQTestCase):
         self.assertRaises(FSQCoerceError, senqueue, queue, _test_c.NON_ASCII,
                           [], charset='ascii')
         self._run_gammit(vsenqueue, 's', False)
+
+    def test_tmpfile(self):
+        '''Test enqueueing by way of anonymous files, and by way of tmp'''
+        orig_tmpfile = _c.FSQ_TMPFILE
+        try:
+            for tmpfile in ( 0, 1, ):
+                _c.FSQ_TMPFILE = tmpfile
+                queue = normalize()
+                install(queue)
+                item_ids = [ senqueue(queue, 'tmpfile') ]
+                item_ids.extend(vsenqueue_many(queue, [ ( 'tmpfile', [], ),
+                                                        ( 'tmpfile', [], ) ]))
+                self.assertEquals(sorted(item_ids),
+                                  sorted(os.listdir(fsq_path.queue(queue))))
+                self.assertEquals([], os.listdir(fsq_path.tmp(queue)))
+                for item_id in item_ids:
+                    with open(fsq_path.item(queue, item_id)) as f:
+                        self.assertEquals('tmpfile', f.read())
+        finally:
+            _c.FSQ_TMPFILE = orig_tmpfile
+
+    def test_venqueue_many(self):
+        '''Test venqueue_many and vsenqueue_many'''
+        queue = normalize()
+        install(queue)
+        item_ids = vsenqueue_many(queue, [ ( 'item{0}'.format(i),
+                                  [ u'arg', i, ], ) for i in range(10) ])
+        self.assertEquals(10, len(set(item_ids)))
+        self.assertEquals(sorted(item_ids),
+                          sorted(os.listdir(fsq_path.queue(queue))))
+        self.assertEquals([], os.listdir(fsq_path.tmp(queue)))
+        for i, item_id in enumerate(item_ids):
+            with open(fsq_path.item(queue, item_id)) as f:
+                self.assertEquals('item{0}'.format(i), f.read())
+            self.assertEquals([ u'arg', unicode(i) ],
+                              deconstruct(item_id)[1][-2:])
+        stamps = [ deconstruct(i)[1][0] for i in item_ids ]
+        self.assertEquals(stamps, sorted(stamps))
+
+        with open(_test_c.FILE, 'r') as f:
+            item_id, = venqueue_many(queue, [ ( f, [], ) ])
+        with open(fsq_path.item(queue, item_id)) as f:
+            with open(_test_c.FILE, 'r') as g:
+                self.assertEquals(g.read(), f.read())
+        self.assertRaises(FSQEnqueueError, vsenqueue_many, normalize(),
+                          [ ( 'item', [], ) ])
+
+    def test_enqueueitem(self):
+        '''Test FSQEnqueueItem commit, abort and context management'''
+        queue = normalize()
+        install(queue)
+        other = normalize()
+        install(other)
+        orig_tmpfile = _c.FSQ_TMPFILE
+        _c.FSQ_TMPFILE = 0
+        try:
+            # written directly to tmp, as produced
+            item = FSQEnqueueItem(queue, u'arg')
+            for i in range(10):
+                item.item.write('chunk{0}'.format(i))
+            item.item.flush()
+            self.assertEquals([ item.id ], os.listdir(fsq_path.tmp(queue)))
+            self.assertEquals(60, os.stat(os.path.join(fsq_path.tmp(queue),
+                              item.id)).st_size)
+        finally:
+            _c.FSQ_TMPFILE = orig_tmpfile
+        item_id = item.commit()
+        with open(fsq_path.item(queue, item_id)) as f:
+            self.assertEquals(''.join('chunk{0}'.format(i)\
+                              for i in range(10)), f.read())
+        self.assertEquals([ u'arg' ], deconstruct(item_id)[1][5:])
+        self.assertRaises(FSQEnqueueError, item.commit)
+
+        with FSQEnqueueItem([ queue, other, ]) as item:
+            item.item.write('both')
+        for trg_queue in ( queue, other, ):
+            with open(fsq_path.item(trg_queue, item.id)) as f:
+                self.assertEquals('both', f.read())
+        # linked, rather than copied, into each queue
+        self.assertEquals(os.stat(fsq_path.item(queue, item.id)).st_ino,
+                          os.stat(fsq_path.item(other, item.id)).st_ino)
+        self.assertEquals(2, os.stat(fsq_path.item(queue, item.id)).st_nlink)
+
+        item = FSQEnqueueItem(queue)
+        item.item.write('aborted')
+        item.abort()
+        try:
+            with FSQEnqueueItem(queue) as item:
+                item.item.write('aborted')
+                raise ValueError('abort')
+        except ValueError:
+            pass
+        self.assertEquals(2, len(os.listdir(fsq_path.queue(queue))))
+        self.assertEquals([], os.listdir(fsq_path.tmp(queue)))
+        self.assertRaises(FSQEnqueueError, FSQEnqueueItem, normalize())
+
+        # compressed per queue codec, as venqueue compresses: as written,
+        #  with the codec of the first queue, else copied into queues which
+        #  compress uncompressed payloads
+        set_codec(other, u'zlib')
+        payload = 'x'*4096
+        try:
+            for tmpfile in ( 0, 1, ):
+                _c.FSQ_TMPFILE = tmpfile
+                for trg_queues in ( [ queue, other, ], [ other, queue, ], ):
+                    with FSQEnqueueItem(trg_queues) as item:
+                        item.item.write(payload)
+                    item_id = item.id
+                    paths = [ fsq_path.item(q, item_id) for q in trg_queues ]
+                    for trg_queue, path in zip(trg_queues, paths):
+                        with open(path, 'rb') as f:
+                            self.assertEquals(other in ( trg_queue,
+                                              trg_queues[0], ),
+                                              f.read().startswith(
+                                              '\0fsq-codec:zlib'))
+                    self.assertEquals(other == trg_queues[0],
+                                      os.stat(paths[0]).st_ino ==\
+                                      os.stat(paths[1]).st_ino)
+                    for trg_queue in ( queue, other, ):
+                        for item in scan(trg_queue, lock=False):
+                            if item.id == item_id:
+                                self.assertEquals(payload, item.item.read())
+                            del item
+                        self.assertEquals([], os.listdir(fsq_path.tmp(
+                                          trg_queue)))
+        finally:
+            _c.FSQ_TMPFILE = orig_tmpfile
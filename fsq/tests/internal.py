@@ -1,5 +1,5 @@
 from . import constants as _test_c
-from .. import constants as _c
+from .. import constants as _c, deconstruct
 
 def normalize():
     '''Set FSQ config (aside from FSQ_ROOT) back to normal'''
@@ -13,6 +13,11 @@ def normalize():
     _test_c.COUNT += 1
     return _test_c.TEST_QUEUE.format(_test_c.COUNT)
 
+def untried(item_id):
+    '''The fields of an item id, but for tries, which retries bump'''
+    fields = deconstruct(item_id)[1]
+    return tuple(fields[:4] + fields[5:])
+
 def test_type_own_mode(st, t_path, f_type, uid, gid, mode):
     '''Test a stated file path against an expected type, ownership user and
        group and mode'''
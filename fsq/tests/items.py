@@ -0,0 +1,72 @@
+import os
+import datetime
+
+from . import FSQTestCase
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, scan, construct, deconstruct,\
+               FSQWorkItem, FSQMaxTriesError, FSQTTLExpiredError,\
+               constants as _c, path as fsq_path, items as fsq_items
+from ..internal import fmt_time
+
+class TestItems(FSQTestCase):
+    def test_lazy(self):
+        '''Test that items are validated without parsing their time, which
+           is parsed on first access, and that items have no __dict__'''
+        calls = []
+        class _Datetime(datetime.datetime):
+            @classmethod
+            def strptime(cls, *args):
+                calls.append(args)
+                return datetime.datetime.strptime(*args)
+        class _Module(object):
+            datetime = _Datetime
+
+        queue = normalize()
+        install(queue)
+        item_ids = sorted(senqueue(queue, 'x', u'a', u'b') for i in range(3))
+        fsq_items.datetime = _Module
+        try:
+            items = list(scan(queue, ttl=3600, max_tries=3))
+            self.assertEquals(item_ids, [ item.id for item in items ])
+            self.assertEquals([], calls)
+            self.assertEquals([ 0 ]*3, [ item.tries for item in items ])
+            self.assertEquals(( u'a', u'b', ), items[0].arguments)
+            self.assertEquals([], calls)
+            enqueued_at = items[0].enqueued_at
+            self.assertEquals(deconstruct(item_ids[0])[1][0], fmt_time(
+                              enqueued_at, _c.FSQ_TIMEFMT, _c.FSQ_CHARSET))
+            self.assertTrue(enqueued_at is items[0].enqueued_at)
+            self.assertEquals(1, len(calls))
+        finally:
+            fsq_items.datetime = datetime
+        self.assertFalse(hasattr(items[0], '__dict__'))
+
+    def test_ttl_max_tries(self):
+        '''Test that items past their ttl or max tries are failed
+           permanently as they are constructed'''
+        queue = normalize()
+        install(queue)
+        fields = list(deconstruct(senqueue(queue, 'x'))[1])
+        # an hour ago, and retried twice
+        fields[0] = fmt_time(datetime.datetime.now() -\
+                             datetime.timedelta(seconds=3600),
+                             _c.FSQ_TIMEFMT, _c.FSQ_CHARSET)
+        fields[4] = u'2'
+        item_id = construct(fields)
+        os.rename(fsq_path.item(queue, os.listdir(fsq_path.queue(queue))[0]),
+                  fsq_path.item(queue, item_id))
+        for kwargs in ( dict(ttl=7200, max_tries=3),
+                        dict(ttl=0, max_tries=0), ):
+            item = FSQWorkItem(queue, item_id, no_open=True, lock=False,
+                               **kwargs)
+            self.assertEquals(2, item.tries)
+            del item
+        self.assertRaises(FSQMaxTriesError, FSQWorkItem, queue, item_id,
+                          no_open=True, lock=False, ttl=0, max_tries=2)
+        self.assertEquals([ item_id ], os.listdir(fsq_path.fail(queue)))
+        os.rename(os.path.join(fsq_path.fail(queue), item_id),
+                  fsq_path.item(queue, item_id))
+        self.assertRaises(FSQTTLExpiredError, FSQWorkItem, queue, item_id,
+                          no_open=True, lock=False, ttl=60, max_tries=0)
+        self.assertEquals([ item_id ], os.listdir(fsq_path.fail(queue)))
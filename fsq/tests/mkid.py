@@ -0,0 +1,50 @@
+import os
+import signal
+import threading
+
+from . import FSQTestCase
+from .internal import normalize
+from ..internal import _ID_LOCKS
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, constants as _c, path as fsq_path
+
+class TestMkid(FSQTestCase):
+    def test_threadedids(self):
+        '''Test item ids made by many threads, and following fork, are
+           unique, at second and sub-second timefmt'''
+        orig_timefmt = _c.FSQ_TIMEFMT
+        try:
+            for timefmt in ( u'%Y%m%d%H%M%S', u'%Y%m%d%H%M%S%f', ):
+                _c.FSQ_TIMEFMT = timefmt
+                queue = normalize()
+                install(queue)
+                item_ids = []
+                def produce():
+                    for i in range(200):
+                        item_ids.append(senqueue(queue, 'threaded'))
+                threads = [ threading.Thread(target=produce)\
+                            for i in range(8) ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEquals(1600, len(set(item_ids)))
+                self.assertEquals(sorted(item_ids),
+                                  sorted(os.listdir(fsq_path.queue(queue))))
+                self.assertEquals([], os.listdir(fsq_path.tmp(queue)))
+
+            # a child must not wait on a lock held by a parent thread at fork
+            lock = _ID_LOCKS.setdefault(os.getpid(), threading.Lock())
+            with lock:
+                pid = os.fork()
+                if 0 == pid:
+                    signal.alarm(5)
+                    try:
+                        senqueue(queue, 'forked')
+                        os._exit(0)
+                    except Exception:
+                        os._exit(1)
+            self.assertEquals(0, os.waitpid(pid, 0)[1])
+            self.assertEquals(1601, len(os.listdir(fsq_path.queue(queue))))
+        finally:
+            _c.FSQ_TIMEFMT = orig_timefmt
@@ -0,0 +1,58 @@
+import os
+
+from . import FSQTestCase
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, reenqueue, vreenqueue, FSQWorkItem,\
+               deconstruct, path as fsq_path
+
+# more than one kernel copy, and more than one read
+_PAYLOAD = os.urandom(3*1024*1024 + 17)
+
+class TestReenqueue(FSQTestCase):
+    def _assert_fanout(self, item_id, paths, payload=_PAYLOAD):
+        '''Assert that item_id is in each ( queue, host, ) of paths, with
+           payload, and that nothing is left in tmp'''
+        for queue, host in paths:
+            with open(fsq_path.item(queue, item_id, host=host), 'rb') as f:
+                self.assertTrue(payload == f.read())
+            self.assertEquals([], os.listdir(fsq_path.tmp(queue, host=host)))
+
+    def test_fanout(self):
+        '''Test that each queue reenqueued to gets a byte-identical payload,
+           by way of one copy, fsync'ed one at a time or in parallel'''
+        src_queue = normalize()
+        install(src_queue)
+        item_id = senqueue(src_queue, _PAYLOAD, u'a', u'b')
+        for parallel_fsync in ( False, True, ):
+            queues = [ normalize() for i in range(4) ]
+            for queue in queues:
+                install(queue)
+            item = FSQWorkItem(src_queue, item_id, lock=False)
+            try:
+                self.assertEquals(item_id, vreenqueue(item, queues,
+                                  parallel_fsync=parallel_fsync, dedup=False))
+            finally:
+                item.close()
+            self._assert_fanout(item_id, [ ( q, None, ) for q in queues ])
+            self.assertEquals(( u'a', u'b', ),
+                              tuple(deconstruct(item_id)[1][5:]))
+
+        # from a file, by name, into each host queue
+        hosts = [ u'a', u'b', u'c', ]
+        queue = normalize()
+        install(queue, hosts=hosts)
+        with open(fsq_path.item(src_queue, item_id), 'rb') as src_file:
+            self.assertEquals(item_id, reenqueue(src_file, item_id, queue,
+                              all_hosts=True, dedup=False))
+        self._assert_fanout(item_id, [ ( queue, h, ) for h in hosts ])
+
+        # and by link, which shares the source's inode
+        queues = [ normalize() for i in range(3) ]
+        for queue in queues:
+            install(queue)
+        item = FSQWorkItem(src_queue, item_id, lock=False, no_open=True)
+        self.assertEquals(item_id, vreenqueue(item, queues, link=True))
+        self._assert_fanout(item_id, [ ( q, None, ) for q in queues ])
+        self.assertEquals(len(queues) + 1, os.stat(fsq_path.item(src_queue,
+                          item_id)).st_nlink)
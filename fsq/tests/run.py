@@ -9,6 +9,19 @@ from .encode import TestEncodeDecode
 from .construct import TestConstruct
 from .enqueue import TestEnqueue
 from .scan import TestScan
+from .utility import TestUtility
+from .work import TestWork
+from .watch import TestWatch
+from .copyfile import TestCopyFile
+from .reenqueue import TestReenqueue
+from .durability import TestDurability
+from .mkid import TestMkid
+from .aio import TestAio
+from .codec import TestCodec
+from .blobs import TestBlobs
+from .claimed import TestClaimed
+from .delay import TestDelay
+from .items import TestItems
 from . import constants as _test_c
 
 ############ INTERNAL HELPERS
@@ -56,6 +69,58 @@ def run_scan():
     scan_tests = _LOADER.loadTestsFromTestCase(TestScan)
     return _RUNNER.run(scan_tests)
 
+def run_utility():
+    utility_tests = _LOADER.loadTestsFromTestCase(TestUtility)
+    return _RUNNER.run(utility_tests)
+
+def run_work():
+    work_tests = _LOADER.loadTestsFromTestCase(TestWork)
+    return _RUNNER.run(work_tests)
+
+def run_watch():
+    watch_tests = _LOADER.loadTestsFromTestCase(TestWatch)
+    return _RUNNER.run(watch_tests)
+
+def run_copyfile():
+    copyfile_tests = _LOADER.loadTestsFromTestCase(TestCopyFile)
+    return _RUNNER.run(copyfile_tests)
+
+def run_reenqueue():
+    reenqueue_tests = _LOADER.loadTestsFromTestCase(TestReenqueue)
+    return _RUNNER.run(reenqueue_tests)
+
+def run_durability():
+    durability_tests = _LOADER.loadTestsFromTestCase(TestDurability)
+    return _RUNNER.run(durability_tests)
+
+def run_mkid():
+    mkid_tests = _LOADER.loadTestsFromTestCase(TestMkid)
+    return _RUNNER.run(mkid_tests)
+
+def run_aio():
+    aio_tests = _LOADER.loadTestsFromTestCase(TestAio)
+    return _RUNNER.run(aio_tests)
+
+def run_codec():
+    codec_tests = _LOADER.loadTestsFromTestCase(TestCodec)
+    return _RUNNER.run(codec_tests)
+
+def run_blobs():
+    blobs_tests = _LOADER.loadTestsFromTestCase(TestBlobs)
+    return _RUNNER.run(blobs_tests)
+
+def run_claimed():
+    claimed_tests = _LOADER.loadTestsFromTestCase(TestClaimed)
+    return _RUNNER.run(claimed_tests)
+
+def run_delay():
+    delay_tests = _LOADER.loadTestsFromTestCase(TestDelay)
+    return _RUNNER.run(delay_tests)
+
+def run_items():
+    items_tests = _LOADER.loadTestsFromTestCase(TestItems)
+    return _RUNNER.run(items_tests)
+
 def run_all():
     failures = errors = 0
     failures, errors = _extract(run_paths(), errors, failures)
@@ -67,6 +132,19 @@ def run_all():
     failures, errors = _extract(run_construct(), errors, failures)
     failures, errors = _extract(run_enqueue(), errors, failures)
     failures, errors = _extract(run_scan(), errors, failures)
+    failures, errors = _extract(run_utility(), errors, failures)
+    failures, errors = _extract(run_work(), errors, failures)
+    failures, errors = _extract(run_watch(), errors, failures)
+    failures, errors = _extract(run_copyfile(), errors, failures)
+    failures, errors = _extract(run_reenqueue(), errors, failures)
+    failures, errors = _extract(run_durability(), errors, failures)
+    failures, errors = _extract(run_mkid(), errors, failures)
+    failures, errors = _extract(run_aio(), errors, failures)
+    failures, errors = _extract(run_codec(), errors, failures)
+    failures, errors = _extract(run_blobs(), errors, failures)
+    failures, errors = _extract(run_claimed(), errors, failures)
+    failures, errors = _extract(run_delay(), errors, failures)
+    failures, errors = _extract(run_items(), errors, failures)
     print >> sys.stderr, "Total Tests Run: {0}".format(_test_c.TOTAL_COUNT)
     print >> sys.stderr, "Total Failures: {0}, Total Errors:"\
                          " {1}".format(failures, errors)
@@ -1,17 +1,162 @@
-#import os
-#import socket
-#import errno
-#import signal
-#import numbers
-#import sys
-#import traceback
-
-from . import FSQTestCase # , constants as _test_c
-#from .internal import test_type_own_mode, normalize
+import os
+
+from . import FSQTestCase
+from .internal import normalize, untried
 # FROM PAPA-BEAR IMPORT THE FOLLOWING
-#from .. import enqueue, venqueue, senqueue, vsenqueue, install, deconstruct,\
-#               constants as _c, FSQPathError, FSQCoerceError,\
-#               FSQEnqueueError, FSQEncodeError
+from .. import install, senqueue, scan, path as fsq_path, FSQScanError,\
+               FSQScanGenerator, FSQDownError, FSQInotifyWatcher,\
+               FSQWatchError, down, claim
+from ..scan import _window, _order
 
 class TestScan(FSQTestCase):
-   pass
+    def _enqueue(self, queue, n, hosts=None):
+        '''Enqueue n items, returns their ids, sorted'''
+        install(queue, hosts=hosts)
+        item_ids = [ senqueue(queue, u'x', u'x') for i in range(n) ]
+        item_ids.sort()
+        return item_ids
+
+    def test_window(self):
+        '''Test streaming a queue window items at a time, in order'''
+        queue = normalize()
+        item_ids = self._enqueue(queue, 7)
+        for window in ( 1, 2, 3, 7, 10, ):
+            self.assertEquals(item_ids, list(_window(queue, window)))
+            # with limit, no more than limit items
+            for limit in ( 0, 1, 3, 7, 10, ):
+                self.assertEquals(item_ids[:limit], list(_window(queue,
+                                  window, limit=limit)))
+
+        # empty queues generate nothing, missing queues raise
+        queue = normalize()
+        install(queue)
+        self.assertEquals([], list(_window(queue, 2)))
+        self.assertRaises(FSQScanError, list, _window(normalize(), 2))
+
+    def test_window_hosts(self):
+        '''Test streaming host queues window items at a time, time sorted
+           across all hosts'''
+        queue = normalize()
+        hosts = [ u'a', u'b', ]
+        item_ids = self._enqueue(queue, 6, hosts=hosts)
+        expected = []
+        for i, item_id in enumerate(item_ids):
+            trg_host = hosts[i%2]
+            os.rename(fsq_path.item(queue, item_id),
+                      fsq_path.item(queue, item_id, host=trg_host))
+            expected.append(( trg_host, item_id, ))
+        for window in ( 1, 4, 6, 10, ):
+            self.assertEquals(expected, list(_window(queue, window,
+                              host=True)))
+            self.assertEquals(expected[:3], list(_window(queue, window,
+                              limit=3, host=True)))
+            self.assertEquals([ x for x in expected if u'b' == x[0] ],
+                              list(_window(queue, window, hosts=[ u'b' ])))
+
+    def test_window_retry(self):
+        '''Test that items retried in place during a windowed scan are
+           generated exactly once'''
+        for window in ( 1, 2, 3, ):
+            queue = normalize()
+            item_ids = self._enqueue(queue, 7)
+            scanned = []
+            for item in scan(queue, window=window, max_tries=0, ttl=0):
+                scanned.append(item.id)
+                item.fail_tmp(backoff=0)
+                del item
+            self.assertEquals(item_ids, scanned)
+            self.assertEquals([ untried(i) for i in item_ids ],
+                              sorted(untried(i) for i in\
+                                     os.listdir(fsq_path.queue(queue))))
+
+    def test_limit(self):
+        '''Test scanning a queue with window and limit'''
+        queue = normalize()
+        item_ids = self._enqueue(queue, 5)
+        for window in ( 0, 2, 5, ):
+            self.assertEquals(item_ids, [ i.id for i in scan(queue,
+                              window=window, no_open=True, lock=False) ])
+            self.assertEquals(item_ids[:3], [ i.id for i in scan(queue,
+                              window=window, limit=3, no_open=True,
+                              lock=False) ])
+        # missing queues raise on scan, rather than on iteration
+        self.assertRaises(FSQScanError, scan, normalize(), window=2)
+
+    def _scan_down(self, queue, item_ids, n, **kwargs):
+        '''Scan n items, take the queue down, then scan, returns the number
+           of items generated before FSQDownError (None, if it never was)'''
+        items = FSQScanGenerator(queue, item_ids, lock=False, no_open=True,
+                                 **kwargs)
+        for i in range(n):
+            items.next()
+        down(queue)
+        generated = 0
+        try:
+            for item in items:
+                generated += 1
+        except FSQDownError:
+            return generated
+        return None
+
+    def test_down_cache(self):
+        '''Test that a scan notices a queue being taken down, within the
+           bounds of its down-file cache'''
+        # strict, stats for every item
+        queue = normalize()
+        item_ids = self._enqueue(queue, 6)
+        self.assertEquals(0, self._scan_down(queue, item_ids, 2,
+                          down_cache_ms=0, down_cache_items=0,
+                          down_watch=False))
+        # cached for 3 items, including the first
+        queue = normalize()
+        item_ids = self._enqueue(queue, 6)
+        self.assertEquals(2, self._scan_down(queue, item_ids, 1,
+                          down_cache_ms=0, down_cache_items=3,
+                          down_watch=False))
+        # cached for an hour
+        queue = normalize()
+        item_ids = self._enqueue(queue, 6)
+        self.assertEquals(None, self._scan_down(queue, item_ids, 1,
+                          down_cache_ms=3600000, down_cache_items=0,
+                          down_watch=False))
+
+        # watched, cached until the down-file changes
+        try:
+            FSQInotifyWatcher().close()
+        except FSQWatchError:
+            return
+        queue = normalize()
+        item_ids = self._enqueue(queue, 6)
+        self.assertEquals(0, self._scan_down(queue, item_ids, 2,
+                          down_cache_ms=3600000, down_cache_items=0,
+                          down_watch=True))
+
+    def test_claim(self):
+        '''Test claiming many items in one pass, from a hashed offset'''
+        queue = normalize()
+        install(queue)
+        self.assertEquals([], claim(queue, 10))
+        item_ids = sorted(senqueue(queue, str(i)) for i in range(20))
+        first = claim(queue, 5, worker=u'worker-a')
+        self.assertEquals(5, len(first))
+        offset, stride = _order(u'worker-a', len(item_ids))
+        self.assertEquals(( offset, stride, ), _order(u'worker-a',
+                          len(item_ids)))
+        self.assertEquals([ item_ids[(offset + i*stride) % len(item_ids)]\
+                            for i in range(5) ], [ item.id for item in first ])
+        # items locked by the first claim are skipped, by claim and scan
+        rest = claim(queue, 100, window=0)
+        self.assertEquals(15, len(rest))
+        self.assertEquals(sorted(item_ids), sorted(item.id for item in\
+                          first + rest))
+        self.assertEquals([], list(scan(queue)))
+        self.assertEquals([], claim(queue, 1))
+        for item in first:
+            item.success()
+        del first, rest
+        # window limits claims to the oldest items
+        item_ids = sorted(os.listdir(fsq_path.queue(queue)))
+        windowed = claim(queue, 100, window=8)
+        self.assertEquals(sorted(item_ids[:8]), sorted(item.id for item in\
+                          windowed))
+        self.assertRaises(FSQScanError, claim, normalize(), 1)
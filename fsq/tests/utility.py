@@ -0,0 +1,208 @@
+import os
+import signal
+import time
+
+from . import FSQTestCase, constants as _test_c
+from .internal import normalize, untried
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, deconstruct, fork_exec_items, const,\
+               constants as _c, path as fsq_path, exec_items, scand, down,\
+               up, FSQDownError, construct, FSQTimeFmtError, FSQWorkItem
+from ..utility import exit_rc
+
+# exit with the item's first argument, should its payload be the same
+_EXIT_ARG = ( 'sh', '-c', 'test "$(cat)" = "$0" && exit "$0"', )
+
+# report each item's payload as its exit code, but for items with payload x,
+#  which are done by the exit code of the program; log items per exec to $0
+_BATCH_ARGS = ( 'sh', '-c', 'echo $# >> "$0"; for p; do code=$(cat "$p");'\
+                ' test x = "$code" || echo "$code $p" >&$FSQ_STATUS_FD;'\
+                ' done; exit 111', )
+
+# kill ourselves, should the item's first argument be kill, else succeed
+_KILL_ARGS = ( 'sh', '-c', 'test kill = "$0" && kill -9 $$; exit 0', )
+
+class TestUtility(FSQTestCase):
+    def setUp(self):
+        super(TestUtility, self).setUp()
+        self._max_tries = _c.FSQ_MAX_TRIES
+        # so that fail_tmp retries, rather than failing permanently
+        _c.FSQ_MAX_TRIES = 2
+
+    def tearDown(self):
+        _c.FSQ_MAX_TRIES = self._max_tries
+        super(TestUtility, self).tearDown()
+
+    def _enqueue_codes(self, queue, codes):
+        install(queue)
+        return dict(( senqueue(queue, str(code), str(code)), code, )\
+                    for code in codes)
+
+    def _assert_done(self, queue, item_ids):
+        '''Assert that each item is done by its exit code'''
+        success = const('FSQ_SUCCESS')
+        fail_tmp = const('FSQ_FAIL_TMP')
+        done = os.listdir(fsq_path.done(queue))
+        failed = os.listdir(fsq_path.fail(queue))
+        # retried items keep all but their tries
+        retried = dict(( untried(i), i, ) for i in\
+                       os.listdir(fsq_path.queue(queue)))
+        for item_id, code in item_ids.iteritems():
+            if success == code:
+                self.assertTrue(item_id in done)
+            elif fail_tmp == code:
+                # retried, with its tries bumped
+                self.assertTrue(untried(item_id) in retried)
+                self.assertEquals(u'1', deconstruct(retried[untried(
+                                  item_id)])[1][4])
+            else:
+                self.assertTrue(item_id in failed)
+        self.assertEquals(len(item_ids), len(done) + len(failed) +\
+                          len(retried))
+
+    def test_exitrc(self):
+        '''Test aggregating exit codes: permanent failure trumps all, any
+           other failure trumps success'''
+        success = const('FSQ_SUCCESS')
+        fail_tmp = const('FSQ_FAIL_TMP')
+        fail_perm = const('FSQ_FAIL_PERM')
+        self.assertEquals(success, exit_rc(success, success))
+        self.assertEquals(fail_tmp, exit_rc(success, fail_tmp))
+        self.assertEquals(3, exit_rc(success, 3))
+        self.assertEquals(fail_perm, exit_rc(fail_tmp, fail_perm))
+        self.assertEquals(fail_perm, exit_rc(fail_perm, success))
+        self.assertEquals(fail_perm, exit_rc(fail_perm, fail_tmp))
+        self.assertEquals(fail_tmp, exit_rc(3, fail_tmp))
+
+    def test_forkexecitems(self):
+        '''Test doing items by the exit code of the program run for each,
+           one at a time, and concurrently'''
+        for jobs in ( 1, 4, ):
+            queue = normalize()
+            item_ids = self._enqueue_codes(queue, ( const('FSQ_SUCCESS'),
+                                           const('FSQ_FAIL_TMP'),
+                                           const('FSQ_FAIL_PERM'), 3, ))
+            self.assertEquals(const('FSQ_FAIL_PERM'), fork_exec_items(queue,
+                              exec_args=_EXIT_ARG, jobs=jobs))
+            self._assert_done(queue, item_ids)
+
+        # without permanent failure, any failure trumps success
+        queue = normalize()
+        item_ids = self._enqueue_codes(queue, ( const('FSQ_SUCCESS'),
+                                       const('FSQ_FAIL_TMP'), ))
+        self.assertEquals(const('FSQ_FAIL_TMP'), fork_exec_items(queue,
+                          exec_args=_EXIT_ARG, jobs=2))
+        self._assert_done(queue, item_ids)
+
+        # all success is success, and no_done leaves items be
+        queue = normalize()
+        item_ids = self._enqueue_codes(queue, ( const('FSQ_SUCCESS'), ) * 3)
+        self.assertEquals(const('FSQ_SUCCESS'), fork_exec_items(queue,
+                          exec_args=_EXIT_ARG, no_done=True))
+        self.assertEquals(sorted(item_ids),
+                          sorted(os.listdir(fsq_path.queue(queue))))
+        self.assertEquals(const('FSQ_SUCCESS'), fork_exec_items(queue,
+                          exec_args=_EXIT_ARG, jobs=3))
+        self._assert_done(queue, item_ids)
+
+    def test_malformed(self):
+        '''Test that items with malformed ids are failed permanently: as
+           they are constructed, should their tries be malformed, else as
+           they are worked, and that the scan goes on'''
+        queue = normalize()
+        item_ids = self._enqueue_codes(queue, ( const('FSQ_SUCCESS'), ) * 2)
+        fields = list(deconstruct(item_ids.keys()[0])[1])
+        fields[4] = u'x'
+        bad_tries = construct(fields)
+        fields[0], fields[4] = u'notatime', u'0'
+        bad_time = construct(fields)
+        for bad_id in ( bad_tries, bad_time, ):
+            with open(fsq_path.item(queue, bad_id), 'w') as f:
+                f.write(str(const('FSQ_SUCCESS')))
+        self.assertRaises(FSQTimeFmtError, FSQWorkItem, queue, bad_tries,
+                          no_open=True, lock=False)
+        self.assertEquals([ bad_tries ], os.listdir(fsq_path.fail(queue)))
+        item = FSQWorkItem(queue, bad_time, no_open=True, lock=False)
+        self.assertRaises(FSQTimeFmtError, getattr, item, 'enqueued_at')
+        del item
+
+        os.rename(os.path.join(fsq_path.fail(queue), bad_tries),
+                  fsq_path.item(queue, bad_tries))
+        self.assertEquals(const('FSQ_FAIL_TMP'), fork_exec_items(queue,
+                          exec_args=_EXIT_ARG))
+        self.assertEquals(sorted([ bad_tries, bad_time ]),
+                          sorted(os.listdir(fsq_path.fail(queue))))
+        self.assertEquals(sorted(item_ids),
+                          sorted(os.listdir(fsq_path.done(queue))))
+
+    def test_batch(self):
+        '''Test doing a batch of items, exec'ed at once, by the exit code
+           reported for each on FSQ_STATUS_FD, else by the exit code of the
+           program'''
+        for jobs, batch in ( ( 1, 2, ), ( 2, 3, ), ( 1, 10, ), ):
+            queue = normalize()
+            log = os.path.join(_test_c.TEST_DIR, queue)
+            item_ids = self._enqueue_codes(queue, ( const('FSQ_SUCCESS'),
+                                           const('FSQ_FAIL_PERM'), 3,
+                                           const('FSQ_SUCCESS'),
+                                           const('FSQ_FAIL_TMP'), ))
+            item_ids[senqueue(queue, 'x', 'x')] = const('FSQ_FAIL_TMP')
+            self.assertEquals(const('FSQ_FAIL_PERM'), fork_exec_items(queue,
+                              exec_args=_BATCH_ARGS + ( log, ),
+                              jobs=jobs, batch=batch))
+            self._assert_done(queue, item_ids)
+            # no more than batch items per exec
+            with open(log) as f:
+                counts = [ int(l) for l in f ]
+            self.assertEquals(len(item_ids), sum(counts))
+            self.assertEquals(-(-len(item_ids) // batch), len(counts))
+            self.assertTrue(batch >= max(counts))
+
+    def test_execitems(self):
+        '''Test that exec_items raises, rather than exiting, and returns the
+           signal which terminated a program'''
+        queue = normalize()
+        install(queue)
+        kill_id = senqueue(queue, 'kill', 'kill')
+        down(queue)
+        self.assertRaises(FSQDownError, exec_items, queue,
+                          exec_args=_KILL_ARGS)
+        up(queue)
+        self.assertEquals(signal.SIGKILL, exec_items(queue,
+                          exec_args=_KILL_ARGS)[1])
+        self.assertEquals([ kill_id ], os.listdir(fsq_path.fail(queue)))
+
+    def test_scand(self):
+        '''Test that scand waits out a down queue, and goes on scanning
+           after a program is terminated by signal'''
+        queue = normalize()
+        install(queue)
+        down(queue)
+        kill_id = senqueue(queue, 'kill', 'kill')
+        pid = os.fork()
+        if 0 == pid:
+            try:
+                scand(queue, rescan=0.1, exec_args=_KILL_ARGS)
+            finally:
+                os._exit(1)
+        try:
+            time.sleep(0.5)
+            self.assertEquals(( 0, 0, ), os.waitpid(pid, os.WNOHANG))
+            self.assertEquals([ kill_id ], os.listdir(fsq_path.queue(queue)))
+            up(queue)
+            for i in xrange(50):
+                if os.listdir(fsq_path.fail(queue)):
+                    break
+                time.sleep(0.1)
+            self.assertEquals([ kill_id ], os.listdir(fsq_path.fail(queue)))
+            # and on, after the signal
+            ok_id = senqueue(queue, 'ok', 'ok')
+            for i in xrange(50):
+                if os.listdir(fsq_path.done(queue)):
+                    break
+                time.sleep(0.1)
+            self.assertEquals([ ok_id ], os.listdir(fsq_path.done(queue)))
+            self.assertEquals(( 0, 0, ), os.waitpid(pid, os.WNOHANG))
+        finally:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
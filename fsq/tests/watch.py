@@ -0,0 +1,130 @@
+import os
+
+from . import FSQTestCase, constants as _test_c
+from .internal import normalize
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, trigger_pull, path as fsq_path,\
+               FSQTriggerWatcher, FSQInotifyWatcher, FSQWatchError
+from ..scan import _follow, _list
+
+class TestWatch(FSQTestCase):
+    def _inotify(self):
+        '''An FSQInotifyWatcher, or None, should inotify be unavailable'''
+        try:
+            return FSQInotifyWatcher()
+        except FSQWatchError:
+            return None
+
+    def test_trigger(self):
+        '''Test that a burst of trigger pulls wakes a watcher once'''
+        queue = normalize()
+        install(queue, is_triggered=True)
+        watcher = FSQTriggerWatcher(queue)
+        try:
+            self.assertFalse(watcher.wait(0))
+            for i in range(3):
+                trigger_pull(queue)
+            self.assertTrue(watcher.wait(0))
+            self.assertFalse(watcher.wait(0))
+        finally:
+            watcher.close()
+
+        # without a trigger, wait sleeps out its timeout
+        queue = normalize()
+        install(queue)
+        watcher = FSQTriggerWatcher(queue)
+        try:
+            self.assertEquals(None, watcher.fileno())
+            self.assertFalse(watcher.wait(0))
+            self.assertRaises(FSQWatchError, watcher.wait)
+        finally:
+            watcher.close()
+
+    def test_inotify(self):
+        '''Test that new entries are reported with their key, and entries
+           renamed between watched directories are not'''
+        watcher = self._inotify()
+        if watcher is None:
+            return
+        try:
+            watched = os.path.join(_test_c.TEST_DIR, u'watched')
+            other = os.path.join(_test_c.TEST_DIR, u'other')
+            outside = os.path.join(_test_c.TEST_DIR, u'outside')
+            for d in ( watched, other, outside, ):
+                os.mkdir(d)
+            watcher.add(watched, u'w')
+            watcher.add(other, u'o')
+            self.assertFalse(watcher.wait(0))
+
+            open(os.path.join(watched, u'created'), 'w').close()
+            self.assertTrue(watcher.wait(0))
+            self.assertEquals(( [ ( u'w', u'created', ) ], False, ),
+                              watcher.read())
+            self.assertFalse(watcher.wait(0))
+
+            # moved in from outside is new, moved between watched is not
+            open(os.path.join(outside, u'moved'), 'w').close()
+            os.rename(os.path.join(outside, u'moved'),
+                      os.path.join(other, u'moved'))
+            os.rename(os.path.join(watched, u'created'),
+                      os.path.join(other, u'created'))
+            self.assertEquals(( [ ( u'o', u'moved', ) ], False, ),
+                              watcher.read())
+
+            # a watched directory going away loses events
+            os.rename(os.path.join(other, u'moved'),
+                      os.path.join(outside, u'moved'))
+            os.unlink(os.path.join(other, u'created'))
+            os.rmdir(other)
+            self.assertEquals(( [], True, ), watcher.read())
+        finally:
+            watcher.close()
+
+    def test_batched(self):
+        '''Test that events which arrive between reads are read at once, in
+           order of arrival'''
+        watcher = self._inotify()
+        if watcher is None:
+            return
+        try:
+            watched = os.path.join(_test_c.TEST_DIR, u'watched')
+            os.mkdir(watched)
+            watcher.add(watched)
+            names = [ u'{0:04d}'.format(i) for i in range(500) ]
+            names.reverse()
+            for name in names:
+                open(os.path.join(watched, name), 'w').close()
+            new, lost = watcher.read()
+            self.assertFalse(lost)
+            self.assertEquals(names, [ name for key, name in new ])
+            self.assertFalse(watcher.wait(0))
+            self.assertEquals(( [], False, ), watcher.read())
+        finally:
+            watcher.close()
+
+    def test_follow(self):
+        '''Test following a queue: all items, then each new item, once'''
+        # without inotify, each trigger pull re-lists the queue
+        watcher = self._inotify()
+        if watcher is None:
+            return
+        watcher.close()
+        queue = normalize()
+        install(queue)
+        item_ids = [ senqueue(queue, u'x', u'x') for i in range(2) ]
+        raced = []
+        def lister():
+            # enqueued after the watch is added, but before the listing
+            raced.append(senqueue(queue, u'y', u'y'))
+            return _list(queue)
+
+        followed = _follow(queue, lister, rescan=5)
+        try:
+            listed = [ followed.next() for i in range(3) ]
+            self.assertEquals(sorted(item_ids + raced), listed)
+            # the raced item is listed, and not generated again on its event
+            new_id = senqueue(queue, u'z', u'z')
+            self.assertEquals(new_id, followed.next())
+            self.assertTrue(new_id in os.listdir(fsq_path.queue(queue)))
+        finally:
+            followed.close()
@@ -0,0 +1,112 @@
+import os
+import sys
+
+from . import FSQTestCase
+from .internal import normalize, untried
+# FROM PAPA-BEAR IMPORT THE FOLLOWING
+from .. import install, senqueue, deconstruct, work, const, constants as _c,\
+               path as fsq_path
+from ..work import _rc
+
+def _handler(item):
+    '''Do an item as its payload says'''
+    payload = item.item.read()
+    if 'none' == payload:
+        return None
+    elif 'true' == payload:
+        return True
+    elif 'false' == payload:
+        return False
+    elif 'perm' == payload:
+        return const('FSQ_FAIL_PERM')
+    elif 'raise' == payload:
+        raise ValueError(payload)
+    elif 'exit' == payload:
+        sys.exit()
+    elif 'exit_perm' == payload:
+        sys.exit(const('FSQ_FAIL_PERM'))
+    elif 'die' == payload:
+        os._exit(1)
+    return payload
+
+# payload -> how the item is done
+_SUCCESS = ( 'none', 'true', 'exit', )
+_FAIL_TMP = ( 'false', 'raise', 'die', )
+_FAIL_PERM = ( 'perm', 'exit_perm', 'garbage', )
+
+class TestWork(FSQTestCase):
+    def setUp(self):
+        super(TestWork, self).setUp()
+        self._max_tries = _c.FSQ_MAX_TRIES
+        # so that fail_tmp retries, rather than failing permanently
+        _c.FSQ_MAX_TRIES = 2
+
+    def tearDown(self):
+        _c.FSQ_MAX_TRIES = self._max_tries
+        super(TestWork, self).tearDown()
+
+    def _assert_done(self, queue, payloads):
+        '''Assert that each item is done by its payload'''
+        done = os.listdir(fsq_path.done(queue))
+        failed = os.listdir(fsq_path.fail(queue))
+        # retried items keep all but their tries
+        retried = dict(( untried(i), i, ) for i in\
+                       os.listdir(fsq_path.queue(queue)))
+        for item_id, payload in payloads.iteritems():
+            if payload in _SUCCESS:
+                self.assertTrue(item_id in done, payload)
+            elif payload in _FAIL_TMP:
+                # retried, with its tries bumped
+                self.assertTrue(untried(item_id) in retried, payload)
+                self.assertEquals(u'1', deconstruct(retried[untried(
+                                  item_id)])[1][4])
+            else:
+                self.assertTrue(item_id in failed, payload)
+        self.assertEquals(len(payloads), len(done) + len(failed) +\
+                          len(retried))
+
+    def test_rc(self):
+        '''Test translating handler return values to exit codes'''
+        for ret in ( None, True, const('FSQ_SUCCESS'), ):
+            self.assertEquals(const('FSQ_SUCCESS'), _rc(ret))
+        self.assertEquals(const('FSQ_FAIL_TMP'), _rc(False))
+        self.assertEquals(const('FSQ_FAIL_TMP'), _rc(const('FSQ_FAIL_TMP')))
+        self.assertEquals(const('FSQ_FAIL_PERM'), _rc(const('FSQ_FAIL_PERM')))
+        self.assertEquals(3, _rc('3'))
+        self.assertEquals(const('FSQ_FAIL_PERM'), _rc('garbage'))
+
+    def test_work(self):
+        '''Test doing items by their handler's return value, exception or
+           exit, with one worker, and many, recycled'''
+        for processes, recycle in ( ( 1, None, ), ( 3, 2, ), ):
+            queue = normalize()
+            install(queue)
+            payloads = {}
+            for payload in _SUCCESS + _FAIL_TMP + _FAIL_PERM:
+                payloads[senqueue(queue, payload, payload)] = payload
+            self.assertEquals(const('FSQ_FAIL_PERM'), work(queue, _handler,
+                              processes=processes, recycle=recycle))
+            self._assert_done(queue, payloads)
+
+    def test_success(self):
+        '''Test that a handler which succeeds, or exits with no code,
+           succeeds its items'''
+        queue = normalize()
+        install(queue)
+        payloads = dict(( senqueue(queue, p, p), p, ) for p in _SUCCESS)
+        self.assertEquals(const('FSQ_SUCCESS'), work(queue, _handler,
+                          processes=2))
+        self._assert_done(queue, payloads)
+        self.assertEquals(sorted(payloads),
+                          sorted(os.listdir(fsq_path.done(queue))))
+
+    def test_died(self):
+        '''Test that the items of workers which die are failed temporarily,
+           and that work goes on without them'''
+        queue = normalize()
+        install(queue)
+        payloads = dict(( senqueue(queue, p, p), p, ) for p in\
+                        ( 'die', 'none', 'die', 'true', ))
+        self.assertEquals(const('FSQ_FAIL_TMP'), work(queue, _handler,
+                          processes=2))
+        self._assert_done(queue, payloads)
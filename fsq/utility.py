@@ -9,7 +9,12 @@
 #                   (default: 111), the item will potentially be retried,
 #                   should the program exit FSQ_FAIL_PERM (default: 100),
 #                   the item will fail permanantly. Any other exit code will
-#                   denote permanant failure.
+#                   denote permanant failure.  scand runs the same, each
+#                   time the trigger for a queue is pulled.
+#
+#                   exec_items does the work, and raises on error;
+#                   fork_exec_items exits on error, as the command line
+#                   does, while scand logs, and waits to rescan.
 #
 # WARNINGS:
 #  * the --empty-ok flag potentially turns fsq-scan into an arbitrary
@@ -18,18 +23,36 @@
 #      iterates, should your exec'ed program hang, the file lock will not
 #      be released.
 #  * like xargs(1), if scan is terminated by signal, it orphans ... if a child
-#      is terminated by signal, scan stops scanning.
+#      is terminated by signal, scan stops scanning (scand stops the scan,
+#      and rescans).
+#
+#  * with jobs > 1, up to jobs children are run at once, and reaped with
+#      waitpid(-1) as they exit; if a child is terminated by signal, scan
+#      stops dispatching, waits for running children and then stops scanning.
+#
+# BATCHES:
+#  with batch > 1, up to batch items are locked and the program is exec'ed
+#  once, with the path of each item appended to its arguments.  The program
+#  may report a result per item by writing lines of the form:
+#
+#      <exit code> <item path or id>
 #
-# TODO: Concurrency? -- not right now
+#  to the file descriptor named by FSQ_STATUS_FD in its environment.  Items
+#  the program does not report on are done by the exit code of the program.
 #
 # This software is for POSIX compliant systems only.
 
 import os
 import sys
+import errno
+import tempfile
+import time
 from . import scan, constants as _c, const, reenqueue, success, fail_tmp, \
               fail_perm, FSQScanError, FSQPathError, FSQCoerceError, \
               FSQDownError, FSQReenqueueError, FSQError, FSQInstallError, \
-              FSQEnqueueError
+              FSQEnqueueError, FSQDoneError, FSQTriggerWatcher, is_down,\
+              promote, next_due, hosts as fsq_hosts
+from .codec import FSQCodecReader, feed
 
 _VERBOSE = False
 _CHARSET = _c.FSQ_CHARSET
@@ -49,6 +72,10 @@ def barf(msg, exit=None, f=sys.stderr):
     shout(msg, f)
     sys.exit(exit)
 
+def _not_done(item):
+    '''The error raised should an item not be done'''
+    return FSQDoneError(errno.EIO, u'cannot done item: {0}'.format(item.id))
+
 def done_item(item, code):
     '''Succeed or fail an item based on the return code of a program'''
     try:
@@ -94,105 +121,252 @@ def setenv(item, timefmt):
     except ValueError:
         shout('invalid timefmt: {0}'.format(timefmt))
         return -1
+    except FSQError, e:
+        # enqueued_at is parsed as it is first needed
+        shout(e.strerror.encode(_CHARSET))
+        return -1
     return 0
 
-def fork_exec_items(queue, ignore_down=False, no_open=False, host=False,
-                    hosts=None, _CHARSET=_c.FSQ_CHARSET, no_done=False,
-                    link=False, trigger=False, exec_args=None, set_env=True,
-                    verbose=False, empty_ok=False):
+def exit_rc(main_rc, rc):
+    '''Aggregate the exit code of a program into the exit code of a scan,
+       permanent failure trumps all, any other failure trumps success'''
+    if rc == const('FSQ_FAIL_PERM'):
+        return rc
+    elif main_rc != const('FSQ_FAIL_PERM') and rc != const('FSQ_SUCCESS'):
+        return rc
+    return main_rc
+
+def read_status(status):
+    '''Read per-item exit codes reported by a batch program, returns a dict
+       of item id -> exit code'''
+    codes = {}
+    status.seek(0)
+    for line in status:
+        try:
+            code, item_id = line.rstrip('\n').split(' ', 1)
+            item_id = os.path.basename(item_id).decode(_CHARSET)
+            codes[item_id] = int(code)
+        except ( ValueError, UnicodeDecodeError, ):
+            shout('invalid status line: {0}'.format(line.rstrip('\n')))
+    return codes
+
+def wait_item(children, no_done=False, main_rc=0):
+    '''Reap any one child with waitpid(-1), and succeed or fail the item(s)
+       it was working on.  Returns the new aggregate exit code, and the signal
+       which terminated the child (or None)'''
+    while True:
+        try:
+            pid, rc = os.waitpid(-1, 0) # wait on any baby fork
+        except ( OSError, IOError, ), e:
+            if e.errno == errno.EINTR:
+                continue
+            raise e
+        # not one of ours, keep waiting
+        if pid in children:
+            break
+
+    batch, status = children.pop(pid)
+    codes = {}
+    signaled = None
+    try:
+        if status is not None:
+            codes = read_status(status)
+    finally:
+        if status is not None:
+            status.close()
+    if os.WIFEXITED(rc):
+        rc = os.WEXITSTATUS(rc)
+    else:
+        signaled = os.WTERMSIG(rc)
+        rc = const('FSQ_FAIL_PERM')
+        shout('{0}: processing terminated by signal {1}'.format(
+              ', '.join(item_id for item, item_id in batch), signaled))
+    not_done = None
+    for item, item_id in batch:
+        code = codes.get(item.id, rc)
+        if not no_done and -1 == done_item(item, code):
+            not_done = item if not_done is None else not_done
+        if signaled is None:
+            main_rc = exit_rc(main_rc, code)
+    if not_done is not None:
+        raise _not_done(not_done)
+    return main_rc, signaled
+
+def close_siblings(children):
+    '''In a baby fork, close items held by other baby forks, so that we
+       don't hold locks for our siblings' items past exec'''
+    for batch, status in children.itervalues():
+        for sibling, sibling_id in batch:
+            sibling.close()
+
+def fork_exec_batch(queue, batch, exec_args, children):
+    '''Fork and exec a program once for a batch of items, with the path of
+       each item appended to exec_args'''
+    fail_tmp = const('FSQ_FAIL_TMP')
+    chirp('working on {0} ...'.format(', '.join(item_id for item, item_id\
+                                                  in batch)))
+    status = tempfile.TemporaryFile()
+    try:
+        pid = os.fork()
+    except Exception, e:
+        status.close()
+        raise e
+
+    if 0 == pid: # child fork
+        try:
+            close_siblings(children)
+            paths = []
+            for item, item_id in batch:
+                paths.append(item.path.encode(_CHARSET))
+                item.close()
+            # dup to drop close-on-exec, so program may report per item
+            os.putenv('FSQ_STATUS_FD', str(os.dup(status.fileno())))
+            os.execvp(exec_args[0], tuple(exec_args) + tuple(paths))
+        except ( OSError, IOError, ), e:
+            shout('{0}: cannot exec {1}'.format(e.strerror, exec_args[0]))
+            os._exit(fail_tmp)
+        except Exception, e:
+            shout('cannot execvp ({0}: {1})'.format(
+                  e.__class__.__name__, e.message))
+        finally:
+            # never return to the parent's scan
+            os._exit(fail_tmp)
+
+    # hold onto the items (and their locks) until reaped
+    children[pid] = ( tuple(batch), status, )
+    return pid
+
+def exec_items(queue, ignore_down=False, no_open=False, host=False,
+               hosts=None, _CHARSET=_c.FSQ_CHARSET, no_done=False, link=False,
+               trigger=False, exec_args=None, set_env=True, verbose=False,
+               empty_ok=False, jobs=1, batch=None):
+    '''Fork/exec a program (or reenqueue, if no exec_args are passed) for each
+       item in a queue, or for each batch of up to batch items, running at
+       most jobs programs at once.  Returns the aggregate exit code of all
+       programs run, and the signal which terminated a program (or None),
+       after which no more programs are run.
+
+       exec_items never exits: should the queue be down, or an item not be
+       done, FSQError is raised, and should fork fail, OSError; see:
+       fork_exec_items, for the command line, and scand.'''
     global _VERBOSE
     _VERBOSE = verbose
     main_rc = 0
+    # pid -> ((item, item_id), ...), status) for each running baby fork
+    children = {}
+    # items locked for the next batch
+    pending = []
+    signaled = None
+    try:
+        jobs = int(jobs)
+        batch = 0 if batch is None or not exec_args else int(batch)
+        if 1 > jobs or 0 > batch:
+            raise ValueError(jobs)
+    except ( TypeError, ValueError, ):
+        raise ValueError(u'jobs and batch must be positive integers, not:'\
+                         u' {0}, {1}'.format(jobs, batch))
     try:
         if exec_args:
             items = scan(queue, ignore_down=ignore_down, no_open=no_open,
                          host=host, hosts=hosts)
         else:
             items = scan(queue, ignore_down=ignore_down, no_open=no_open)
-    except FSQDownError:
-        barf('{0} is down')
-    except (FSQScanError, FSQPathError, ), e:
-        barf(e.strerror)
     except FSQCoerceError, e:
-        barf('cannot coerce queue; charset={0}'.format(_CHARSET))
+        raise FSQCoerceError(e.errno, u'cannot coerce queue;'\
+                             u' charset={0}'.format(_CHARSET))
     try:
         fail_perm = const('FSQ_FAIL_PERM')
-        fail_tmp = const('FSQ_FAIL_PERM')
-        success = const('FSQ_SUCCESS')
+        fail_tmp = const('FSQ_FAIL_TMP')
         timefmt = const('FSQ_TIMEFMT')
-        while True:
+        while signaled is None:
             try:
+                # never run more than jobs baby forks at once
+                while len(children) >= jobs and signaled is None:
+                    main_rc, signaled = wait_item(children, no_done=no_done,
+                                                  main_rc=main_rc)
+                if signaled is not None:
+                    break
                 item = items.next()
                 # cannot exec nothing
                 if empty_ok and 0 == len(exec_args):
                     shout('cannot execvp empty arguments with empty_ok;'\
                           ' failing tmp')
                     if not no_done and -1 == done_item(item, fail_perm):
-                        sys.exit(fail_tmp)
+                        raise _not_done(item)
                     continue
                 try:
                     item_id = item.id.encode(_CHARSET)
                 except UnicodeEncodeError, e:
-                    barf('cannot coerce item id;'\
-                         ' charset={0}'.format(_CHARSET))
+                    raise FSQCoerceError(errno.EINVAL, u'cannot coerce item'\
+                                         u' id; charset={0}'.format(_CHARSET))
+                if batch:
+                    pending.append(( item, item_id, ))
+                    if len(pending) >= batch:
+                        fork_exec_batch(queue, pending, exec_args, children)
+                        pending = []
+                    continue
                 chirp('working on {0} ...'.format(item_id))
-                try:
-                    pid = os.fork()
-                except Exception, e:
-                    barf("cannot fork; aborting")
+                pid = os.fork()
 
                 if 0 == pid: # child fork
-                    if not no_open:
-                        try:
-                            # if available, open item for reading on stdin
-                            os.dup2(item.item.fileno(), sys.stdin.fileno())
-                        except ( OSError, IOError, ), e:
-                            barf('cannot dup: {0}'.format(e.strerror))
-                    # setup the environment -- so C-style it hurts
-                    if set_env and -1 == setenv(item, timefmt):
-                        os._exit(fail_tmp)
-                    if not exec_args:
-                        # exec, potentially via PATH
-                        try:
-                            chirp(reenqueue(item, queue, hosts=hosts,
-                                            all_hosts=host, link=link))
-                            os._exit(0)
-                        except ( FSQReenqueueError ), e:
-                            shout('{0}: cannot reenqueue {0}'.format(e.strerror,
-                                  item_id))
-                            os._exit(fail_tmp)
-                        except Exception, e:
-                            shout('cannot reenqueue ({0}: {1})'.format(
-                                  e.__class__.__name__, e.message))
-                            os._exit(fail_tmp)
-                    else:
-                        try:
-                            os.execvp(exec_args[0], exec_args + item.arguments)
-                        except ( OSError, IOError, ), e:
-                            shout('{0}: cannot exec {0}'.format(e.strerror,
-                                  queue))
-                            os._exit(fail_tmp)
-                        except Exception, e:
-                            shout('cannot execvp ({0}: {1})'.format(
-                                  e.__class__.__name__, e.message))
+                    try:
+                        # don't hold locks for our siblings' items past exec
+                        close_siblings(children)
+                        if not no_open:
+                            try:
+                                # if available, open item for reading on
+                                # stdin, by way of a pipe, fed by this
+                                # process, should it be compressed
+                                if isinstance(item.item, FSQCodecReader):
+                                    feed(item.item)
+                                else:
+                                    os.dup2(item.item.fileno(),
+                                            sys.stdin.fileno())
+                            except ( OSError, IOError, ), e:
+                                shout('cannot dup: {0}'.format(e.strerror))
+                                os._exit(fail_tmp)
+                        # setup the environment -- so C-style it hurts
+                        if set_env and -1 == setenv(item, timefmt):
                             os._exit(fail_tmp)
-                    ######### NOT REACHED
-                    os._exit(fail_perm)
+                        if not exec_args:
+                            # exec, potentially via PATH
+                            try:
+                                chirp(reenqueue(item, queue, hosts=hosts,
+                                                all_hosts=host, link=link))
+                                os._exit(0)
+                            except ( FSQReenqueueError ), e:
+                                shout('{0}: cannot reenqueue {1}'.format(
+                                      e.strerror, item_id))
+                                os._exit(fail_tmp)
+                            except Exception, e:
+                                shout('cannot reenqueue ({0}: {1})'.format(
+                                      e.__class__.__name__, e.message))
+                                os._exit(fail_tmp)
+                        else:
+                            try:
+                                os.execvp(exec_args[0],
+                                          exec_args + item.arguments)
+                            except ( OSError, IOError, ), e:
+                                shout('{0}: cannot exec {1}'.format(
+                                      e.strerror, exec_args[0]))
+                                os._exit(fail_tmp)
+                            except Exception, e:
+                                shout('cannot execvp ({0}: {1})'.format(
+                                      e.__class__.__name__, e.message))
+                                os._exit(fail_tmp)
+                        ######### NOT REACHED
+                        os._exit(fail_perm)
+                    except Exception, e:
+                        shout('cannot work on {0} ({1}: {2})'.format(item_id,
+                              e.__class__.__name__, e))
+                    finally:
+                        # never return to the parent's scan
+                        os._exit(fail_tmp)
                 else: # if pid is non-0, we are the parent fork
-                    pid, rc = os.waitpid(pid, 0) # wait on baby fork
-                    if os.WIFEXITED(rc):
-                        if not no_done and\
-                            -1 == done_item(item, os.WEXITSTATUS(rc)):
-                            sys.exit(fail_tmp)
-                        if rc == fail_perm:
-                            main_rc = rc
-                        elif main_rc != fail_perm and rc != success:
-                            main_rc = rc
-                    else:
-                        if not no_done and -1 == done_item(item, fail_perm):
-                            sys.exit(fail_tmp)
-                        barf('{0}: processing terminated by signal {1};'\
-                             ' aborting'.format(item_id, os.WTERMSIG(rc)))
+                    # hold onto the item (and it's lock) until reaped
+                    children[pid] = ( (( item, item_id, ),), None, )
+            except (FSQDownError, FSQCoerceError, FSQDoneError, ):
+                raise
             except FSQError, e:
                 shout(e.strerror.encode(_CHARSET))
             except StopIteration:
@@ -202,11 +376,124 @@ def fork_exec_items(queue, ignore_down=False, no_open=False, host=False,
                     del item
                 except NameError:
                     pass
-    except FSQDownError:
-        barf('{0} is down'.format(queue))
+
+        # exec whatever is left over for a partial batch
+        while pending and len(children) >= jobs and signaled is None:
+            main_rc, signaled = wait_item(children, no_done=no_done,
+                                          main_rc=main_rc)
+        if pending and signaled is None:
+            fork_exec_batch(queue, pending, exec_args, children)
+    except (FSQDownError, FSQCoerceError, FSQDoneError, ):
+        raise
     except FSQError, e:
         shout(e.strerror.encode(_CHARSET))
     except FSQInstallError, e:
         shout(e.strerror)
-        return const('FSQ_FAIL_TMP')
+        return const('FSQ_FAIL_TMP'), signaled
+    finally:
+        del pending[:]
+        # wait on whatever is left running, before we return or raise
+        not_done = None
+        while children:
+            try:
+                main_rc, sig = wait_item(children, no_done=no_done,
+                                         main_rc=main_rc)
+                signaled = signaled if sig is None else sig
+            except FSQDoneError, e:
+                not_done = e
+
+    if not_done is not None:
+        raise not_done
+    return main_rc, signaled
 
+def fork_exec_items(queue, verbose=False, **kwargs):
+    '''Fork/exec a program for each item in a queue, as exec_items, from the
+       command line: exits with a message should exec_items raise, or should
+       a program be terminated by signal.  Returns the aggregate exit code of
+       all programs run.'''
+    global _VERBOSE
+    _VERBOSE = verbose
+    try:
+        main_rc, signaled = exec_items(queue, verbose=verbose, **kwargs)
+    except FSQDownError:
+        barf('{0} is down'.format(queue))
+    except FSQError, e:
+        barf(e.strerror.encode(_CHARSET))
+    except ( OSError, IOError, ), e:
+        barf('{0}; aborting'.format(e.strerror))
+    except ValueError, e:
+        barf(unicode(e).encode(_CHARSET))
+    if signaled is not None:
+        barf('processing terminated by signal {0}; aborting'.format(signaled))
+    return main_rc
+
+def promote_due(queue, host=False, hosts=None):
+    '''Promote the delayed items of a queue (or of each of its hosts) which
+       have come due; returns the seconds until the next delayed item comes
+       due (0, should any have been promoted), or None, should nothing be
+       delayed'''
+    if not host and hosts is None:
+        hosts = ( None, )
+    elif hosts is None:
+        hosts = fsq_hosts(queue)
+    dues = []
+    for trg_host in hosts:
+        for item_id in promote(queue, host=trg_host):
+            chirp('{0}: promoted {1}'.format(queue, item_id.encode(_CHARSET)))
+            dues.append(0)
+        due = next_due(queue, host=trg_host)
+        if due is not None:
+            dues.append(due)
+    return max(0, min(dues) - time.time()) if dues else None
+
+def scand(queue, rescan=60, ignore_down=False, host=False, hosts=None,
+          exec_args=None, verbose=False, trigger=None, **kwargs):
+    '''Scan a queue forever, using exec_items.  The queue is rescanned as
+       soon as its trigger is pulled, and at least every rescan seconds.
+       Triggers pulled while a scan is in progress cause exactly one more
+       scan.  Host scans wait on the host trigger.
+
+       scand never exits for the queue: should it be down, scand waits, and
+       rescans; should a program be terminated by signal, or an item not be
+       done, scand logs it, and goes on.
+
+       Delayed items (see: fsq.delay) are promoted before each scan, and
+       the queue is rescanned as soon as the next of them comes due.'''
+    global _VERBOSE
+    _VERBOSE = verbose
+    if trigger is None:
+        trigger = _c.FSQ_HOSTS_TRIGGER if exec_args and ( host or hosts ) \
+                  else _c.FSQ_TRIGGER
+    watcher = FSQTriggerWatcher(queue, trigger=trigger)
+    try:
+        if watcher.fileno() is None:
+            shout('{0}: no trigger; rescanning every {1} seconds'.format(
+                  queue, rescan))
+        while True:
+            due = None
+            try:
+                if not ignore_down and is_down(queue):
+                    raise FSQDownError(errno.EAGAIN, u'queue {0}: is'\
+                                       u' down'.format(queue))
+                promote_due(queue, host=host, hosts=hosts)
+                rc, signaled = exec_items(queue, ignore_down=ignore_down,
+                                          host=host, hosts=hosts,
+                                          exec_args=exec_args,
+                                          verbose=verbose, **kwargs)
+                if signaled is not None:
+                    shout('{0}: processing terminated by signal {1};'\
+                          ' rescanning'.format(queue, signaled))
+                chirp('{0}: scanned; exit {1}'.format(queue, rc))
+                # including items delayed by this scan
+                due = promote_due(queue, host=host, hosts=hosts)
+            except FSQDownError:
+                chirp('{0} is down; waiting'.format(queue))
+            except FSQError, e:
+                shout('{0}: {1}; waiting'.format(queue,
+                      e.strerror.encode(_CHARSET)))
+            except ( OSError, IOError, ), e:
+                shout('{0}: {1}; waiting'.format(queue, e.strerror))
+            watcher.wait(due if rescan is None else rescan if due is None\
+                         else min(due, rescan))
+    finally:
+        watcher.close()
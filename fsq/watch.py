@@ -0,0 +1,240 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/watch.py -- provides watchers, for waiting on new work in a queue:
+#                 FSQTriggerWatcher, FSQInotifyWatcher
+#
+#   FSQInotifyWatcher is Linux only, and uses inotify(7) via ctypes; it is
+#   never a hard dependency, should inotify be unavailable it will raise
+#   FSQWatchError with ENOSYS, and callers should fall back to a
+#   FSQTriggerWatcher, or to polling.
+#
+#     fsq is all unicode internally, if you pass in strings,
+#     they will be explicitly coerced to unicode.
+#
+# This software is for POSIX compliant systems only.
+import os
+import errno
+import select
+import struct
+import time
+
+from . import constants as _c, path as fsq_path, FSQWatchError
+from .internal import wrap_io_os_err, load_libc
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+# from sys/inotify.h
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_CLOEXEC = 02000000
+_IN_NONBLOCK = os.O_NONBLOCK
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+_IN_EVENT = struct.Struct('iIII')
+# ( libc, ctypes, ), once inotify functions are prototyped
+_INOTIFY = None
+
+def _inotify():
+    global _INOTIFY
+    if _INOTIFY is None:
+        _INOTIFY = False
+        try:
+            libc, ctypes = load_libc()
+            libc.inotify_init1.argtypes = [ ctypes.c_int ]
+            libc.inotify_add_watch.argtypes = [ ctypes.c_int, ctypes.c_char_p,
+                                                ctypes.c_uint32 ]
+            _INOTIFY = ( libc, ctypes, )
+        except (OSError, AttributeError, ):
+            pass
+    if not _INOTIFY:
+        raise FSQWatchError(errno.ENOSYS, u'inotify is not available')
+    return _INOTIFY
+
+def _select(fd, timeout):
+    '''select on a single fd for reading, retrying on EINTR, returns True
+       if fd is readable, False on timeout'''
+    while True:
+        start = time.time()
+        try:
+            reads, dis, card = select.select([fd], [], [], timeout)
+            return 0 < len(reads)
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise FSQWatchError(e.args[0], os.strerror(e.args[0]))
+            if timeout is not None:
+                timeout = max(0, timeout - (time.time() - start))
+
+####### EXPOSED METHODS AND CLASSES #######
+# every change to the entries of a directory
+IN_CHANGES = _IN_CREATE|_IN_DELETE|_IN_MOVED_FROM|_IN_MOVED_TO
+
+class FSQTriggerWatcher(object):
+    '''An FSQTriggerWatcher holds the trigger fifo (see: trigger,
+       trigger_pull) for a queue open for reading, and waits for bytes to be
+       written to it.  Each call to wait consumes all bytes pending in the
+       fifo, so that a burst of triggers causes only one wake-up.
+
+       Should a queue have no trigger, wait will simply sleep for the timeout
+       passed to it.'''
+    ####### MAGICAL METHODS AND ATTRS #######
+    def __init__(self, queue, trigger=None):
+        self.queue = queue
+        self.trigger = _c.FSQ_TRIGGER if trigger is None else trigger
+        self.fd = self._wfd = None
+        trigger_path = fsq_path.trigger(queue, trigger=self.trigger)
+        try:
+            self.fd = os.open(trigger_path, os.O_RDONLY|os.O_NONBLOCK)
+            # hold a writer open ourselves, so that the fifo never reads EOF
+            # (and selects readable forever) once other writers close
+            self._wfd = os.open(trigger_path, os.O_WRONLY|os.O_NONBLOCK)
+        except (OSError, IOError, ), e:
+            self.close()
+            if e.errno != errno.ENOENT:
+                raise FSQWatchError(e.errno, wrap_io_os_err(e))
+
+    def __del__(self):
+        '''Always close the fifo when the ref count drops to 0'''
+        self.close()
+
+    ####### EXPOSED METHODS AND ATTRS #######
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        for fd in ( getattr(self, 'fd', None), getattr(self, '_wfd', None), ):
+            if fd is not None:
+                os.close(fd)
+        self.fd = self._wfd = None
+
+    def drain(self):
+        '''Consume all pending trigger bytes, returns True if there were any'''
+        triggered = False
+        while self.fd is not None:
+            try:
+                if not os.read(self.fd, 4096):
+                    break
+                triggered = True
+            except (OSError, IOError, ), e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, ):
+                    break
+                if e.errno != errno.EINTR:
+                    raise FSQWatchError(e.errno, wrap_io_os_err(e))
+        return triggered
+
+    def wait(self, timeout=None):
+        '''Wait up to timeout seconds (None, forever) for the trigger to be
+           pulled, returns True if it was pulled, False on timeout'''
+        if self.fd is None:
+            if timeout is None:
+                raise FSQWatchError(errno.ENOENT, u'no trigger for queue:'\
+                                    u' {0}'.format(self.queue))
+            time.sleep(timeout)
+            return False
+        if not _select(self.fd, timeout):
+            return False
+        return self.drain()
+
+class FSQInotifyWatcher(object):
+    '''An FSQInotifyWatcher watches directories with inotify(7) for new
+       entries -- either created (as enqueue does with link) or moved in from
+       outside of any watched directory.  Entries moved between watched
+       directories (e.g. fail_tmp, which renames an item in place) are not
+       reported as new.
+
+       Directories are added with a key (e.g. a host name), which is reported
+       with each new entry.'''
+    ####### MAGICAL METHODS AND ATTRS #######
+    def __init__(self, mask=_IN_CREATE|_IN_MOVED_TO|_IN_MOVED_FROM):
+        libc, ctypes = _inotify()
+        self.mask = mask
+        self.fd = None
+        # wd -> key
+        self.keys = {}
+        self.fd = libc.inotify_init1(_IN_NONBLOCK|_IN_CLOEXEC)
+        if 0 > self.fd:
+            err = ctypes.get_errno()
+            self.fd = None
+            raise FSQWatchError(err, u'cannot inotify_init1:'\
+                                u' {0}'.format(os.strerror(err)))
+
+    def __del__(self):
+        '''Always close the inotify fd when the ref count drops to 0'''
+        self.close()
+
+    ####### EXPOSED METHODS AND ATTRS #######
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if getattr(self, 'fd', None) is not None:
+            os.close(self.fd)
+        self.fd = None
+
+    def add(self, path, key=None):
+        '''Watch a directory, reporting new entries in it with key'''
+        libc, ctypes = _inotify()
+        wd = libc.inotify_add_watch(self.fd, path.encode(_c.FSQ_CHARSET),
+                                    self.mask|_IN_ONLYDIR)
+        if 0 > wd:
+            err = ctypes.get_errno()
+            raise FSQWatchError(err, u'cannot watch: {0}: {1}'.format(
+                                os.strerror(err), path))
+        self.keys[wd] = key
+
+    def wait(self, timeout=None):
+        '''Wait up to timeout seconds (None, forever) for events, returns
+           True if there are events to read, False on timeout'''
+        return _select(self.fd, timeout)
+
+    def events(self):
+        '''Read all pending events, returns a list of (key, name, mask,
+           cookie, ) tuples, in order of arrival, and a boolean, True if
+           events were lost (either the event queue overflowed, or a watched
+           directory went away).'''
+        events = []
+        lost = False
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except (OSError, IOError, ), e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, ):
+                    break
+                if e.errno == errno.EINTR:
+                    continue
+                raise FSQWatchError(e.errno, wrap_io_os_err(e))
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, length = _IN_EVENT.unpack_from(buf, offset)
+                offset += _IN_EVENT.size
+                name = buf[offset:offset+length].rstrip('\0')
+                offset += length
+                if mask&(_IN_Q_OVERFLOW|_IN_IGNORED):
+                    lost = True
+                elif wd in self.keys:
+                    try:
+                        name = name.decode(_c.FSQ_CHARSET)
+                    except UnicodeDecodeError:
+                        continue
+                    events.append(( self.keys[wd], name, mask, cookie, ))
+        return events, lost
+
+    def read(self):
+        '''Read all pending events, returns a list of (key, name, ) tuples
+           for new entries, in order of arrival, and a boolean, True if
+           events were lost and the caller must re-list.'''
+        new = []
+        moved = {}
+        events, lost = self.events()
+        for key, name, mask, cookie in events:
+            if mask&_IN_MOVED_FROM:
+                moved[cookie] = True
+            elif mask&_IN_MOVED_TO and moved.pop(cookie, False):
+                # renamed within our watched directories, not new
+                continue
+            elif mask&(_IN_CREATE|_IN_MOVED_TO):
+                new.append(( key, name, ))
+        return new, lost
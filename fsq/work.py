@@ -0,0 +1,273 @@
+# fsq -- a python library for manipulating and introspecting FSQ queues
+# @author: Matthew Story <matt.story@axial.net>
+#
+# fsq/work.py -- provides a pre-forked pool of python workers for queue
+#                items: work.  work is to python handlers what
+#                fork_exec_items is to programs; each worker imports the
+#                handler once, and is handed many items over its lifetime.
+#
+#                A handler is called with a single FSQWorkItem, and may
+#                return None or True (success), False (temporary failure) or
+#                an exit code (FSQ_SUCCESS, FSQ_FAIL_TMP, FSQ_FAIL_PERM).
+#                A handler which raises an exception fails the item
+#                temporarily, a handler which calls sys.exit is treated as
+#                if it had returned the exit code.
+#
+# WARNINGS:
+#  * the scanning process holds the lock on each item, workers open items
+#      unlocked, handlers should not succeed or fail items themselves.
+#  * should a worker die outright (e.g. os._exit or SIGKILL), the item it
+#      was working on is failed temporarily, once the pool has noticed that
+#      the worker is gone.
+#
+# This software is for POSIX compliant systems only.
+import os
+import sys
+import errno
+import fcntl
+import Queue
+import importlib
+
+from multiprocessing import Pool
+
+from . import constants as _c, const, scan, FSQWorkItem, FSQError,\
+              FSQScanError, FSQPathError, FSQCoerceError, FSQDownError,\
+              utility
+from .utility import done_item, exit_rc, chirp, shout, barf
+
+####### INTERNAL MODULE FUNCTIONS AND ATTRIBUTES #######
+_CHARSET = _c.FSQ_CHARSET
+# seconds between checks for dead workers, while waiting on results
+_POLL = 1
+# handler for this worker, and the fd to which it reports each item it
+#  starts, set once per worker by _init_worker
+_HANDLER = None
+_STARTED = None
+
+def _init_worker(handler, working, started):
+    '''Set up a new worker: close the items the parent is holding locked
+       (working), so that a recycled worker does not hold locks for its
+       siblings' items'''
+    global _HANDLER, _STARTED
+    _HANDLER = handler
+    _STARTED = started
+    for item, result in working.itervalues():
+        item.close()
+    working.clear()
+
+def _callback(results, key):
+    '''Pass a result from the pool's result thread back to the scanner'''
+    def put(result):
+        results.put(( key, result, ))
+    return put
+
+def _rc(ret):
+    '''Translate the return value of a handler to an exit code'''
+    if ret is None or ret is True:
+        return const('FSQ_SUCCESS')
+    elif ret is False:
+        return const('FSQ_FAIL_TMP')
+    try:
+        return int(ret)
+    except (TypeError, ValueError, ):
+        return const('FSQ_FAIL_PERM')
+
+def _work_item(key, trg_queue, item_id, host, no_open, worker=None):
+    '''Run the handler for one item, in a worker, returning an exit code and
+       a message (or None)'''
+    # one write, smaller than PIPE_BUF, is atomic
+    os.write(_STARTED, '{0} {1}\n'.format(key, os.getpid()))
+    item = None
+    try:
+        # parent has already locked and checked ttl/max_tries
+        item = FSQWorkItem(trg_queue, item_id, lock=False, ttl=0,
+                           max_tries=0, no_open=no_open, host=host,
+                           worker=worker)
+        return _rc(_HANDLER(item)), None
+    except SystemExit, e:
+        # sys.exit() is success, as it is for a program
+        return _rc(e.code), None
+    except Exception, e:
+        return const('FSQ_FAIL_TMP'), u'{0}: {1}'.format(
+                   e.__class__.__name__, e)
+    finally:
+        if item is not None:
+            item.close()
+
+def _read_started(started, pids):
+    '''Read the key and pid reported by a worker for each item it has
+       started into pids.  Each report is written whole, so once the pipe is
+       drained no partial report remains.'''
+    buf = ''
+    while True:
+        try:
+            chunk = os.read(started, 4096)
+        except (OSError, IOError, ), e:
+            if e.errno == errno.EINTR:
+                continue
+            elif e.errno != errno.EAGAIN:
+                raise e
+            break
+        if not chunk:
+            break
+        buf += chunk
+    for line in buf.splitlines():
+        key, pid = line.split(' ')
+        pids[int(key)] = int(pid)
+
+def _dead(pool, working, pids):
+    '''Keys of the items in working whose worker has died without a result,
+       e.g. by os._exit or SIGKILL'''
+    alive = set(proc.pid for proc in pool._pool if proc.exitcode is None)
+    dead = []
+    for key, ( item, result, ) in working.iteritems():
+        if key not in pids or pids[key] in alive:
+            continue
+        # a recycled worker exits just after handing back its result
+        result.wait(_POLL)
+        if not result.ready():
+            dead.append(key)
+    return dead
+
+def _done(item, rc, msg, no_done, main_rc):
+    '''Succeed or fail an item by the exit code of its handler'''
+    try:
+        if msg is not None:
+            shout(u'{0}: {1}'.format(item.id, msg).encode(_CHARSET))
+        if not no_done and -1 == done_item(item, rc):
+            sys.exit(const('FSQ_FAIL_TMP'))
+        return exit_rc(main_rc, rc)
+    finally:
+        item.close()
+
+def _wait(results, pool, working, pids, started, no_done, main_rc):
+    '''Wait for a result from any worker, and succeed or fail its item, or
+       for workers to die, and fail their items temporarily.  Returns the
+       new aggregate exit code, and whether any worker died.'''
+    while True:
+        try:
+            key, ( rc, msg, ) = results.get(True, _POLL)
+            pids.pop(key, None)
+            # unless given up for dead, as its result came
+            if key in working:
+                return _done(working.pop(key)[0], rc, msg, no_done,
+                             main_rc), False
+            continue
+        except Queue.Empty:
+            pass
+        _read_started(started, pids)
+        for key in pids.keys():
+            if key not in working:
+                del pids[key]
+        dead = _dead(pool, working, pids)
+        for key in dead:
+            pids.pop(key)
+            main_rc = _done(working.pop(key)[0], const('FSQ_FAIL_TMP'),
+                            u'worker died', no_done, main_rc)
+        if dead:
+            return main_rc, True
+
+####### EXPOSED METHODS #######
+def load_handler(handler):
+    '''Resolve a handler from a callable, or a string naming a callable as
+       ``module:callable'' or ``module.callable'' '''
+    if callable(handler):
+        return handler
+    try:
+        if 0 <= handler.find(':'):
+            mod_name, attr = handler.split(':', 1)
+        else:
+            mod_name, attr = handler.rsplit('.', 1)
+    except (AttributeError, ValueError, ):
+        raise ValueError(u'handler must be callable or module:callable, not:'\
+                         u' {0}'.format(handler))
+    handler = getattr(importlib.import_module(mod_name), attr)
+    if not callable(handler):
+        raise TypeError(u'handler is not callable: {0}'.format(handler))
+    return handler
+
+def work(trg_queue, handler, processes=None, recycle=None, ignore_down=False,
+         no_open=False, host=False, hosts=None, no_done=False,
+         verbose=False):
+    '''Work a queue with a pool of pre-forked python workers.  The handler is
+       imported once before forking processes workers; each worker is
+       recycled after handling recycle items (None, forever).  Returns the
+       aggregate exit code of all items handled.'''
+    utility._VERBOSE = verbose
+    main_rc = 0
+    handler = load_handler(handler)
+    processes = 1 if processes is None else int(processes)
+    if 1 > processes:
+        raise ValueError(u'processes must be a positive integer, not:'\
+                         u' {0}'.format(processes))
+    try:
+        items = scan(trg_queue, ignore_down=ignore_down, host=host,
+                     hosts=hosts)
+    except (FSQScanError, FSQPathError, ), e:
+        barf(e.strerror)
+    except FSQCoerceError, e:
+        barf('cannot coerce queue; charset={0}'.format(_CHARSET))
+
+    # results are handed back from the pool's result thread
+    results = Queue.Queue()
+    # key -> ( item, result, ) for each item handed to the workers, which
+    #  the scanner holds (and holds locked) until it is done
+    working = {}
+    # key -> pid of the worker, for each item a worker has started
+    pids = {}
+    started, started_w = os.pipe()
+    fcntl.fcntl(started, fcntl.F_SETFL,
+                fcntl.fcntl(started, fcntl.F_GETFL)|os.O_NONBLOCK)
+    pool = Pool(processes, initializer=_init_worker,
+                initargs=( handler, working, started_w, ),
+                maxtasksperchild=recycle)
+    lost = False
+    try:
+        key = 0
+        while True:
+            try:
+                # never lock more items than we have workers
+                while len(working) >= processes:
+                    main_rc, died = _wait(results, pool, working, pids,
+                                          started, no_done, main_rc)
+                    lost = lost or died
+                item = items.next()
+                key += 1
+                chirp('working on {0} ...'.format(item.id.encode(_CHARSET)))
+                working[key] = ( item, pool.apply_async(_work_item, ( key,
+                                 trg_queue, item.id, item.host, no_open,
+                                 item.worker, ),
+                                 callback=_callback(results, key)), )
+            except FSQDownError:
+                # stop handing out work, but finish what we've started
+                shout('{0} is down'.format(trg_queue))
+                main_rc = exit_rc(main_rc, const('FSQ_FAIL_TMP'))
+                break
+            except FSQError, e:
+                shout(e.strerror.encode(_CHARSET))
+            except StopIteration:
+                break
+            finally:
+                try:
+                    del item
+                except NameError:
+                    pass
+        while working:
+            main_rc, died = _wait(results, pool, working, pids, started,
+                                  no_done, main_rc)
+            lost = lost or died
+    finally:
+        # the results of dead workers never come, and would be waited on
+        #  forever by join
+        if lost or working:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+        for item, result in working.itervalues():
+            item.close()
+        working.clear()
+        os.close(started)
+        os.close(started_w)
+
+    return main_rc
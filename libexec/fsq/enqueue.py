@@ -16,6 +16,7 @@ import StringIO
 _PROG = "fsq-enqueue"
 _VERBOSE = False
 _CHARSET = fsq.const('FSQ_CHARSET')
+_READ_SIZE = 65536
 
 
 def chirp(msg):
@@ -52,10 +53,28 @@ def usage(asked_for=0):
         shout('        [-f file|--file=file]', f)
         shout('        [-e | --empty]', f)
         shout('        [-t | --trigger]', f)
+        shout('        [-b | --batch] [-0 | --null]', f)
         shout('        queue [arg [...]]', f)
     sys.exit(exit)
 
 
+def records(f, delimiter):
+    '''Yield each delimited record read from f, without its delimiter'''
+    if '\n' == delimiter:
+        for line in iter(f.readline, ''):
+            yield line[:-1] if line.endswith('\n') else line
+        return
+    buf = ''
+    for chunk in iter(lambda: os.read(f.fileno(), _READ_SIZE), ''):
+        buf += chunk
+        recs = buf.split(delimiter)
+        buf = recs.pop()
+        for rec in recs:
+            yield rec
+    if buf:
+        yield buf
+
+
 # all fsq commands use a main function
 def main(argv):
     global _PROG, _VERBOSE
@@ -64,11 +83,13 @@ def main(argv):
     try:
         opts, args = getopt.getopt(
             argv[1:], 
-            'hvteu:g:m:f:', ( 
+            'hvteb0u:g:m:f:', ( 
                 'help', 
                 'verbose',
                 'trigger',
                 'empty',
+                'batch',
+                'null',
                 'file=',
                 'user=',
                 'group=',
@@ -78,7 +99,8 @@ def main(argv):
              e.opt))
     try:
         user = group = mode = item = None
-        empty = trigger = False
+        empty = trigger = batch = False
+        delimiter = '\n'
         for flag, opt in opts:
             if '-v' == flag or '--verbose' == flag:
                 _VERBOSE = True
@@ -98,6 +120,11 @@ def main(argv):
                 empty = True
             elif '-t' == flag or '--trigger' == flag:
                 trigger = True
+            elif '-b' == flag or '--batch' == flag:
+                batch = True
+            elif '-0' == flag or '--null' == flag:
+                batch = True
+                delimiter = '\0'
             elif '-h' == flag or '--help' == flag:
                 usage(1)
     except ( fsq.FSQEnvError, fsq.FSQCoerceError, ):
@@ -106,6 +133,18 @@ def main(argv):
     try:
         if len(args) == 0:
             usage(0)
+        elif batch:
+            # one work-item per record on stdin, all with the same args
+            queue = args[0]
+            fsq_args = args[1:]
+            item_ids = fsq.vsenqueue_many(queue, ( ( rec, fsq_args, ) for rec\
+                                          in records(sys.stdin, delimiter) ),
+                                          user=user, group=group, mode=mode)
+            if trigger is True:
+                fsq.trigger_pull(queue)
+            chirp('{0} queue: {1} new items queued using args: {2}'.format(
+                  queue, len(item_ids), fsq_args))
+            return
         elif (empty is False and item is None):
             shout("work-item content was not set with --empty or --file. "\
                   "waiting on stdin...")
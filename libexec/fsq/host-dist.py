@@ -39,7 +39,7 @@ def usage(asked_for=0):
     if asked_for:
         shout('{0} [-h|--help] [-v|--verbose] [-I|--link]'.format(
                                     os.path.basename(_PROG)), f)
-        shout('        [-g|--trigger]', f)
+        shout('        [-g|--trigger] [-j jobs|--jobs=int]', f)
         shout('        [-n|--no-open] [-i|--ignore-down]', f)
         shout('        [-l|--lock] [-L|--no-lock]', f)
         shout('        [-t ttl_seconds|--ttl=seconds]', f)
@@ -79,15 +79,16 @@ def main(argv):
     no_open = False
     ignore_down = False
     no_done = False
+    jobs = 1
 
     _PROG = argv[0]
     try:
-        opts, args = getopt.getopt(argv[1:], 'hvnilLDIgt:m:S:T:F:', ( 'help',
+        opts, args = getopt.getopt(argv[1:], 'hvnilLDIgt:m:S:T:F:j:', ( 'help',
                                    'no-open', 'ignore-down',
                                    'lock', 'no-lock', 'no-done',
                                    'link', 'trigger', 'ttl=', 'max-tries=',
                                    'success-code=', 'fail-tmp-code=',
-                                   'fail-perm-code=', 'verbose',  ))
+                                   'fail-perm-code=', 'verbose', 'jobs=', ))
         for flag, opt in opts:
             if flag in ( '-v', '--verbose', ):
                 _VERBOSE = True
@@ -105,6 +106,13 @@ def main(argv):
                 fsq.set_const('FSQ_LOCK', False)
             elif '-D' == flag or '--no-done' == flag:
                 no_done = True
+            elif '-j' == flag or '--jobs' == flag:
+                try:
+                    jobs = int(opt)
+                    if 1 > jobs:
+                        raise ValueError(opt)
+                except ValueError:
+                    barf('invalid jobs: {0}'.format(opt))
             elif '-t' == flag or '--ttl' == flag:
                 fsq.set_const('FSQ_TTL', opt)
             elif '-m' == flag or '--max-tries' == flag:
@@ -129,11 +137,13 @@ def main(argv):
     else:
         hosts = args[1:]
 
-    fsq.fork_exec_items(args[0], ignore_down=ignore_down, host=all_hosts,
-                        no_open=no_open, hosts=hosts if hosts else None,
-                        no_done=no_done, verbose=_VERBOSE, link=link)
+    rc = fsq.fork_exec_items(args[0], ignore_down=ignore_down,
+                             host=all_hosts, no_open=no_open,
+                             hosts=hosts if hosts else None, no_done=no_done,
+                             verbose=_VERBOSE, link=link, jobs=jobs)
     if trigger:
         fsq.host_trigger_pull(args[0])
+    return rc
 
 if __name__ == '__main__':
     main(sys.argv)
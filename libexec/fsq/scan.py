@@ -6,8 +6,6 @@
 # @author: Matthew Story <matt.story@axial.net>
 # @depends: fsq(1), fsq(7), python (>=2.7)
 #
-# TODO: Concurrency? -- not right now
-#
 # This software is for POSIX compliant systems only.
 import getopt
 import sys
@@ -43,6 +41,7 @@ def usage(asked_for=0):
         shout('        [-l|--lock] [-L|--no-lock]', f)
         shout('        [-t ttl_seconds|--ttl=seconds]', f)
         shout('        [-m max_tries|--max-tries=int]', f)
+        shout('        [-j jobs|--jobs=int] [-b batch|--batch=int]', f)
         shout('        [-a all_hosts |--all-hosts]', f)
         shout('        [-A host |--host=host]', f)
         shout('        [-S success_code|--success-code=int]', f)
@@ -62,15 +61,19 @@ def main(argv):
     no_done = False
     host = False
     hosts = []
+    jobs = 1
+    batch = None
 
     _PROG = argv[0]
     try:
-        opts, args = getopt.getopt(argv[1:], 'hveEnilLkDt:m:S:T:F:aA:', ( 'help',
+        opts, args = getopt.getopt(argv[1:], 'hveEnilLkDt:m:S:T:F:aA:j:b:', (
+                                   'help',
                                    'env', 'no-env', 'no-open', 'ignore-down',
                                    'lock', 'no-lock', 'empty-ok', 'no-done',
                                    'ttl=', 'max-tries=', 'success-code=',
                                    'fail-tmp-code=', 'fail-perm-code=',
-                                   'verbose', 'all-hosts', 'host=' ))
+                                   'verbose', 'all-hosts', 'host=',
+                                   'jobs=', 'batch=', ))
     except getopt.GetoptError, e:
         barf('invalid flag: -{0}{1}'.format('-' if 1 < len(e.opt) else '',
              e.opt))
@@ -99,6 +102,20 @@ def main(argv):
             elif '-A' == flag or '--hosts' == flag:
                 hosts.append(opt)
                 host = True
+            elif '-j' == flag or '--jobs' == flag:
+                try:
+                    jobs = int(opt)
+                    if 1 > jobs:
+                        raise ValueError(opt)
+                except ValueError:
+                    barf('invalid jobs: {0}'.format(opt))
+            elif '-b' == flag or '--batch' == flag:
+                try:
+                    batch = int(opt)
+                    if 1 > batch:
+                        raise ValueError(opt)
+                except ValueError:
+                    barf('invalid batch: {0}'.format(opt))
             elif '-t' == flag or '--ttl' == flag:
                 fsq.set_const('FSQ_TTL', opt)
             elif '-m' == flag or '--max-tries' == flag:
@@ -119,10 +136,12 @@ def main(argv):
     if num_required > len(args):
         usage()
     exec_args = tuple(args[1:])
-    fsq.fork_exec_items(args[0], ignore_down=ignore_down, host=host,
-                        no_open=no_open, hosts=hosts if hosts else None,
-                        no_done=no_done, set_env=set_env, exec_args=exec_args,
-                        verbose=_VERBOSE, empty_ok=empty_ok)
+    return fsq.fork_exec_items(args[0], ignore_down=ignore_down, host=host,
+                               no_open=no_open,
+                               hosts=hosts if hosts else None,
+                               no_done=no_done, set_env=set_env,
+                               exec_args=exec_args, verbose=_VERBOSE,
+                               empty_ok=empty_ok, jobs=jobs, batch=batch)
 
 if __name__ == '__main__':
     main(sys.argv)
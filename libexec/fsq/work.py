@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# fsq-work(1) -- a program for working a fsq queue with a pool of pre-forked
+#                python workers, calling a python handler for each item. See
+#                fsq.work for more information.
+#
+# @author: Matthew Story <matt.story@axial.net>
+# @depends: fsq(1), fsq(7), python (>=2.7)
+#
+# This software is for POSIX compliant systems only.
+import getopt
+import sys
+import fsq
+import os
+
+from fsq.work import load_handler
+
+_PROG = "fsq-work"
+_VERBOSE = False
+
+def shout(msg, f=sys.stderr):
+    '''Log to file (usually stderr), with progname: <log>'''
+    print >> f, "{0}: {1}".format(_PROG, msg)
+    f.flush()
+
+def barf(msg, exit=None, f=sys.stderr):
+    '''Exit with a log message (usually a fatal error)'''
+    exit = fsq.const('FSQ_FAIL_TMP') if exit is None else exit
+    shout(msg, f)
+    sys.exit(exit)
+
+def usage(asked_for=0):
+    '''Exit with a usage string, used for bad argument or with -h'''
+    exit =  fsq.const('FSQ_SUCCESS') if asked_for else\
+                fsq.const('FSQ_FAIL_PERM')
+    f = sys.stdout if asked_for else sys.stderr
+    shout('{0} [opts] queue module:handler'.format(
+          os.path.basename(_PROG)), f)
+    if asked_for:
+        shout('{0} [-h|--help] [-v|--verbose]'.format(
+              os.path.basename(_PROG)), f)
+        shout('        [-n|--no-open] [-i|--ignore-down] [-D|--no-done]', f)
+        shout('        [-p processes|--processes=int]', f)
+        shout('        [-r recycle_items|--recycle=int]', f)
+        shout('        [-t ttl_seconds|--ttl=seconds]', f)
+        shout('        [-m max_tries|--max-tries=int]', f)
+        shout('        [-a all_hosts |--all-hosts]', f)
+        shout('        [-A host |--host=host]', f)
+        shout('        [-S success_code|--success-code=int]', f)
+        shout('        [-T fail_tmp_code|--fail-tmp-code=int]', f)
+        shout('        [-F fail_perm_code|--fail-perm-code=int]', f)
+        shout('        queue module:handler', f)
+    sys.exit(exit)
+
+def _positive(flag, opt):
+    try:
+        opt = int(opt)
+        if 1 > opt:
+            raise ValueError(opt)
+    except ValueError:
+        barf('invalid argument for flag: {0}'.format(flag))
+    return opt
+
+# all fsq commands use a main function
+def main(argv):
+    global _PROG, _VERBOSE
+    # defaults
+    no_open = False
+    ignore_down = False
+    no_done = False
+    host = False
+    hosts = []
+    processes = 1
+    recycle = None
+
+    _PROG = argv[0]
+    try:
+        opts, args = getopt.getopt(argv[1:], 'hvniDp:r:t:m:S:T:F:aA:', (
+                                   'help', 'verbose', 'no-open',
+                                   'ignore-down', 'no-done', 'processes=',
+                                   'recycle=', 'ttl=', 'max-tries=',
+                                   'success-code=', 'fail-tmp-code=',
+                                   'fail-perm-code=', 'all-hosts', 'host=', ))
+    except getopt.GetoptError, e:
+        barf('invalid flag: -{0}{1}'.format('-' if 1 < len(e.opt) else '',
+             e.opt))
+    try:
+        for flag, opt in opts:
+            if '-v' == flag or '--verbose' == flag:
+                _VERBOSE = True
+            elif '-n' == flag or '--no-open' == flag:
+                no_open = True
+            elif '-i' == flag or '--ignore-down' == flag:
+                ignore_down = True
+            elif '-D' == flag or '--no-done' == flag:
+                no_done = True
+            elif '-p' == flag or '--processes' == flag:
+                processes = _positive(flag, opt)
+            elif '-r' == flag or '--recycle' == flag:
+                recycle = _positive(flag, opt)
+            elif '-a' == flag or '--all-hosts' == flag:
+                host = True
+            elif '-A' == flag or '--host' == flag:
+                hosts.append(opt)
+                host = True
+            elif '-t' == flag or '--ttl' == flag:
+                fsq.set_const('FSQ_TTL', opt)
+            elif '-m' == flag or '--max-tries' == flag:
+                fsq.set_const('FSQ_MAX_TRIES', opt)
+            elif '-S' == flag or '--success-code' == flag:
+                fsq.set_const('FSQ_SUCCESS', opt)
+            elif '-T' == flag or '--fail-tmp-code' == flag:
+                fsq.set_const('FSQ_FAIL_TMP', opt)
+            elif '-F' == flag or '--fail-perm-code' == flag:
+                fsq.set_const('FSQ_FAIL_PERM', opt)
+            elif '-h' == flag or '--help' == flag:
+                usage(1)
+    except ( fsq.FSQEnvError, fsq.FSQCoerceError, ):
+        barf('invalid argument for flag: {0}'.format(flag))
+
+    # validate args
+    if 2 != len(args):
+        usage()
+    # allow handlers relative to the working directory
+    if '' not in sys.path:
+        sys.path.insert(0, '')
+    try:
+        handler = load_handler(args[1])
+    except ( ImportError, AttributeError, ValueError, TypeError, ), e:
+        barf('cannot load handler: {0} ({1})'.format(args[1], e))
+    return fsq.work(args[0], handler, processes=processes, recycle=recycle,
+                    ignore_down=ignore_down, no_open=no_open, host=host,
+                    hosts=hosts if hosts else None, no_done=no_done,
+                    verbose=_VERBOSE)
+
+if __name__ == '__main__':
+    main(sys.argv)
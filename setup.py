@@ -12,6 +12,7 @@ setup(
                                     'man/man1/fsq-down.1',
                                     'man/man1/fsq-enqueue.1',
                                     'man/man1/fsq-scan.1',
+                                    'man/man1/fsq-scand.1',
                                     'man/man1/fsq-up.1',
                                     'man/man1/fsq-rm-host.1',
                                     'man/man1/fsq-add-host.1',
@@ -23,6 +24,7 @@ setup(
                                  'libexec/fsq/enqueue.py',
                                  'libexec/fsq/install.py',
                                  'libexec/fsq/scan.py',
+                                 'libexec/fsq/scand.py',
                                  'libexec/fsq/up.py',
                                  'libexec/fsq/add-host.py',
                                  'libexec/fsq/down-host.py',
@@ -31,6 +33,7 @@ setup(
                                  'libexec/fsq/rm-host.py',
                                  'libexec/fsq/up-host.py',
                                  'libexec/fsq/jsonrpcd.py',
+                                 'libexec/fsq/work.py',
                                  ]),
                ],
     url='https://github.com/axialmarket/fsq',